@@ -1,15 +1,53 @@
+import hashlib
+import logging
+import time
+import orjson
 from datetime import datetime, timedelta
-from typing import Optional
-from jose import JWTError, jwt
-from fastapi import Depends, HTTPException, status
+from typing import Optional, Tuple
+from fastapi import Depends, HTTPException, Query, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_db, get_async_db
 from app.models import User
 from app.schemas import TokenData
 from app.config import settings
+from app.cache import TTLCache, MISSING
+from app.metrics import phase
+from app.shared_state import shared_state
+from app.tokens import InvalidToken, create_backend
+
+logger = logging.getLogger(__name__)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login", auto_error=False)
+
+# Authenticated users keyed by token subject. Entries never outlive the token
+# they were loaded for and are dropped when the user row changes, in every
+# worker listening on a distributed shared state (listen_for_user_changes);
+# otherwise other processes see changes after at most AUTH_USER_CACHE_TTL_SECONDS.
+user_cache = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL_SECONDS
+)
+
+# When users were deleted, by id: tokens embedding a deleted user's id and
+# issued before then stop working. Not by username, which a new account can
+# take; ids a new account reuses get tokens issued after the deletion
+revoked_users = TTLCache(
+    maxsize=settings.AUTH_USER_CACHE_SIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
+
+jwt_backend = create_backend(settings.JWT_BACKEND, settings.SECRET_KEY, settings.ALGORITHM)
+
+# Verified claims keyed by a digest of the token, kept until the token expires,
+# so a session's repeat requests skip signature checks. Treat entries as read-only
+token_cache = TTLCache(
+    maxsize=settings.AUTH_TOKEN_CACHE_SIZE,
+    ttl=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60
+)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -18,28 +56,170 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    encoded_jwt = jwt_backend.encode(to_encode)
     return encoded_jwt
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    credentials_exception = HTTPException(
+def token_claims(user: User) -> dict:
+    """Claims to put in a user's access token"""
+    claims = {"sub": user.username}
+    if settings.AUTH_EMBED_USER_ID:
+        claims["uid"] = user.id
+        claims["iat"] = time.time()
+    return claims
+
+STREAM_TICKET_PURPOSE = "stream"
+
+def create_stream_ticket(user: User) -> str:
+    """A token that only opens /history/stream, valid for STREAM_TICKET_TTL_SECONDS.
+
+    EventSource cannot send headers, so the stream takes its credential in the
+    URL, where access logs record it; a logged ticket is soon worthless.
+    """
+    claims = {**token_claims(user), "purpose": STREAM_TICKET_PURPOSE}
+    return create_access_token(claims, timedelta(seconds=settings.STREAM_TICKET_TTL_SECONDS))
+
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def decode_claims(token: str) -> dict:
+    """A token's verified claims; raises InvalidToken"""
+    key = hashlib.sha256(token.encode("utf-8")).digest()
+    claims = token_cache.get(key)
+    if claims is MISSING:
+        claims = jwt_backend.decode(token)
+        exp = claims.get("exp")
+        token_cache.set(key, claims, ttl=None if exp is None else exp - time.time())
+    return claims
+
+def _decode_token(token: str, purpose: Optional[str] = None) -> Tuple[TokenData, dict]:
+    """Claims of a token issued for ``purpose`` (None: an access token)"""
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-        token_data = TokenData(username=username)
-    except JWTError:
-        raise credentials_exception
+        payload = decode_claims(token)
+    except InvalidToken:
+        raise _credentials_exception()
+    username: str = payload.get("sub")
+    if username is None or payload.get("purpose") != purpose:
+        raise _credentials_exception()
+    return TokenData(username=username), payload
+
+def _known_user(token_data: TokenData, payload: dict):
+    """The user for a decoded token if it can be resolved without a lookup, else MISSING"""
+    user_id = payload.get("uid")
+    if settings.AUTH_EMBED_USER_ID and user_id is not None:
+        revoked_at = revoked_users.get(user_id)
+        if revoked_at is not MISSING and payload.get("iat", 0) <= revoked_at:
+            raise _credentials_exception()
+        # The signed token already identifies the user; skip the lookup
+        return User(id=user_id, username=token_data.username)
+    return user_cache.get(token_data.username)
+
+def _remember_user(token_data: TokenData, payload: dict, user: User) -> None:
+    user_cache.set(token_data.username, user, ttl=payload.get("exp", 0) - time.time())
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    with phase("auth"):
+        token_data, payload = _decode_token(token)
+    return _load_user(token_data, payload, db)
+
+def _load_user(token_data: TokenData, payload: dict, db: Session) -> User:
+    user = _known_user(token_data, payload)
+    if user is not MISSING:
+        return user
     
     user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
+    # Detach so the request's commit doesn't expire the cached instance
+    db.expunge(user)
+    _remember_user(token_data, payload, user)
     return user
+
+async def get_stream_user(
+    ticket: Optional[str] = Query(None, description="Ticket from POST /history/stream/ticket, for clients that cannot send headers"),
+    bearer: Optional[str] = Depends(optional_oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> User:
+    """get_current_user that also takes a stream ticket as ``?ticket=``, since browsers' EventSource cannot set headers"""
+    if bearer:
+        return await get_current_user(bearer, db)
+    if not ticket:
+        raise _credentials_exception()
+    with phase("auth"):
+        token_data, payload = _decode_token(ticket, STREAM_TICKET_PURPOSE)
+    return _load_user(token_data, payload, db)
+
+async def get_current_user_async(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """get_current_user for routes on the async database stack"""
+    with phase("auth"):
+        token_data, payload = _decode_token(token)
+    user = _known_user(token_data, payload)
+    if user is not MISSING:
+        return user
+    
+    result = await db.execute(select(User).where(User.username == token_data.username))
+    user = result.scalars().first()
+    if user is None:
+        raise _credentials_exception()
+    db.expunge(user)
+    _remember_user(token_data, payload, user)
+    return user
+
+USER_CHANGES_CHANNEL = "calculator:users"
+
+def _forget_user(username: str) -> None:
+    user_cache.invalidate(username)
+
+def _revoke_user(username: str, user_id: int, revoked_at: float) -> None:
+    user_cache.invalidate(username)
+    if settings.AUTH_EMBED_USER_ID:
+        revoked_users.set(user_id, revoked_at)
+
+_USER_CHANGES = {b"forget": _forget_user, b"revoke": _revoke_user}
+
+def _broadcast_user_change(change: bytes, *args) -> None:
+    """Have other workers call the ``change`` handler with ``args``"""
+    if not shared_state.distributed:
+        return
+    try:
+        shared_state.publish(USER_CHANGES_CHANNEL, change + b"\n" + orjson.dumps(args))
+    except Exception:
+        # Other workers catch up within AUTH_USER_CACHE_TTL_SECONDS, except for revocations
+        logger.warning("Broadcasting a user change failed", exc_info=True)
+
+def _apply_user_change(message: bytes) -> None:
+    change, _, args = message.partition(b"\n")
+    handler = _USER_CHANGES.get(change)
+    if handler is not None:
+        handler(*orjson.loads(args))
+
+def listen_for_user_changes(state):
+    """Apply user changes made by other workers to this worker's caches; returns an unsubscribe function.
+
+    Revocations are only seen by workers running when the user is deleted.
+    """
+    return state.subscribe(USER_CHANGES_CHANNEL, _apply_user_change)
+
+@event.listens_for(User, "after_insert")
+@event.listens_for(User, "after_update")
+def _invalidate_cached_user(mapper, connection, target):
+    _forget_user(target.username)
+    _broadcast_user_change(b"forget", target.username)
+    for old_username in inspect(target).attrs.username.history.deleted:
+        _forget_user(old_username)
+        _broadcast_user_change(b"forget", old_username)
+
+@event.listens_for(User, "after_delete")
+def _revoke_cached_user(mapper, connection, target):
+    revoked_at = time.time()
+    _revoke_user(target.username, target.id, revoked_at)
+    _broadcast_user_change(b"revoke", target.username, target.id, revoked_at)
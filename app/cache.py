@@ -0,0 +1,153 @@
+"""In-process caches, and the calculation result cache with its optional shared tier."""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe bounded LRU cache whose entries expire.
+
+    Each entry gets the cache-wide ``ttl`` unless ``set`` is given a shorter
+    lifetime. ``maxsize`` of 0 disables the cache (every lookup misses).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = MISSING) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Store ``value``; ``ttl`` can only shorten the cache-wide lifetime"""
+        lifetime = self.ttl if ttl is None else min(ttl, self.ttl)
+        if self.maxsize <= 0 or lifetime <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + lifetime)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+        }
+
+
+class SharedStateBackend:
+    """String store on a SharedState (app.shared_state), so workers share results.
+
+    Entries expire after ``ttl`` seconds; with RedisState, size is bounded by
+    the server's own maxmemory eviction policy.
+    """
+
+    def __init__(self, state, ttl: float, prefix: str = "calc:"):
+        self.state = state
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        value = self.state.get(self.prefix + key)
+        return None if value is None else value.decode("ascii")
+
+    def set(self, key: str, value: str) -> None:
+        self.state.set(self.prefix + key, value.encode("ascii"), ttl=self.ttl)
+
+
+class ResultCache:
+    """Memoized calculation results: an in-process LRU in front of an optional shared store.
+
+    ``shared`` is anything with ``get(key) -> Optional[str]`` and
+    ``set(key, value)``, e.g. SharedStateBackend. Values are stored there as
+    ``float.hex()`` so they round-trip exactly. Errors from the shared store
+    count as misses; they never fail a calculation.
+    """
+
+    def __init__(self, local: TTLCache, shared=None):
+        self.local = local
+        self.shared = shared
+        self.shared_hits = 0
+        self.shared_errors = 0
+
+    def get_or_compute(self, key: str, compute: Callable[[], float]) -> float:
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+        if self.shared is not None:
+            try:
+                stored = self.shared.get(key)
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared result cache read failed", exc_info=True)
+                stored = None
+            if stored is not None:
+                self.shared_hits += 1
+                value = float.fromhex(stored)
+                self.local.set(key, value)
+                return value
+        
+        value = compute()
+        self.local.set(key, value)
+        if self.shared is not None:
+            try:
+                self.shared.set(key, float(value).hex())
+            except Exception:
+                self.shared_errors += 1
+                logger.warning("Shared result cache write failed", exc_info=True)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        local = self.local.stats()
+        lookups = local["hits"] + local["misses"]
+        hits = local["hits"] + self.shared_hits
+        return {
+            "local_hits": local["hits"],
+            "shared_hits": self.shared_hits,
+            "misses": local["misses"] - self.shared_hits,
+            "shared_errors": self.shared_errors,
+            "size": local["size"],
+            "maxsize": local["maxsize"],
+            "hit_rate": hits / lookups if lookups else 0.0,
+        }
+
+    def clear(self) -> None:
+        self.local.clear()
+        self.shared_hits = 0
+        self.shared_errors = 0
@@ -0,0 +1,135 @@
+"""Maintenance commands.
+
+Usage:
+    python -m app.cli stats-verify [--user-id ID]
+    python -m app.cli stats-rebuild [--user-id ID]
+    python -m app.cli usage-prune [--days N]
+    python -m app.cli usage-rebuild [--user-id ID]
+    python -m app.cli db-upgrade [--revision REV] [--sql]
+    python -m app.cli db-current
+"""
+import argparse
+import sys
+from datetime import datetime, timedelta
+from app.config import settings
+from app.database import SessionLocal, get_engine, init_db
+from app import migrate
+from app.services import UserStatsService, UsageService
+
+
+def stats_verify(args) -> int:
+    """Report drift between the statistics rollup and the calculations table"""
+    db = SessionLocal()
+    try:
+        drift = UserStatsService.verify(db, args.user_id)
+    finally:
+        db.close()
+
+    for line in drift:
+        print(line)
+    if drift:
+        print(f"{len(drift)} rollup discrepancies found; run stats-rebuild to fix")
+        return 1
+    print("Statistics rollup is consistent")
+    return 0
+
+
+def stats_rebuild(args) -> int:
+    """Recompute the statistics rollup from the calculations table"""
+    db = SessionLocal()
+    try:
+        rebuilt = UserStatsService.rebuild(db, args.user_id)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"Rebuilt statistics for {rebuilt} users")
+    return 0
+
+
+def usage_prune(args) -> int:
+    """Drop hourly usage older than the retention period (daily usage is kept)"""
+    cutoff = datetime.utcnow() - timedelta(days=args.days)
+    db = SessionLocal()
+    try:
+        pruned = UsageService.prune(db, cutoff)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"Pruned {pruned} hourly usage buckets before {cutoff:%Y-%m-%d %H:00}")
+    return 0
+
+
+def usage_rebuild(args) -> int:
+    """Recount the usage time series from the stored calculations"""
+    db = SessionLocal()
+    try:
+        buckets = UsageService.rebuild(db, args.user_id)
+        db.commit()
+    finally:
+        db.close()
+
+    print(f"Rebuilt {buckets} usage buckets")
+    return 0
+
+
+def db_upgrade(args) -> int:
+    """Apply schema migrations up to a revision, or print their SQL"""
+    if args.sql:
+        migrate.upgrade_sql(settings.DATABASE_URL, args.revision)
+        return 0
+    engine = get_engine()
+    migrate.upgrade(engine, args.revision)
+    print(f"Database is at revision {migrate.current_revision(engine)}")
+    return 0
+
+
+def db_current(args) -> int:
+    """Show the database's schema revision against the latest one"""
+    current = migrate.current_revision(get_engine())
+    print(f"Database is at revision {current or 'none'} (latest {migrate.HEAD_REVISION})")
+    return 0 if current == migrate.HEAD_REVISION else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Calculator maintenance commands")
+    parser.set_defaults(migrate_first=True)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    verify = commands.add_parser("stats-verify", help="check the statistics rollup for drift")
+    verify.add_argument("--user-id", type=int, default=None)
+    verify.set_defaults(handler=stats_verify)
+
+    rebuild = commands.add_parser("stats-rebuild", help="recompute the statistics rollup")
+    rebuild.add_argument("--user-id", type=int, default=None)
+    rebuild.set_defaults(handler=stats_rebuild)
+
+    prune = commands.add_parser("usage-prune", help="drop hourly usage past its retention period")
+    prune.add_argument("--days", type=int, default=settings.USAGE_HOURLY_RETENTION_DAYS)
+    prune.set_defaults(handler=usage_prune)
+
+    usage = commands.add_parser("usage-rebuild", help="recount usage from stored calculations")
+    usage.add_argument("--user-id", type=int, default=None)
+    usage.set_defaults(handler=usage_rebuild)
+
+    upgrade = commands.add_parser("db-upgrade", help="apply schema migrations")
+    upgrade.add_argument("--revision", default="head")
+    upgrade.add_argument("--sql", action="store_true", help="print the SQL instead of running it")
+    upgrade.set_defaults(handler=db_upgrade, migrate_first=False)
+
+    current = commands.add_parser("db-current", help="show the schema revision")
+    current.set_defaults(handler=db_current, migrate_first=False)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.migrate_first:
+        init_db()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
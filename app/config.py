@@ -7,6 +7,107 @@ class Settings(BaseSettings):
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
+    # Connection pool (ignored for in-memory SQLite)
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_PRE_PING: bool = True
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_TIMEOUT: int = 30
+    
+    # SQLite profile, applied to every new connection
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_SYNCHRONOUS: str = "NORMAL"
+    SQLITE_MMAP_SIZE: int = 268435456  # bytes
+    SQLITE_CACHE_SIZE: int = -65536  # negative = KiB
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Route calculation inserts through one group-committing writer thread
+    SQLITE_SINGLE_WRITER: bool = False
+    
+    # Write-behind: acknowledge creates before they are stored (off by default)
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_MAX_ROWS: int = 1000
+    WRITE_BEHIND_MAX_DELAY_MS: int = 50
+    WRITE_BEHIND_ID_BLOCK_SIZE: int = 1000
+    
+    # Async stack: aiosqlite / asyncpg, derived from DATABASE_URL unless set
+    ASYNC_DB_ENABLED: bool = False
+    ASYNC_DATABASE_URL: Optional[str] = None
+    
+    # bcrypt cost and the process pool it runs in
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 16
+    
+    # State shared by all workers (caches, pub/sub, counters): in process
+    # unless this points at a Redis-protocol server, e.g. redis://host:6379/0
+    SHARED_STATE_URL: Optional[str] = None
+    SHARED_STATE_TIMEOUT_MS: int = 100
+    
+    # JWT codec (hmac, pyjwt or jose; see app/tokens.py) and the number of
+    # tokens whose verified claims are cached until they expire
+    JWT_BACKEND: str = "hmac"
+    AUTH_TOKEN_CACHE_SIZE: int = 10000
+    
+    # Authenticated-user cache; AUTH_EMBED_USER_ID puts the user id in tokens
+    AUTH_USER_CACHE_SIZE: int = 10000
+    AUTH_USER_CACHE_TTL_SECONDS: int = 60
+    AUTH_EMBED_USER_ID: bool = False
+    # Lifetime of the tickets EventSource clients open /history/stream with
+    STREAM_TICKET_TTL_SECONDS: int = 60
+    
+    BATCH_MAX_ITEMS: int = 10000
+    # Memoize perform_calculation results: in-process LRU, plus a shared
+    # tier in the shared state when SHARED_STATE_URL is set.
+    # Off by default: a local hit (~4us) costs more than the arithmetic (<1us)
+    RESULT_CACHE_ENABLED: bool = False
+    RESULT_CACHE_SIZE: int = 10000
+    RESULT_CACHE_TTL_SECONDS: int = 3600
+    # Longest operand accepted by /calculations/vector (8 bytes per element)
+    VECTOR_MAX_LENGTH: int = 1000000
+    # Compiled formulas kept for POST /calculations/expression
+    EXPRESSION_CACHE_SIZE: int = 1024
+    # /history/stream: events buffered per stream before it is told to resync,
+    # and keep-alive interval; events reach other workers through shared state
+    EVENTS_QUEUE_SIZE: int = 100
+    EVENTS_KEEPALIVE_SECONDS: int = 15
+    # /history/statistics/timeseries: longest range in buckets, and how long
+    # hourly usage is kept before usage-prune drops it (daily is kept)
+    TIMESERIES_MAX_BUCKETS: int = 1000
+    USAGE_HOURLY_RETENTION_DAYS: int = 90
+    # Rows fetched per round trip (and sent per chunk) by /history/export
+    EXPORT_CHUNK_ROWS: int = 1000
+    # /calculations/import: rows evaluated and committed together, rejections listed
+    IMPORT_CHUNK_ROWS: int = 5000
+    IMPORT_MAX_ERRORS: int = 100
+    
+    # Admission control (app/ratelimit.py): 429 + Retry-After before any DB or
+    # bcrypt work. Token buckets (requests/s and burst) per client IP, per IP
+    # on /auth and per user; in-flight limits per route class and worker.
+    # 0 turns a check off. RATE_LIMIT_SHARED counts in SHARED_STATE_URL so
+    # limits hold across workers; RATE_LIMIT_TRUST_PROXY reads X-Forwarded-For
+    RATE_LIMIT_ENABLED: bool = False
+    RATE_LIMIT_IP_RATE: float = 50.0
+    RATE_LIMIT_IP_BURST: int = 100
+    RATE_LIMIT_AUTH_RATE: float = 1.0
+    RATE_LIMIT_AUTH_BURST: int = 10
+    RATE_LIMIT_USER_RATE: float = 20.0
+    RATE_LIMIT_USER_BURST: int = 40
+    RATE_LIMIT_MAX_CONCURRENT_AUTH: int = 16
+    RATE_LIMIT_MAX_CONCURRENT_WRITE: int = 64
+    RATE_LIMIT_MAX_CONCURRENT_READ: int = 128
+    RATE_LIMIT_MAX_KEYS: int = 100000
+    RATE_LIMIT_SHARED: bool = False
+    RATE_LIMIT_TRUST_PROXY: bool = False
+    
+    # Request metrics on /metrics and the slow-query log
+    METRICS_ENABLED: bool = False
+    METRICS_SLOW_QUERY_MS: int = 100
+    # Sampling profiler: requests sent with "X-Profile: 1", plus a random fraction
+    PROFILING_ENABLED: bool = False
+    PROFILE_SAMPLE_RATE: float = 0.0
+    PROFILE_INTERVAL_MS: int = 5
+    PROFILE_DIR: str = "profiles"
+    
     class Config:
         env_file = ".env"
 
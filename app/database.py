@@ -1,16 +1,128 @@
-from sqlalchemy import create_engine
+import threading
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from app.config import settings
 
-engine = create_engine(
-    settings.DATABASE_URL, 
-    connect_args={"check_same_thread": False} if "sqlite" in settings.DATABASE_URL else {}
-)
+# Drivers used by the async stack for each sync backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def async_database_url(url: str) -> str:
+    """Translate a sync database URL to its async-driver equivalent"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for {backend}")
+    return parsed.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+def engine_options(url: str) -> dict:
+    """Connection and pool arguments for an engine on ``url``"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        options = {"connect_args": {"check_same_thread": False}}
+        if parsed.database in (None, "", ":memory:"):
+            # In-memory databases live in a single connection; no pool sizing
+            return options
+        if parsed.get_driver_name() == "aiosqlite":
+            # aiosqlite defaults to NullPool, which reconnects on every checkout
+            options["poolclass"] = AsyncAdaptedQueuePool
+    else:
+        options = {}
+    options.update(
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        pool_pre_ping=settings.DB_POOL_PRE_PING,
+        pool_recycle=settings.DB_POOL_RECYCLE,
+        pool_timeout=settings.DB_POOL_TIMEOUT,
+    )
+    return options
+
+def apply_sqlite_profile(engine: Engine) -> None:
+    """Set the SQLITE_* pragmas on every connection ``engine`` opens.
+    
+    WAL lets readers run alongside the writer, synchronous=NORMAL drops the
+    per-commit fsync of the WAL, and busy_timeout makes writers wait for the
+    lock instead of failing with "database is locked".
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    
+    pragmas = [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}",
+        f"PRAGMA cache_size={int(settings.SQLITE_CACHE_SIZE)}",
+        f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}",
+    ]
+    
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Engines are created on first use rather than at import, so importing the app
+# (CLI, workers, tests) costs nothing until a session is actually needed
+_engine = None
+_async_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> Engine:
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(settings.DATABASE_URL, **engine_options(settings.DATABASE_URL))
+                apply_sqlite_profile(engine)
+                _engine = engine
+    return _engine
+
+class LazySessionmaker(sessionmaker):
+    """sessionmaker that binds to get_engine() when it makes its first session"""
+    
+    def __call__(self, **local_kw):
+        if self.kw.get("bind") is None:
+            self.configure(bind=get_engine())
+        return super().__call__(**local_kw)
+
+SessionLocal = LazySessionmaker(autocommit=False, autoflush=False)
+
+# Optional async stack (ASYNC_DB_ENABLED); objects stay usable after commit
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False)
+
+def get_async_engine():
+    """The async engine, created on first use; None unless ASYNC_DB_ENABLED"""
+    global _async_engine
+    if _async_engine is None and settings.ASYNC_DB_ENABLED:
+        with _engine_lock:
+            if _async_engine is None:
+                async_url = settings.ASYNC_DATABASE_URL or async_database_url(settings.DATABASE_URL)
+                engine = create_async_engine(async_url, **engine_options(async_url))
+                apply_sqlite_profile(engine.sync_engine)
+                AsyncSessionLocal.configure(bind=engine)
+                _async_engine = engine
+    return _async_engine
+
+def __getattr__(name):
+    # ``engine`` and ``async_engine`` as attributes, for code from before they were lazy
+    if name == "engine":
+        return get_engine()
+    if name == "async_engine":
+        return get_async_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 def get_db():
     db = SessionLocal()
     try:
@@ -18,6 +130,12 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    get_async_engine()
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+    """Migrate the schema to the latest revision (app.migrate); when it is there this is one query"""
+    from app import migrate
+    migrate.upgrade(get_engine())
@@ -0,0 +1,35 @@
+"""Conditional GETs for a user's history and statistics.
+
+Every write to a user's calculations bumps ``user_stats.version`` in the same
+transaction, so ``"<user id>.<version>"`` is a strong validator for anything
+derived from them. A poller that sends it back in If-None-Match gets a 304
+after one primary-key lookup, before any calculation query runs.
+"""
+from typing import Dict, Optional
+from fastapi import Response, status
+
+# Revalidate on every use, and never share between users
+CACHE_HEADERS = {"Cache-Control": "private, no-cache", "Vary": "Authorization"}
+
+
+def user_etag(user_id: int, version: Optional[int]) -> Optional[str]:
+    """ETag for a user's data version; None when there is no version to go by"""
+    return None if version is None else f'"{user_id}.{version}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header lists ``etag`` (or is ``*``)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match uses the weak comparison, so W/ prefixes are ignored
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+def etag_headers(etag: str) -> Dict[str, str]:
+    return {"ETag": etag, **CACHE_HEADERS}
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
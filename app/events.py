@@ -0,0 +1,167 @@
+"""Live calculation events for GET /history/stream.
+
+Write routes publish after they commit; every open stream holds a bounded
+asyncio queue for its user and receives ready-made Server-Sent Events frames.
+``publish`` is safe from any thread (sync routes run in the threadpool) and
+returns at once when nobody is listening. A stream that falls more than
+EVENTS_QUEUE_SIZE events behind loses its backlog and gets a ``resync`` event
+telling the client to refetch.
+
+Events reach only the streams of the process that published them, unless the
+hub is started on a distributed SharedState (SHARED_STATE_URL): then every
+process publishes to its channel and delivers what comes back from it, so
+streams see writes made by any worker.
+"""
+import asyncio
+import logging
+import threading
+from typing import Callable, Dict, Iterable, Sequence, Set
+import orjson
+from app.config import settings
+from app.serialization import CALCULATION_FIELDS
+
+logger = logging.getLogger(__name__)
+
+
+def sse_frame(event: str, data: Dict) -> bytes:
+    return b"event: " + event.encode("ascii") + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+RESYNC_FRAME = sse_frame("resync", {})
+READY_FRAME = sse_frame("ready", {})
+
+# Larger batches are announced with a resync instead of one huge event
+MAX_EVENT_CALCULATIONS = 100
+
+
+class Subscription:
+    """One open stream: a queue of frames filled on its event loop"""
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[bytes]" = asyncio.Queue(maxsize)
+        self.overflows = 0
+
+    async def get(self) -> bytes:
+        return await self.queue.get()
+
+    def _put(self, frame: bytes) -> None:
+        try:
+            self.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            # The client fell behind: drop its backlog and have it refetch
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC_FRAME)
+            self.overflows += 1
+
+
+class EventHub:
+    """Per-user pub/sub between write routes and open streams.
+
+    ``start(state)`` routes events through a SharedState channel; messages
+    there are ``b"<user id>\\n<frame>"``.
+    """
+
+    CHANNEL = "calculator:events"
+
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self.state = None
+        self._unsubscribe = None
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def start(self, state) -> None:
+        self._unsubscribe = state.subscribe(self.CHANNEL, self._deliver_message)
+        self.state = state
+
+    def stop(self) -> None:
+        if self.state is not None:
+            self.state = None
+            self._unsubscribe()
+
+    def subscribe(self, user_id: int) -> Subscription:
+        """Start receiving a user's events; call from the stream's event loop"""
+        subscription = Subscription(user_id, asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscriptions = self._subscribers.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscribers[subscription.user_id]
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscribers.values())
+
+    def publish(self, user_id: int, event: str, data: Callable[[], Dict]) -> None:
+        """Send an event to a user's streams; ``data`` is only built if someone may be listening"""
+        state = self.state
+        if state is None and user_id not in self._subscribers:
+            return
+        frame = sse_frame(event, data())
+        if state is None:
+            self.deliver(user_id, frame)
+            return
+        try:
+            state.publish(self.CHANNEL, str(user_id).encode("ascii") + b"\n" + frame)
+        except Exception:
+            # Local streams still get the event; other workers' streams miss it
+            logger.warning("Publishing events to shared state failed", exc_info=True)
+            self.deliver(user_id, frame)
+
+    def deliver(self, user_id: int, frame: bytes) -> None:
+        with self._lock:
+            subscriptions = list(self._subscribers.get(user_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._put, frame)
+            except RuntimeError:
+                # Its event loop is gone
+                self.unsubscribe(subscription)
+
+    def _deliver_message(self, message: bytes) -> None:
+        user_id, _, frame = message.partition(b"\n")
+        try:
+            self.deliver(int(user_id), frame)
+        except ValueError:
+            logger.warning("Ignoring malformed event message")
+
+
+def _calculation_dict(calc) -> Dict:
+    return {field: getattr(calc, field) for field in CALCULATION_FIELDS}
+
+
+def publish_created(user_id: int, calculations: Sequence) -> None:
+    """Calculations (or rows with the same attributes) stored for a user"""
+    if not calculations:
+        return
+    if len(calculations) > MAX_EVENT_CALCULATIONS:
+        publish_resync(user_id)
+        return
+    event_hub.publish(user_id, "created", lambda: {
+        "calculations": [_calculation_dict(calc) for calc in calculations]
+    })
+
+
+def publish_deleted(user_id: int, calculation_ids: Iterable[int]) -> None:
+    event_hub.publish(user_id, "deleted", lambda: {"ids": list(calculation_ids)})
+
+
+def publish_cleared(user_id: int) -> None:
+    event_hub.publish(user_id, "cleared", dict)
+
+
+def publish_resync(user_id: int) -> None:
+    """Too many changes to send one by one (e.g. an import); clients refetch"""
+    event_hub.publish(user_id, "resync", dict)
+
+
+event_hub = EventHub(queue_size=settings.EVENTS_QUEUE_SIZE)
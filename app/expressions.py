@@ -0,0 +1,150 @@
+"""Safe arithmetic expressions such as ``(a + b) * c / d`` or ``sqrt(x^2 + y^2)``.
+
+Expressions are parsed with Python's ``ast`` module and rejected unless every
+node is arithmetic: numbers, variables, ``+ - * / % **`` (``^`` also means
+power), unary signs and calls to FUNCTIONS. The checked tree is compiled to
+bytecode once and evaluated with no builtins, so it cannot reach anything but
+the whitelisted functions. Compiled expressions are kept in an LRU keyed by
+the expression text, so a formula reused with new variable values skips
+parsing entirely.
+"""
+import ast
+import math
+import operator
+import re
+from functools import lru_cache
+from typing import FrozenSet, Mapping
+from app.config import settings
+
+# name -> (function, number of arguments; None for any number >= 1)
+FUNCTIONS = {
+    "sqrt": (math.sqrt, 1),
+    "abs": (abs, 1),
+    "pow": (operator.pow, 2),
+    "mod": (operator.mod, 2),
+    "exp": (math.exp, 1),
+    "log": (math.log, 1),
+    # As floats, so results can't grow into huge integers
+    "floor": (lambda x: float(math.floor(x)), 1),
+    "ceil": (lambda x: float(math.ceil(x)), 1),
+    "min": (min, None),
+    "max": (max, None),
+}
+
+CONSTANTS = {"pi": math.pi, "e": math.e}
+
+MAX_EXPRESSION_LENGTH = 500
+
+# Only characters that can appear in an allowed expression; rules out strings,
+# comments and anything else Python would parse but we never evaluate
+_ALLOWED_CHARACTERS = re.compile(r"^[\w\s.+\-*/%^(),]*$")
+
+_BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow)
+_UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+
+class _Checker(ast.NodeTransformer):
+    """Rejects anything but arithmetic and turns numbers into floats"""
+
+    def __init__(self):
+        self.variables = set()
+
+    def generic_visit(self, node):
+        raise ValueError(f"Unsupported syntax: {type(node).__name__}")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BINARY_OPERATORS):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, _UNARY_OPERATORS):
+            raise ValueError(f"Unsupported operator: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or not isinstance(node.value, (int, float)):
+            raise ValueError(f"Unsupported constant: {node.value!r}")
+        # Float arithmetic overflows instead of building huge integers (9**9**9)
+        return ast.copy_location(ast.Constant(float(node.value)), node)
+
+    def visit_Name(self, node):
+        if node.id in FUNCTIONS:
+            raise ValueError(f"{node.id} is a function")
+        if node.id.startswith("__"):
+            raise ValueError(f"Invalid variable name: {node.id}")
+        if node.id not in CONSTANTS:
+            self.variables.add(node.id)
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ValueError("Unknown function")
+        if node.keywords:
+            raise ValueError(f"{node.func.id} takes no keyword arguments")
+        _, arity = FUNCTIONS[node.func.id]
+        if (arity is None and not node.args) or (arity is not None and len(node.args) != arity):
+            raise ValueError(f"Wrong number of arguments to {node.func.id}")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+_GLOBALS = {"__builtins__": {}, **CONSTANTS, **{name: fn for name, (fn, _) in FUNCTIONS.items()}}
+
+
+class CompiledExpression:
+    """A checked expression and its bytecode"""
+
+    __slots__ = ("text", "variables", "_code")
+
+    def __init__(self, text: str, variables: FrozenSet[str], code):
+        self.text = text
+        self.variables = variables
+        self._code = code
+
+    def evaluate(self, variables: Mapping[str, float]) -> float:
+        missing = self.variables.difference(variables)
+        if missing:
+            raise ValueError(f"Missing value for variable(s): {', '.join(sorted(missing))}")
+        try:
+            result = eval(self._code, _GLOBALS, {name: float(variables[name]) for name in self.variables})
+        except ZeroDivisionError:
+            raise ValueError("Cannot divide by zero")
+        except OverflowError:
+            raise ValueError("Result is not a finite number")
+        except (ValueError, TypeError):
+            raise ValueError("Math domain error")
+        if isinstance(result, complex):
+            # e.g. a fractional power of a negative number
+            raise ValueError("Math domain error")
+        if not math.isfinite(result):
+            raise ValueError("Result is not a finite number")
+        return float(result)
+
+
+@lru_cache(maxsize=settings.EXPRESSION_CACHE_SIZE)
+def compile_expression(text: str) -> CompiledExpression:
+    """Parse, check and compile ``text``; raises ValueError if it is not a valid expression"""
+    if len(text) > MAX_EXPRESSION_LENGTH:
+        raise ValueError(f"Expression is longer than {MAX_EXPRESSION_LENGTH} characters")
+    if not text.strip() or not _ALLOWED_CHARACTERS.match(text):
+        raise ValueError("Invalid expression")
+    try:
+        # Textual, so ^ gets the precedence of ** rather than of XOR
+        tree = ast.parse(text.strip().replace("^", "**"), mode="eval")
+    except (SyntaxError, RecursionError, MemoryError):
+        raise ValueError("Invalid expression")
+    checker = _Checker()
+    tree = ast.fix_missing_locations(checker.visit(tree))
+    return CompiledExpression(text, frozenset(checker.variables), compile(tree, "<expression>", "eval"))
+
+
+def evaluate_expression(text: str, variables: Mapping[str, float]) -> float:
+    return compile_expression(text).evaluate(variables)
@@ -0,0 +1,175 @@
+"""Incremental parsing of calculation uploads (CSV or NDJSON).
+
+The request body is read chunk by chunk and split into lines as it arrives;
+parsed records are handed on IMPORT_CHUNK_ROWS at a time, so memory depends
+on the chunk size rather than on the size of the upload.
+
+Each record has ``operation``, ``operand1`` and ``operand2``, and optionally
+``result`` (checked against the recomputed value) and ``created_at``. Other
+fields are ignored, so a /history/export file can be imported as it is. CSV
+needs a header line and one record per line.
+"""
+import codecs
+import csv
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import orjson
+
+IMPORT_MEDIA_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+
+REQUIRED_FIELDS = ("operation", "operand1", "operand2")
+
+# Longest line accepted; guards the line buffer against a body without newlines
+MAX_LINE_CHARS = 65536
+
+
+class ImportFormatError(ValueError):
+    """The upload as a whole cannot be parsed"""
+
+
+class ImportSummary:
+    """Counts of accepted and rejected rows, plus the first ``max_errors`` rejections"""
+
+    def __init__(self, max_errors: int):
+        self.max_errors = max_errors
+        self.total = 0
+        self.accepted = 0
+        self.rejected = 0
+        self.errors: List[Dict] = []
+
+    def reject(self, line: int, detail: str) -> None:
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({"line": line, "detail": detail})
+
+    def as_dict(self) -> Dict:
+        return {
+            "total": self.total,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            # Parse errors are found before evaluation errors of earlier lines
+            "errors": sorted(self.errors, key=lambda error: error["line"]),
+            "errors_truncated": self.rejected > len(self.errors),
+        }
+
+
+def import_format(content_type: Optional[str]) -> Optional[str]:
+    """"csv" or "ndjson" for a Content-Type header, None if unsupported"""
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return IMPORT_MEDIA_TYPES.get(media_type)
+
+
+async def read_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """(line number, text) for each line of a UTF-8 byte stream"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    number = 0
+    try:
+        async for chunk in chunks:
+            pending += decoder.decode(chunk)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                number += 1
+                yield number, line.rstrip("\r")
+            if len(pending) > MAX_LINE_CHARS:
+                raise ImportFormatError(f"Line {number + 1} is longer than {MAX_LINE_CHARS} characters")
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError:
+        raise ImportFormatError(f"Line {number + 1} is not valid UTF-8")
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+def _number(value, field: str) -> float:
+    if isinstance(value, bool) or value is None or value == "":
+        raise ValueError(f"{field} must be a number")
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{field} must be a number")
+
+
+def _timestamp(value) -> Optional[datetime]:
+    """Naive UTC datetime from an ISO 8601 string (stored timestamps are naive UTC)"""
+    if value is None or value == "":
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        raise ValueError("created_at must be an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _record(fields: Dict) -> Dict:
+    """Validate one upload row, raising ValueError with the reason"""
+    operation = fields.get("operation")
+    if not isinstance(operation, str) or not operation:
+        raise ValueError("operation is required")
+    result = fields.get("result")
+    return {
+        "operation": operation,
+        "operand1": _number(fields.get("operand1"), "operand1"),
+        "operand2": _number(fields.get("operand2"), "operand2"),
+        "result": None if result is None or result == "" else _number(result, "result"),
+        "created_at": _timestamp(fields.get("created_at")),
+    }
+
+
+def _ndjson_fields(line: str) -> Dict:
+    try:
+        fields = orjson.loads(line)
+    except orjson.JSONDecodeError:
+        raise ValueError("Invalid JSON")
+    if not isinstance(fields, dict):
+        raise ValueError("Expected a JSON object")
+    return fields
+
+
+async def read_records(
+    chunks: AsyncIterator[bytes],
+    format: str,
+    chunk_rows: int,
+    summary: ImportSummary
+) -> AsyncIterator[List[Tuple[int, Dict]]]:
+    """Lists of up to ``chunk_rows`` (line number, record) pairs.
+
+    Rows that fail to parse are rejected on ``summary`` and left out.
+    """
+    header = None
+    batch: List[Tuple[int, Dict]] = []
+    async for number, line in read_lines(chunks):
+        if not line.strip():
+            continue
+        if format == "csv":
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                missing = [name for name in REQUIRED_FIELDS if name not in header]
+                if missing:
+                    raise ImportFormatError(f"CSV header is missing {', '.join(missing)}")
+                continue
+        summary.total += 1
+        try:
+            if format == "csv":
+                if len(values) != len(header):
+                    raise ValueError(f"Expected {len(header)} fields, got {len(values)}")
+                fields = dict(zip(header, values))
+            else:
+                fields = _ndjson_fields(line)
+            batch.append((number, _record(fields)))
+        except ValueError as e:
+            summary.reject(number, str(e))
+            continue
+        if len(batch) >= chunk_rows:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
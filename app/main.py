@@ -1,39 +1,168 @@
-from fastapi import FastAPI, Request
+"""Application factory.
+
+``create_app()`` builds the FastAPI app; ``app`` is built from it on first
+access, so ``uvicorn app.main:app`` and ``uvicorn --factory app.main:create_app``
+both work. Startup stays short by deferring what a request may never need:
+the database engines are created on first use, Jinja2 loads with the first
+page view and the async routers are only imported when ASYNC_DB_ENABLED.
+tests/unit/test_startup.py keeps it that way.
+"""
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from fastapi import APIRouter, FastAPI, Request
 from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from app.database import init_db
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from app.config import settings
+from app.database import init_db, get_engine, get_async_engine
+from app import metrics
 from app.routers import auth, calculations, history
+from app.writer import single_writer, write_behind
+from app.passwords import hasher
+from app.cache import ResultCache, SharedStateBackend, TTLCache
+from app.services import CalculationService
+from app.events import event_hub
+from app.auth import listen_for_user_changes, token_cache, user_cache
+from app.shared_state import shared_state
+from app.ratelimit import RateLimitMiddleware
+
+def without_overridden_routes(router: APIRouter, overrides: list) -> APIRouter:
+    """Copy of ``router`` minus the path/method pairs already served by ``overrides``"""
+    taken = {
+        (route.path, method)
+        for override in overrides
+        for route in override.routes
+        for method in route.methods
+    }
+    filtered = APIRouter()
+    filtered.routes.extend(
+        route for route in router.routes
+        if not any((route.path, method) in taken for method in route.methods)
+    )
+    return filtered
 
-# Initialize FastAPI app
-app = FastAPI(
-    title="Calculator API",
-    description="A calculator API with history and statistics tracking",
-    version="1.0.0"
-)
+def result_cache_samples():
+    cache = CalculationService.result_cache
+    if cache is None:
+        return
+    stats = cache.stats()
+    yield "calculation_cache_lookups_total", "counter", (("result", "local_hit"),), stats["local_hits"]
+    yield "calculation_cache_lookups_total", "counter", (("result", "shared_hit"),), stats["shared_hits"]
+    yield "calculation_cache_lookups_total", "counter", (("result", "miss"),), stats["misses"]
+    yield "calculation_cache_shared_errors_total", "counter", (), stats["shared_errors"]
+    yield "calculation_cache_entries", "gauge", (), stats["size"]
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
+def auth_cache_samples():
+    for name, cache in (("user", user_cache), ("token", token_cache)):
+        stats = cache.stats()
+        yield "auth_cache_lookups_total", "counter", (("cache", name), ("result", "hit")), stats["hits"]
+        yield "auth_cache_lookups_total", "counter", (("cache", name), ("result", "miss")), stats["misses"]
+        yield "auth_cache_entries", "gauge", (("cache", name),), stats["size"]
 
-# Setup templates
-templates = Jinja2Templates(directory="app/templates")
+def event_samples():
+    yield "history_stream_subscribers", "gauge", (), event_hub.subscriber_count()
 
-# Include routers
-app.include_router(auth.router)
-app.include_router(calculations.router)
-app.include_router(history.router)
+metrics.registry.describe("calculation_cache_lookups_total", "perform_calculation result cache lookups by outcome.")
+metrics.registry.describe("auth_cache_lookups_total", "Authenticated-user (user) and verified-token (token) cache lookups by outcome.")
+metrics.registry.describe("history_stream_subscribers", "Open /history/stream connections.")
+metrics.registry.register_collector(result_cache_samples)
+metrics.registry.register_collector(auth_cache_samples)
+metrics.registry.register_collector(event_samples)
 
-# Initialize database on startup
-@app.on_event("startup")
 def startup_event():
+    # Migrates the schema only if it is behind
     init_db()
+    if settings.RESULT_CACHE_ENABLED:
+        shared = None
+        if shared_state.distributed:
+            shared = SharedStateBackend(shared_state, ttl=settings.RESULT_CACHE_TTL_SECONDS)
+        CalculationService.result_cache = ResultCache(
+            TTLCache(maxsize=settings.RESULT_CACHE_SIZE, ttl=settings.RESULT_CACHE_TTL_SECONDS),
+            shared
+        )
+    if shared_state.distributed:
+        # Other workers' events and user changes reach this one
+        event_hub.start(shared_state)
+        listen_for_user_changes(shared_state)
+    if settings.WRITE_BEHIND_ENABLED:
+        write_behind.start()
+    if settings.SQLITE_SINGLE_WRITER:
+        single_writer.start()
+
+def shutdown_event():
+    # Flush buffered writes before anything they depend on goes away
+    write_behind.stop()
+    single_writer.stop()
+    event_hub.stop()
+    shared_state.close()
+    hasher.shutdown()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    startup_event()
+    try:
+        yield
+    finally:
+        shutdown_event()
+
+@lru_cache(maxsize=None)
+def get_templates():
+    # Jinja2 loads with the first page view, not at startup
+    from fastapi.templating import Jinja2Templates
+    return Jinja2Templates(directory="app/templates")
 
 # Root endpoint - serve HTML page
-@app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return get_templates().TemplateResponse("index.html", {"request": request})
 
 # Health check
-@app.get("/health")
 async def health_check():
     return {"status": "healthy"}
+
+def prometheus_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+def create_app() -> FastAPI:
+    app = FastAPI(
+        title="Calculator API",
+        description="A calculator API with history and statistics tracking",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    app.router.route_class = metrics.TimedRoute
+
+    if settings.RATE_LIMIT_ENABLED:
+        # Added first so the metrics middleware wraps it and times rejections too
+        app.add_middleware(RateLimitMiddleware)
+
+    if settings.METRICS_ENABLED:
+        app.add_middleware(metrics.MetricsMiddleware)
+        metrics.instrument_engine(get_engine())
+        if settings.ASYNC_DB_ENABLED:
+            metrics.instrument_engine(get_async_engine().sync_engine)
+
+    # Mount static files
+    app.mount("/static", StaticFiles(directory="app/static"), name="static")
+
+    # Include routers
+    routers = [auth.router, calculations.router, history.router]
+    if settings.ASYNC_DB_ENABLED:
+        # Async versions of the core routes replace their sync twins; any other
+        # endpoints keep running on the sync stack
+        from app.routers import async_auth, async_calculations, async_history
+        async_routers = [async_auth.router, async_calculations.router, async_history.router]
+        routers = async_routers + [without_overridden_routes(r, async_routers) for r in routers]
+    for router in routers:
+        app.include_router(router)
+
+    app.get("/", response_class=HTMLResponse)(root)
+    app.get("/health")(health_check)
+    if settings.METRICS_ENABLED:
+        app.get("/metrics", include_in_schema=False)(prometheus_metrics)
+    return app
+
+def __getattr__(name):
+    # Build ``app`` on first access and keep it as a plain module attribute
+    if name == "app":
+        app = globals()["app"] = create_app()
+        return app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
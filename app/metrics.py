@@ -0,0 +1,414 @@
+"""Request timing metrics, slow-query log and sampling profiler.
+
+With METRICS_ENABLED each request records its total time plus a breakdown
+into phases: ``auth`` (token decode), ``db`` (time inside the database
+driver), ``service`` (the endpoint body minus its queries) and ``serialize``
+(response validation and encoding). They are kept as histograms and rendered
+in the Prometheus text format on ``/metrics``.
+
+The timings of the current request live in a context variable. FastAPI copies
+it into the threads that run sync endpoints and SQLAlchemy into its async
+greenlets, so nothing has to be passed through the call chain, and code
+outside a request (background writers, the CLI) records nothing per request.
+"""
+import functools
+import inspect
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger("app.metrics.slow_query")
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds in seconds; finer than Prometheus' defaults to resolve sub-ms phases
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Bucketed observations for one label set"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        if index < len(self.counts):
+            self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        """(le, count) pairs as exposed to Prometheus, ending with +Inf"""
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield repr(float(bound)), total
+        yield "+Inf", self.count
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by metric name and label set"""
+
+    def __init__(self):
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], Iterable[Tuple[str, str, Labels, float]]]] = []
+        self._lock = threading.Lock()
+
+    def describe(self, name: str, help_text: str) -> None:
+        self._help[name] = help_text
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(labels)
+            if histogram is None:
+                histogram = series[labels] = Histogram()
+            histogram.observe(value)
+
+    def register_collector(self, collect: Callable[[], Iterable[Tuple[str, str, Labels, float]]]) -> None:
+        """Add values read at render time; ``collect`` yields (name, type, labels, value)"""
+        self._collectors.append(collect)
+
+    def inc(self, name: str, labels: Labels = (), amount: float = 1) -> None:
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + amount
+
+    def histogram(self, name: str, labels: Labels) -> Optional[Histogram]:
+        return self._histograms.get(name, {}).get(labels)
+
+    def counter(self, name: str, labels: Labels = ()) -> float:
+        return self._counters.get(name, {}).get(labels, 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                self._header(lines, name, "counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                self._header(lines, name, "histogram")
+                for labels, histogram in series.items():
+                    for le, count in histogram.cumulative():
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        seen = set()
+        for collect in self._collectors:
+            for name, kind, labels, value in collect():
+                if name not in seen:
+                    seen.add(name)
+                    self._header(lines, name, kind)
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines, name: str, kind: str) -> None:
+        if name in self._help:
+            lines.append(f"# HELP {name} {self._help[name]}")
+        lines.append(f"# TYPE {name} {kind}")
+
+
+registry = MetricsRegistry()
+registry.describe("http_request_duration_seconds", "Time to serve a request, by route and status.")
+registry.describe("http_request_phase_seconds", "Time spent per request in each phase: auth, db, service, serialize.")
+registry.describe("db_query_duration_seconds", "Time spent executing each SQL statement.")
+registry.describe("db_slow_queries_total", "Statements slower than METRICS_SLOW_QUERY_MS.")
+
+
+class RequestTimings:
+    """Phase timings collected while serving one request"""
+
+    __slots__ = ("route", "phases", "db", "queries", "endpoint_done", "threads")
+
+    def __init__(self):
+        self.route: Optional[str] = None
+        self.phases: Dict[str, float] = {}
+        self.db = 0.0
+        self.queries = 0
+        self.endpoint_done: Optional[float] = None
+        # Threads that ran part of the request, for the profiler
+        self.threads = {threading.get_ident()}
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """Attribute the time spent in the block to ``name`` for the current request"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+
+
+def _timed_endpoint(call):
+    """Wrap an endpoint so its body (minus queries) counts as ``service`` time"""
+
+    def finish(timings: RequestTimings, start: float, db_before: float) -> None:
+        now = time.perf_counter()
+        timings.add("service", now - start - (timings.db - db_before))
+        timings.endpoint_done = now
+
+    if inspect.iscoroutinefunction(call):
+        @functools.wraps(call)
+        async def timed(*args, **kwargs):
+            timings = _current.get()
+            if timings is None:
+                return await call(*args, **kwargs)
+            start, db_before = time.perf_counter(), timings.db
+            try:
+                return await call(*args, **kwargs)
+            finally:
+                finish(timings, start, db_before)
+        return timed
+
+    @functools.wraps(call)
+    def timed(*args, **kwargs):
+        timings = _current.get()
+        if timings is None:
+            return call(*args, **kwargs)
+        # Sync endpoints run in a worker thread; let the profiler see it
+        timings.threads.add(threading.get_ident())
+        start, db_before = time.perf_counter(), timings.db
+        try:
+            return call(*args, **kwargs)
+        finally:
+            finish(timings, start, db_before)
+    return timed
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that reports its path template and times the endpoint and serialization.
+
+    Costs one context-variable lookup per request while metrics are off.
+    """
+
+    def get_route_handler(self):
+        self.dependant.call = _timed_endpoint(self.dependant.call)
+        handler = super().get_route_handler()
+        route = self.path_format
+
+        async def timed_handler(request):
+            timings = _current.get()
+            if timings is None:
+                return await handler(request)
+            timings.route = route
+            response = await handler(request)
+            if timings.endpoint_done is not None:
+                timings.add("serialize", time.perf_counter() - timings.endpoint_done)
+            return response
+
+        return timed_handler
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_metrics_start", None)
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    registry.observe("db_query_duration_seconds", (), elapsed)
+    timings = _current.get()
+    if timings is not None:
+        timings.db += elapsed
+        timings.queries += 1
+    if elapsed * 1000 >= settings.METRICS_SLOW_QUERY_MS:
+        registry.inc("db_slow_queries_total")
+        slow_query_logger.warning(
+            "Slow query (%.1fms, route %s): %s",
+            elapsed * 1000,
+            timings.route if timings is not None else "-",
+            " ".join(statement.split())
+        )
+
+
+def instrument_engine(engine: Engine) -> None:
+    """Time every statement run on ``engine`` (pass ``async_engine.sync_engine`` for async)"""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _fold(frame) -> str:
+    """A stack as one line of folded ("collapsed") frames, outermost first"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads serving one request.
+
+    A background thread reads ``sys._current_frames()`` every ``interval``
+    seconds. Stacks are written in the folded format ("a;b;c count") read by
+    flamegraph.pl, speedscope and inferno. The event-loop thread is shared,
+    so its samples can include other requests' work.
+    """
+
+    def __init__(self, timings: RequestTimings, interval: float):
+        self.timings = timings
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for ident in list(self.timings.threads):
+                frame = frames.get(ident)
+                if frame is not None:
+                    self.stacks[_fold(frame)] += 1
+
+    def write(self, path: str) -> None:
+        with open(path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def _should_profile(scope) -> bool:
+    if not settings.PROFILING_ENABLED:
+        return False
+    for name, value in scope.get("headers", ()):
+        if name == b"x-profile" and value == b"1":
+            return True
+    return random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+class MetricsMiddleware:
+    """ASGI middleware that times each request and feeds the registry.
+
+    Plain ASGI rather than BaseHTTPMiddleware, which would add a task and a
+    response copy to every request.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status_code = 500
+        profiler = profile_id = None
+        if _should_profile(scope):
+            profiler = SamplingProfiler(timings, settings.PROFILE_INTERVAL_MS / 1000)
+            profile_id = f"{time.time_ns()}-{scope['method']}-{scope['path'].strip('/').replace('/', '_') or 'root'}"
+            profiler.start()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if profile_id is not None:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"x-profile-id", profile_id.encode())
+                    ]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.reset(token)
+            self._record(scope["method"], timings, status_code, elapsed)
+            if profiler is not None:
+                profiler.stop()
+                self._write_profile(profiler, profile_id)
+
+    def _record(self, method: str, timings: RequestTimings, status_code: int, elapsed: float) -> None:
+        route = timings.route or "unmatched"
+        registry.observe(
+            "http_request_duration_seconds",
+            (("method", method), ("route", route), ("status", str(status_code))),
+            elapsed
+        )
+        if timings.queries:
+            timings.add("db", timings.db)
+        for name, seconds in timings.phases.items():
+            registry.observe(
+                "http_request_phase_seconds",
+                (("method", method), ("route", route), ("phase", name)),
+                seconds
+            )
+
+    def _write_profile(self, profiler: SamplingProfiler, profile_id: str) -> None:
+        try:
+            os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+            path = os.path.join(settings.PROFILE_DIR, f"{profile_id}.folded")
+            profiler.write(path)
+            logger.info("Wrote request profile %s (%d samples)", path, sum(profiler.stacks.values()))
+        except OSError:
+            logger.exception("Could not write request profile %s", profile_id)
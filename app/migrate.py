@@ -0,0 +1,169 @@
+"""Schema migrations: Alembic revisions in migrations/versions, and helpers they share.
+
+``upgrade()`` brings a database to the latest revision; init_db calls it on
+startup. It starts with one query: when alembic_version already holds
+HEAD_REVISION it stops there. Databases created by ``create_all`` before
+migrations existed need no manual stamping. Every revision skips whatever
+such a database already has, so the first upgrade simply records the version.
+
+Indexes on large tables go through ``create_index_online``:
+
+- Postgres builds them with ``CREATE INDEX CONCURRENTLY`` outside the
+  migration's transaction, so reads and writes carry on during the build. A
+  previous build that failed leaves an INVALID index behind; that is dropped
+  and rebuilt.
+- SQLite has no online index build. The index is built in a transaction of
+  its own: WAL readers carry on, writers wait up to SQLITE_BUSY_TIMEOUT_MS.
+  Changes SQLite's ALTER TABLE cannot make run in Alembic's batch mode, which
+  copies the table into the new shape and swaps it in.
+
+Processes that start together (workers, nodes, the CLI) take turns: an
+upgrade holds an advisory lock on Postgres, or a lock file next to the SQLite
+database, and whoever gets it second finds nothing left to do.
+
+``alembic upgrade head`` (alembic.ini) and ``python -m app.cli db-upgrade`` run
+the same scripts; ``--sql`` prints them for review instead.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+from alembic import op
+from alembic.command import upgrade as _upgrade
+from alembic.config import Config
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: SQLite upgrades go unserialized
+    fcntl = None
+
+SCRIPT_LOCATION = Path(__file__).resolve().parent.parent / "migrations"
+
+# Newest revision in migrations/versions (tests check they agree)
+HEAD_REVISION = "0008"
+
+# pg_advisory_lock key every process migrating the database agrees on
+MIGRATION_LOCK_KEY = 0x63616C63  # "calc"
+
+
+def alembic_config(url: Optional[str] = None) -> Config:
+    config = Config()
+    config.set_main_option("script_location", str(SCRIPT_LOCATION))
+    if url is not None:
+        config.set_main_option("sqlalchemy.url", url.replace("%", "%%"))
+    return config
+
+
+def current_revision(engine: Engine) -> Optional[str]:
+    """The database's revision, None before the first upgrade; a single query"""
+    with engine.connect() as connection:
+        try:
+            return connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+        except DBAPIError:
+            return None
+
+
+@contextmanager
+def migration_lock(engine: Engine):
+    """Hold off other processes migrating the same database"""
+    if engine.dialect.name == "postgresql":
+        # Autocommit: an open transaction here would hold up CREATE INDEX CONCURRENTLY
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            try:
+                yield
+            finally:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        return
+    database = engine.url.database
+    if engine.dialect.name != "sqlite" or database in (None, "", ":memory:") or fcntl is None:
+        yield
+        return
+    with open(f"{database}.migrate-lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def upgrade(engine: Engine, revision: str = "head") -> None:
+    """Migrate ``engine``'s database to ``revision``"""
+    if revision == "head" and current_revision(engine) == HEAD_REVISION:
+        return
+    config = alembic_config(engine.url.render_as_string(hide_password=False))
+    # env.py runs on this engine (and its SQLite pragmas) instead of making its own
+    config.attributes["engine"] = engine
+    with migration_lock(engine):
+        # Starts from the version stored now, after anyone who held the lock
+        _upgrade(config, revision)
+
+
+def upgrade_sql(url: str, revision: str = "head") -> None:
+    """Print the SQL that would migrate a new database on ``url`` to ``revision``, for review"""
+    _upgrade(alembic_config(url), revision, sql=True)
+
+
+# Helpers for revisions; offline (--sql) they report nothing as present, so
+# the generated script contains every statement
+
+def _inspector():
+    if op.get_context().as_sql:
+        return None
+    return inspect(op.get_bind())
+
+
+def has_table(table: str) -> bool:
+    inspector = _inspector()
+    return inspector is not None and inspector.has_table(table)
+
+
+def columns(table: str) -> Dict[str, dict]:
+    """{name: reflected column} of an existing table"""
+    inspector = _inspector()
+    if inspector is None or not inspector.has_table(table):
+        return {}
+    return {column["name"]: column for column in inspector.get_columns(table)}
+
+
+def has_index(table: str, name: str) -> bool:
+    inspector = _inspector()
+    return inspector is not None and any(i["name"] == name for i in inspector.get_indexes(table))
+
+
+def _postgres_index_valid(name: str) -> Optional[bool]:
+    """None if the index doesn't exist, else whether a concurrent build completed"""
+    if op.get_context().as_sql:
+        return None
+    return op.get_bind().execute(
+        text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name"),
+        {"name": name}
+    ).scalar()
+
+
+def create_index_online(name: str, table: str, columns: Sequence[str], unique: bool = False) -> None:
+    """Create an index without blocking writes where the database allows it (see module docstring)"""
+    if op.get_bind().dialect.name == "postgresql":
+        # CONCURRENTLY cannot run inside a transaction
+        with op.get_context().autocommit_block():
+            valid = _postgres_index_valid(name)
+            if valid:
+                return
+            if valid is False:
+                op.drop_index(name, table_name=table, postgresql_concurrently=True)
+            op.create_index(name, table, list(columns), unique=unique, postgresql_concurrently=True)
+        return
+    if not has_index(table, name):
+        op.create_index(name, table, list(columns), unique=unique)
+
+
+def drop_index_online(name: str, table: str) -> None:
+    if op.get_bind().dialect.name == "postgresql":
+        with op.get_context().autocommit_block():
+            op.drop_index(name, table_name=table, postgresql_concurrently=True, if_exists=True)
+        return
+    if has_index(table, name):
+        op.drop_index(name, table_name=table)
@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Index, JSON, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
-import bcrypt
+from app.passwords import hasher
 
 class User(Base):
     __tablename__ = "users"
@@ -17,15 +17,11 @@ class User(Base):
     calculations = relationship("Calculation", back_populates="user", cascade="all, delete-orphan")
     
     def verify_password(self, password: str) -> bool:
-        password_bytes = password.encode('utf-8')
-        return bcrypt.checkpw(password_bytes, self.hashed_password.encode('utf-8'))
+        return hasher.verify(password, self.hashed_password)
     
     @staticmethod
     def hash_password(password: str) -> str:
-        password_bytes = password.encode('utf-8')
-        salt = bcrypt.gensalt()
-        hashed = bcrypt.hashpw(password_bytes, salt)
-        return hashed.decode('utf-8')
+        return hasher.hash(password)
 
 
 class Calculation(Base):
@@ -33,14 +29,103 @@ class Calculation(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    operation = Column(String, nullable=False)  # add, subtract, multiply, divide
-    operand1 = Column(Float, nullable=False)
-    operand2 = Column(Float, nullable=False)
+    operation = Column(String, nullable=False)  # add, subtract, multiply, divide, expression, vector_*, dot
+    operand1 = Column(Float, nullable=True)  # NULL for expressions and vectors
+    operand2 = Column(Float, nullable=True)
     result = Column(Float, nullable=False)
+    expression = Column(String, nullable=True)
+    variables = Column(JSON(none_as_null=True), nullable=True)  # {name: value} the expression was evaluated with
     created_at = Column(DateTime, default=datetime.utcnow)
     
     # Relationships
     user = relationship("User", back_populates="calculations")
+    vector = relationship(
+        "CalculationVector", back_populates="calculation", uselist=False, cascade="all, delete-orphan"
+    )
+    
+    # Serves per-user history ordering and keyset pagination
+    __table_args__ = (
+        Index("ix_calculations_user_created_id", "user_id", "created_at", "id"),
+    )
     
     def __repr__(self):
+        if self.expression is not None:
+            return f"<Calculation expression: {self.expression} = {self.result}>"
         return f"<Calculation {self.operation}: {self.operand1} and {self.operand2} = {self.result}>"
+
+
+class CalculationVector(Base):
+    """Array operands and result of a vector calculation, as little-endian float64 blobs.
+    
+    Kept apart from ``calculations`` so history pages never read the blobs.
+    """
+    __tablename__ = "calculation_vectors"
+    
+    calculation_id = Column(Integer, ForeignKey("calculations.id", ondelete="CASCADE"), primary_key=True)
+    length = Column(Integer, nullable=False)
+    operand1 = Column(LargeBinary, nullable=False)
+    operand2 = Column(LargeBinary, nullable=False)
+    result = Column(LargeBinary, nullable=True)  # NULL for dot products
+    
+    calculation = relationship("Calculation", back_populates="vector")
+    
+    def __repr__(self):
+        return f"<CalculationVector calculation={self.calculation_id}: {self.length} elements>"
+
+
+class UserStats(Base):
+    """Running per-user totals maintained alongside the calculations table"""
+    __tablename__ = "user_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    total_calculations = Column(Integer, nullable=False, default=0)
+    sum_operand1 = Column(Float, nullable=False, default=0.0)
+    sum_operand2 = Column(Float, nullable=False, default=0.0)
+    sum_result = Column(Float, nullable=False, default=0.0)
+    latest_calculation_id = Column(Integer, nullable=True)
+    latest_created_at = Column(DateTime, nullable=True)
+    # Bumped by every write to the user's calculations; the ETag of history and statistics
+    version = Column(Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f"<UserStats user={self.user_id}: {self.total_calculations} calculations>"
+
+
+class UserOperationStats(Base):
+    """Running per-user, per-operation counts"""
+    __tablename__ = "user_operation_stats"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    operation = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    first_calculation_id = Column(Integer, nullable=True)  # breaks most-used ties
+    
+    def __repr__(self):
+        return f"<UserOperationStats user={self.user_id} {self.operation}: {self.count}>"
+
+
+class UsageBucket(Base):
+    """Calculations created per user, operation and UTC hour or day.
+    
+    Records usage, so deleting calculations doesn't take them out again.
+    Hourly rows are pruned after a retention period; daily rows are kept.
+    """
+    __tablename__ = "usage_buckets"
+    
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    resolution = Column(String, primary_key=True)  # hour, day
+    bucket_start = Column(DateTime, primary_key=True)
+    operation = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    sum_result = Column(Float, nullable=False, default=0.0)
+    
+    def __repr__(self):
+        return f"<UsageBucket user={self.user_id} {self.resolution} {self.bucket_start} {self.operation}: {self.count}>"
+
+
+class IdAllocation(Base):
+    """High-water mark of ids handed out ahead of insert (write-behind mode)"""
+    __tablename__ = "id_allocations"
+    
+    name = Column(String, primary_key=True)
+    next_id = Column(Integer, nullable=False)
@@ -0,0 +1,53 @@
+"""Keyset (cursor) pagination helpers.
+
+A cursor is an opaque, URL-safe token encoding the ``(created_at, id)`` of the
+last row on a page. Filtering on that pair lets the database seek straight into
+the ``(user_id, created_at, id)`` index instead of counting past skipped rows.
+"""
+import base64
+from datetime import datetime
+from typing import Optional, Tuple, Union
+from sqlalchemy import Select, tuple_
+from sqlalchemy.orm import Query
+from app.models import Calculation
+
+
+def encode_cursor(created_at: datetime, calculation_id: int) -> str:
+    raw = f"{created_at.isoformat()}|{calculation_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor, raising ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, calculation_id = base64.urlsafe_b64decode(padded).decode("utf-8").split("|")
+        return datetime.fromisoformat(created_at), int(calculation_id)
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
+
+def paginate(
+    query: Union[Query, Select],
+    after: Optional[str],
+    limit: int,
+    descending: bool = False
+) -> Union[Query, Select]:
+    """Order a calculation query (ORM Query or select()) by (created_at, id) and seek past the cursor"""
+    key = tuple_(Calculation.created_at, Calculation.id)
+    if after:
+        position = tuple_(*decode_cursor(after))
+        query = query.filter(key < position if descending else key > position)
+    if descending:
+        query = query.order_by(Calculation.created_at.desc(), Calculation.id.desc())
+    else:
+        query = query.order_by(Calculation.created_at.asc(), Calculation.id.asc())
+    return query.limit(limit)
+
+
+def next_cursor(rows, limit: int) -> Optional[str]:
+    """Cursor for the page after ``rows``, or None when this was the last page"""
+    if limit <= 0 or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(last.created_at, last.id)
@@ -0,0 +1,105 @@
+"""Password hashing in a dedicated, bounded process pool.
+
+bcrypt is deliberately slow (~250ms at cost 12). Running it in request
+threads lets a burst of logins occupy every worker thread, so hashing runs in
+a small process pool instead, and at most PASSWORD_HASH_MAX_PENDING requests
+may wait on it at once (0 for no limit). Further requests are rejected with
+PasswordHasherBusy rather than queueing behind the burst and starving other
+endpoints.
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Optional
+import bcrypt
+from app.config import settings
+
+
+class PasswordHasherBusy(Exception):
+    """Too many password operations are already in flight"""
+
+
+def _hashpw(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+
+def _checkpw(password: str, hashed: str) -> bool:
+    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def hash_rounds(hashed: str) -> Optional[int]:
+    """The cost factor stored in a bcrypt hash ("$2b$12$...")"""
+    try:
+        return int(hashed.split("$")[2])
+    except (IndexError, ValueError):
+        return None
+
+
+def needs_rehash(hashed: str) -> bool:
+    return hash_rounds(hashed) != settings.BCRYPT_ROUNDS
+
+
+class PasswordHasher:
+    """Runs bcrypt in ``workers`` processes (inline when ``workers`` is 0)"""
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process with live threads can copy held locks
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._executor
+
+    def submit(self, fn: Callable, *args) -> Future:
+        if self._slots is not None and not self._slots.acquire(blocking=False):
+            raise PasswordHasherBusy("Too many password operations in progress")
+        try:
+            if self.workers <= 0:
+                future = Future()
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                future = self._get_executor().submit(fn, *args)
+        except Exception:
+            if self._slots is not None:
+                self._slots.release()
+            raise
+        if self._slots is not None:
+            future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def hash(self, password: str) -> str:
+        return self.submit(_hashpw, password, settings.BCRYPT_ROUNDS).result()
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self.submit(_checkpw, password, hashed).result()
+
+    async def hash_async(self, password: str) -> str:
+        return await asyncio.wrap_future(self.submit(_hashpw, password, settings.BCRYPT_ROUNDS))
+
+    async def verify_async(self, password: str, hashed: str) -> bool:
+        return await asyncio.wrap_future(self.submit(_checkpw, password, hashed))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+
+hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING
+)
@@ -0,0 +1,223 @@
+"""Admission control: 429 with Retry-After before any DB or bcrypt work.
+
+RateLimitMiddleware checks every API request against:
+
+- a token bucket per client IP, and a stricter one per IP for /auth (bcrypt);
+- a token bucket per user, keyed by the bearer token's subject;
+- an in-flight limit per route class (auth, write, read) in this worker.
+
+In-process buckets are stored GCRA-style: one float per key, the time at
+which its bucket would be full again, in a bounded LRU table. Evicting a key
+only forgets a bucket that has been idle longest. With RATE_LIMIT_SHARED and a
+distributed SHARED_STATE_URL the buckets are fixed-window counters in shared
+state instead, so the limits hold across workers; that allows up to twice the
+burst across a window boundary, and a shared-state failure lets requests in.
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Tuple
+import orjson
+from app.auth import decode_claims
+from app.tokens import InvalidToken
+from app.config import settings
+from app.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBuckets:
+    """Token buckets of ``burst`` tokens refilled at ``rate`` per second, one per key"""
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100000):
+        self.interval = 1 / rate
+        self.tolerance = burst * self.interval
+        self.max_keys = max_keys
+        self._full_at: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        """Take a token: 0.0 if one was available, else seconds until one is"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            full_at = max(self._full_at.get(key, now), now) + self.interval
+            wait = full_at - now - self.tolerance
+            if wait > 0:
+                return wait
+            self._full_at[key] = full_at
+            self._full_at.move_to_end(key)
+            if len(self._full_at) > self.max_keys:
+                self._full_at.popitem(last=False)
+            return 0.0
+
+    def __len__(self) -> int:
+        return len(self._full_at)
+
+
+class SharedBuckets:
+    """``burst`` requests per ``burst / rate`` second window, counted in a SharedState"""
+
+    def __init__(self, state, name: str, rate: float, burst: int):
+        self.state = state
+        self.name = name
+        self.burst = burst
+        self.window = burst / rate
+
+    def take(self, key: str, now: Optional[float] = None) -> float:
+        if now is None:
+            now = time.time()
+        window = int(now // self.window)
+        try:
+            count = self.state.incr(f"rl:{self.name}:{key}:{window}", ttl=self.window)
+        except Exception:
+            logger.warning("Shared rate limit check failed; admitting", exc_info=True)
+            return 0.0
+        if count <= self.burst:
+            return 0.0
+        return (window + 1) * self.window - now
+
+
+class ConcurrencyLimits:
+    """Requests in flight per route class; only touched from the event loop"""
+
+    def __init__(self, limits: Dict[str, int]):
+        self.limits = limits
+        self.in_flight = {name: 0 for name in limits}
+
+    def try_enter(self, name: str) -> bool:
+        limit = self.limits.get(name, 0)
+        if limit and self.in_flight[name] >= limit:
+            return False
+        if name in self.in_flight:
+            self.in_flight[name] += 1
+        return True
+
+    def leave(self, name: str) -> None:
+        if name in self.in_flight:
+            self.in_flight[name] -= 1
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """auth, write, read or stream for API routes; None for pages, docs, health and metrics"""
+    if path.startswith("/auth/"):
+        return "auth" if method == "POST" else "read"
+    if path.startswith(("/calculations", "/history")):
+        if path == "/history/stream":
+            return "stream"
+        return "read" if method in ("GET", "HEAD") else "write"
+    return None
+
+
+def client_ip(scope, trust_proxy: bool = False) -> str:
+    """The peer address, or with ``trust_proxy`` the last X-Forwarded-For hop (added by our proxy)"""
+    if trust_proxy:
+        for name, value in scope["headers"]:
+            if name == b"x-forwarded-for":
+                return value.decode("latin-1").rsplit(",", 1)[-1].strip()
+    client = scope.get("client")
+    return client[0] if client else "unknown"
+
+
+def bearer_subject(scope) -> Optional[str]:
+    """Username of a valid bearer token; no DB lookup, and cached with the token's claims"""
+    for name, value in scope["headers"]:
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() != "bearer" or not token:
+                return None
+            try:
+                subject = decode_claims(token).get("sub")
+            except InvalidToken:
+                return None
+            return subject if isinstance(subject, str) else None
+    return None
+
+
+def _buckets(name: str, rate: float, burst: int):
+    if rate <= 0 or burst <= 0:
+        return None
+    if settings.RATE_LIMIT_SHARED:
+        from app.shared_state import shared_state
+        if shared_state.distributed:
+            return SharedBuckets(shared_state, name, rate, burst)
+    return TokenBuckets(rate, burst, settings.RATE_LIMIT_MAX_KEYS)
+
+
+class RateLimitMiddleware:
+    """ASGI middleware rejecting over-limit requests with 429 and Retry-After.
+
+    Limits default to the RATE_LIMIT_* settings; a rate, burst or concurrency
+    of 0 turns that check off.
+    """
+
+    def __init__(self, app, ip=None, user=None, auth=None, concurrency: Optional[Dict[str, int]] = None):
+        self.app = app
+        self.ip = ip if ip is not None else _buckets("ip", settings.RATE_LIMIT_IP_RATE, settings.RATE_LIMIT_IP_BURST)
+        self.user = user if user is not None else _buckets(
+            "user", settings.RATE_LIMIT_USER_RATE, settings.RATE_LIMIT_USER_BURST
+        )
+        self.auth = auth if auth is not None else _buckets(
+            "auth", settings.RATE_LIMIT_AUTH_RATE, settings.RATE_LIMIT_AUTH_BURST
+        )
+        self.concurrency = ConcurrencyLimits(concurrency if concurrency is not None else {
+            "auth": settings.RATE_LIMIT_MAX_CONCURRENT_AUTH,
+            "write": settings.RATE_LIMIT_MAX_CONCURRENT_WRITE,
+            "read": settings.RATE_LIMIT_MAX_CONCURRENT_READ,
+        })
+        registry.register_collector(self._samples)
+
+    def _checks(self, scope, kind: str) -> Iterable[Tuple[str, object, str]]:
+        """(reason, buckets, key) in order of cost; the token is only decoded if the IP passes"""
+        ip = client_ip(scope, settings.RATE_LIMIT_TRUST_PROXY)
+        if self.ip is not None:
+            yield "ip", self.ip, ip
+        if kind == "auth" and self.auth is not None:
+            yield "auth", self.auth, ip
+        if self.user is not None:
+            subject = bearer_subject(scope)
+            if subject is not None:
+                yield "user", self.user, subject
+
+    async def __call__(self, scope, receive, send):
+        kind = route_class(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if kind is None:
+            await self.app(scope, receive, send)
+            return
+
+        for reason, buckets, key in self._checks(scope, kind):
+            wait = buckets.take(key)
+            if wait > 0:
+                await self._reject(send, reason, wait)
+                return
+        if not self.concurrency.try_enter(kind):
+            await self._reject(send, kind + "_concurrency", 1.0)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.concurrency.leave(kind)
+
+    async def _reject(self, send, reason: str, wait: float) -> None:
+        registry.inc("rate_limit_rejections_total", (("reason", reason),))
+        body = orjson.dumps({"detail": "Too many requests, please retry later"})
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode("ascii")),
+                (b"retry-after", str(max(1, math.ceil(wait))).encode("ascii")),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    def _samples(self):
+        for name, count in self.concurrency.in_flight.items():
+            yield "rate_limit_in_flight", "gauge", (("class", name),), count
+
+
+registry.describe("rate_limit_rejections_total", "Requests rejected with 429, by the limit they hit.")
+registry.describe("rate_limit_in_flight", "Admitted requests in flight per route class in this worker.")
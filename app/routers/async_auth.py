@@ -0,0 +1,87 @@
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_async_db
+from app.models import User, UserStats
+from app.schemas import UserCreate, UserResponse, Token
+from app.auth import create_access_token, token_claims
+from app.config import settings
+from app.passwords import PasswordHasherBusy, hasher, needs_rehash
+from app.routers.auth import hasher_busy_exception
+from app.metrics import TimedRoute
+
+# Async-stack versions of app.routers.auth (enabled by ASYNC_DB_ENABLED)
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
+
+@router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
+async def register(user: UserCreate, db: AsyncSession = Depends(get_async_db)):
+    """Register a new user"""
+    # Check if username exists
+    if (await db.execute(select(User.id).where(User.username == user.username))).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already registered"
+        )
+    
+    # Check if email exists
+    if (await db.execute(select(User.id).where(User.email == user.email))).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Email already registered"
+        )
+    
+    # Create new user; hold no pooled connection while bcrypt runs
+    await db.rollback()
+    try:
+        hashed_password = await hasher.hash_async(user.password)
+    except PasswordHasherBusy:
+        raise hasher_busy_exception()
+    db_user = User(
+        username=user.username,
+        email=user.email,
+        hashed_password=hashed_password
+    )
+    db.add(db_user)
+    await db.flush()
+    db.add(UserStats(user_id=db_user.id))
+    await db.commit()
+    return db_user
+
+@router.post("/login", response_model=Token)
+async def login(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Login and get access token"""
+    result = await db.execute(select(User).where(User.username == form_data.username))
+    user = result.scalars().first()
+    if user is not None:
+        # Hold no pooled connection while bcrypt runs
+        db.expunge(user)
+        await db.rollback()
+    
+    try:
+        verified = user is not None and await hasher.verify_async(form_data.password, user.hashed_password)
+        if verified and needs_rehash(user.hashed_password):
+            # Stored with a different cost factor; upgrade while we have the password
+            await db.execute(update(User).where(User.id == user.id).values(
+                hashed_password=await hasher.hash_async(form_data.password)
+            ))
+            await db.commit()
+    except PasswordHasherBusy:
+        raise hasher_busy_exception()
+    
+    if not verified:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Incorrect username or password",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    access_token = create_access_token(
+        data=token_claims(user), expires_delta=access_token_expires
+    )
+    return {"access_token": access_token, "token_type": "bearer"}
@@ -0,0 +1,103 @@
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app.database import get_async_db
+from app.models import User, Calculation
+from app.schemas import CalculationCreate, CalculationResponse
+from app.auth import get_current_user_async
+from app.services import CalculationService
+from app.pagination import paginate, next_cursor
+from app.serialization import CALCULATION_ROW, calculation_list_response
+from app.writer import single_writer, write_behind
+from app.events import publish_created, publish_deleted
+from app.metrics import TimedRoute
+
+# Async-stack versions of the core app.routers.calculations routes (enabled by
+# ASYNC_DB_ENABLED). Writes reuse the sync service code through run_sync.
+router = APIRouter(prefix="/calculations", tags=["Calculations"], route_class=TimedRoute)
+
+async def _get_owned(db: AsyncSession, calculation_id: int, user_id: int) -> Calculation:
+    result = await db.execute(select(Calculation).where(
+        Calculation.id == calculation_id,
+        Calculation.user_id == user_id
+    ))
+    calculation = result.scalars().first()
+    if not calculation:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calculation not found")
+    return calculation
+
+@router.post("/", response_model=CalculationResponse, status_code=status.HTTP_201_CREATED)
+async def create_calculation(
+    calc_data: CalculationCreate,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Create a new calculation"""
+    try:
+        result = CalculationService.perform_calculation(
+            calc_data.operation,
+            calc_data.operand1,
+            calc_data.operand2
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    db_calc = Calculation(
+        user_id=current_user.id,
+        operation=calc_data.operation,
+        operand1=calc_data.operand1,
+        operand2=calc_data.operand2,
+        result=result
+    )
+    if write_behind.running:
+        db_calc = await run_in_threadpool(write_behind.add, db_calc)
+    elif single_writer.running:
+        db_calc = (await asyncio.wrap_future(single_writer.submit([db_calc])))[0]
+    else:
+        await db.run_sync(CalculationService.save_calculations, [db_calc])
+        await db.commit()
+    publish_created(current_user.id, [db_calc])
+    return db_calc
+
+@router.get("/", response_model=List[CalculationResponse])
+async def get_calculations(
+    skip: int = 0,
+    limit: int = 100,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get all calculations for current user"""
+    query = select(*CALCULATION_ROW).where(Calculation.user_id == current_user.id)
+    try:
+        query = paginate(query, after, limit).offset(skip)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    rows = (await db.execute(query)).all()
+    
+    return calculation_list_response(rows, next_cursor(rows, limit))
+
+@router.get("/{calculation_id}", response_model=CalculationResponse)
+async def get_calculation(
+    calculation_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get a specific calculation"""
+    return await _get_owned(db, calculation_id, current_user.id)
+
+@router.delete("/{calculation_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_calculation(
+    calculation_id: int,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Delete a calculation"""
+    calculation = await _get_owned(db, calculation_id, current_user.id)
+    await db.run_sync(CalculationService.delete_calculation, calculation)
+    await db.commit()
+    publish_deleted(current_user.id, [calculation_id])
+    return None
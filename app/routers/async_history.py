@@ -0,0 +1,68 @@
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.database import get_async_db
+from app.models import User, Calculation
+from app.schemas import CalculationHistory, CalculationStatistics
+from app.auth import get_current_user_async
+from app.services import CalculationService, UserStatsService
+from app.pagination import paginate, next_cursor
+from app.events import publish_cleared
+from app.etags import etag_headers, etag_matches, not_modified, user_etag
+from app.serialization import CALCULATION_ROW, calculation_history_response
+from app.metrics import TimedRoute
+
+# Async-stack versions of the core app.routers.history routes (enabled by ASYNC_DB_ENABLED)
+router = APIRouter(prefix="/history", tags=["History & Statistics"], route_class=TimedRoute)
+
+@router.get("/", response_model=CalculationHistory)
+async def get_history(
+    request: Request,
+    limit: int = 50,
+    after: Optional[str] = None,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get calculation history for current user, newest first"""
+    etag = user_etag(current_user.id, await db.run_sync(UserStatsService.get_version, current_user.id))
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    
+    query = select(*CALCULATION_ROW).where(Calculation.user_id == current_user.id)
+    try:
+        query = paginate(query, after, limit, descending=True)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    rows = (await db.execute(query)).all()
+    
+    response = calculation_history_response(rows, next_cursor(rows, limit))
+    if etag:
+        response.headers.update(etag_headers(etag))
+    return response
+
+@router.get("/statistics", response_model=CalculationStatistics)
+async def get_statistics(
+    request: Request,
+    response: Response,
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Get statistics for current user's calculations"""
+    etag = user_etag(current_user.id, await db.run_sync(UserStatsService.get_version, current_user.id))
+    if etag:
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        response.headers.update(etag_headers(etag))
+    return await db.run_sync(UserStatsService.get_statistics, current_user.id)
+
+@router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
+async def clear_history(
+    current_user: User = Depends(get_current_user_async),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Clear all calculation history for current user"""
+    await db.run_sync(CalculationService.clear_history, current_user.id)
+    await db.commit()
+    publish_cleared(current_user.id)
+    return None
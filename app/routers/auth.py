@@ -3,12 +3,21 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from app.database import get_db
-from app.models import User
+from app.models import User, UserStats
 from app.schemas import UserCreate, UserResponse, Token
-from app.auth import create_access_token
+from app.auth import create_access_token, token_claims
 from app.config import settings
+from app.passwords import PasswordHasherBusy, hasher, needs_rehash
+from app.metrics import TimedRoute
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=TimedRoute)
+
+def hasher_busy_exception() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many authentication requests, please retry",
+        headers={"Retry-After": "1"},
+    )
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 def register(user: UserCreate, db: Session = Depends(get_db)):
@@ -27,13 +36,20 @@ def register(user: UserCreate, db: Session = Depends(get_db)):
             detail="Email already registered"
         )
     
-    # Create new user
+    # Create new user; hold no pooled connection while bcrypt runs
+    db.rollback()
+    try:
+        hashed_password = hasher.hash(user.password)
+    except PasswordHasherBusy:
+        raise hasher_busy_exception()
     db_user = User(
         username=user.username,
         email=user.email,
-        hashed_password=User.hash_password(user.password)
+        hashed_password=hashed_password
     )
     db.add(db_user)
+    db.flush()
+    db.add(UserStats(user_id=db_user.id))
     db.commit()
     db.refresh(db_user)
     return db_user
@@ -45,8 +61,23 @@ def login(
 ):
     """Login and get access token"""
     user = db.query(User).filter(User.username == form_data.username).first()
+    if user is not None:
+        # Hold no pooled connection while bcrypt runs
+        db.expunge(user)
+        db.rollback()
+    
+    try:
+        verified = user is not None and hasher.verify(form_data.password, user.hashed_password)
+        if verified and needs_rehash(user.hashed_password):
+            # Stored with a different cost factor; upgrade while we have the password
+            db.query(User).filter(User.id == user.id).update({
+                User.hashed_password: hasher.hash(form_data.password)
+            })
+            db.commit()
+    except PasswordHasherBusy:
+        raise hasher_busy_exception()
     
-    if not user or not user.verify_password(form_data.password):
+    if not verified:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
@@ -55,6 +86,6 @@ def login(
     
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.username}, expires_delta=access_token_expires
+        data=token_claims(user), expires_delta=access_token_expires
     )
     return {"access_token": access_token, "token_type": "bearer"}
@@ -1,13 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import Dict, List, Literal, Optional, Tuple
+import numpy as np
+from app import vectors
+from app.config import settings
 from app.database import get_db
-from app.models import User, Calculation
-from app.schemas import CalculationCreate, CalculationResponse
+from app.models import User, Calculation, CalculationVector
+from app.schemas import (
+    CalculationCreate, CalculationResponse, CalculationBatchCreate, CalculationBatchResponse,
+    CalculationImportResponse, CalculationExpressionCreate, CalculationVectorCreate, CalculationVectorResponse
+)
 from app.auth import get_current_user
-from app.services import CalculationService
+from app.services import CalculationService, EXPRESSION_OPERATION, VECTOR_OPERATION_NAMES
+from app.pagination import paginate, next_cursor
+from app.importer import ImportFormatError, ImportSummary, import_format, read_records
+from app.serialization import CALCULATION_ROW, calculation_list_response
+from app.writer import single_writer, write_behind
+from app.events import publish_created, publish_deleted, publish_resync
+from app.metrics import TimedRoute
 
-router = APIRouter(prefix="/calculations", tags=["Calculations"])
+router = APIRouter(prefix="/calculations", tags=["Calculations"], route_class=TimedRoute)
 
 @router.post("/", response_model=CalculationResponse, status_code=status.HTTP_201_CREATED)
 def create_calculation(
@@ -32,25 +47,289 @@ def create_calculation(
             operand2=calc_data.operand2,
             result=result
         )
-        db.add(db_calc)
+        if write_behind.running:
+            # Acknowledged now, stored with the next buffer flush
+            db_calc = write_behind.add(db_calc)
+        elif single_writer.running:
+            # Group-committed by the writer thread
+            db_calc = single_writer.submit([db_calc]).result()[0]
+        else:
+            CalculationService.save_calculations(db, [db_calc])
+            db.commit()
+            db.refresh(db_calc)
+        publish_created(current_user.id, [db_calc])
+        return db_calc
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@router.post("/expression", response_model=CalculationResponse, status_code=status.HTTP_201_CREATED)
+def create_expression_calculation(
+    calc_data: CalculationExpressionCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Evaluate a formula such as "(a+b)*c/d" with the given variables and store it"""
+    try:
+        result = CalculationService.perform_expression(calc_data.expression, calc_data.variables)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    db_calc = Calculation(
+        user_id=current_user.id,
+        operation=EXPRESSION_OPERATION,
+        expression=calc_data.expression,
+        variables=calc_data.variables,
+        result=result
+    )
+    if write_behind.running:
+        db_calc = write_behind.add(db_calc)
+    elif single_writer.running:
+        db_calc = single_writer.submit([db_calc]).result()[0]
+    else:
+        CalculationService.save_calculations(db, [db_calc])
         db.commit()
         db.refresh(db_calc)
-        return db_calc
+    publish_created(current_user.id, [db_calc])
+    return db_calc
+
+async def _read_body(request: Request, limit: int) -> bytes:
+    """The request body, refused with 413 once it passes ``limit`` bytes"""
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > limit:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Request body is larger than {limit} bytes"
+            )
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def _vector_operands(body: bytes, calc_data: Optional[CalculationVectorCreate]) -> Tuple[np.ndarray, np.ndarray]:
+    if calc_data is not None:
+        return vectors.from_base64(calc_data.operand1, "operand1"), vectors.from_base64(calc_data.operand2, "operand2")
+    if not body or len(body) % (2 * vectors.DTYPE.itemsize):
+        raise ValueError("Body must hold two float64 vectors of the same length")
+    half = len(body) // 2
+    return vectors.from_bytes(body[:half], "operand1"), vectors.from_bytes(body[half:], "operand2")
+
+def _store_vector(
+    db: Session,
+    user_id: int,
+    operation: str,
+    body: bytes,
+    calc_data: Optional[CalculationVectorCreate]
+) -> Tuple[Calculation, int, np.ndarray]:
+    operand1, operand2 = _vector_operands(body, calc_data)
+    values, result = CalculationService.perform_vector(operation, operand1, operand2)
+    db_calc = Calculation(
+        user_id=user_id,
+        operation=VECTOR_OPERATION_NAMES[operation],
+        result=result,
+        vector=CalculationVector(
+            length=len(operand1),
+            operand1=vectors.to_bytes(operand1),
+            operand2=vectors.to_bytes(operand2),
+            result=None if values is None else vectors.to_bytes(values)
+        )
+    )
+    # Not write-behind: its buffer only carries the scalar columns
+    if single_writer.running:
+        db_calc = single_writer.submit([db_calc]).result()[0]
+    else:
+        CalculationService.save_calculations(db, [db_calc])
+        db.commit()
+        db.refresh(db_calc)
+    publish_created(user_id, [db_calc])
+    return db_calc, len(operand1), np.array([result]) if values is None else values
+
+def _vector_response(calculation: Calculation, length: int, values: Optional[np.ndarray]) -> Dict:
+    return {
+        **CalculationResponse.model_validate(calculation).model_dump(),
+        "length": length,
+        "vector_result": None if values is None else vectors.to_base64(values),
+    }
+
+@router.post(
+    "/vector",
+    response_model=CalculationVectorResponse,
+    status_code=status.HTTP_201_CREATED,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "application/json": {"schema": CalculationVectorCreate.model_json_schema()},
+        vectors.OCTET_STREAM: {"schema": {"type": "string", "format": "binary"}},
+    }}}
+)
+async def create_vector_calculation(
+    request: Request,
+    operation: Optional[Literal["add", "subtract", "multiply", "divide", "dot"]] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Elementwise add/subtract/multiply/divide, or dot product, of two vectors.
+    
+    Operands are little-endian float64: base64 strings in JSON, or as
+    application/octet-stream the raw bytes of operand1 followed by operand2,
+    with ``operation`` in the query string. ``result`` is the dot product or
+    the sum of the result vector. With ``Accept: application/octet-stream``
+    the result vector is returned as raw bytes, with the calculation's id
+    and result in X-Calculation-Id and X-Result.
+    """
+    media_type = (request.headers.get("content-type") or "").split(";")[0].strip().lower()
+    # Two operands at 8 bytes per element
+    limit = 2 * settings.VECTOR_MAX_LENGTH * vectors.DTYPE.itemsize
+    calc_data = None
+    if media_type == vectors.OCTET_STREAM:
+        if operation is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Pass operation=add|subtract|multiply|divide|dot with an application/octet-stream body"
+            )
+        body = await _read_body(request, limit)
+    elif media_type == "application/json":
+        # base64 adds a third, plus room for the rest of the JSON
+        body = await _read_body(request, limit * 4 // 3 + 1024)
+        try:
+            calc_data = CalculationVectorCreate.model_validate_json(body)
+        except ValidationError as e:
+            raise RequestValidationError(e.errors())
+        operation = calc_data.operation
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Send application/json or {vectors.OCTET_STREAM}"
+        )
+    
+    try:
+        # Decoding, NumPy and the blob insert run off the event loop
+        db_calc, length, values = await run_in_threadpool(
+            _store_vector, db, current_user.id, operation, body, calc_data
+        )
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    if vectors.OCTET_STREAM in request.headers.get("accept", ""):
+        return Response(
+            vectors.to_bytes(values),
+            status_code=status.HTTP_201_CREATED,
+            media_type=vectors.OCTET_STREAM,
+            headers={"X-Calculation-Id": str(db_calc.id), "X-Result": repr(db_calc.result)}
+        )
+    return _vector_response(db_calc, length, None if operation == "dot" else values)
+
+@router.post("/batch", response_model=CalculationBatchResponse)
+def create_calculation_batch(
+    batch: CalculationBatchCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Evaluate and store many calculations in one request.
+    
+    Items that fail (e.g. divide by zero) are reported by index in ``errors``
+    and are not stored; the rest are inserted in a single transaction.
+    """
+    operations, operand1, operand2 = batch.columns()
+    results, errors = CalculationService.perform_batch(operations, operand1, operand2)
+    
+    ok = [i for i in range(len(operations)) if i not in errors]
+    rows = [
+        {
+            "user_id": current_user.id,
+            "operation": operations[i],
+            "operand1": operand1[i],
+            "operand2": operand2[i],
+            "result": float(results[i]),
+        }
+        for i in ok
+    ]
+    inserted = CalculationService.bulk_insert(db, rows)
+    db.commit()
+    publish_created(current_user.id, inserted)
+    
+    ids = [None] * len(operations)
+    for i, row in zip(ok, inserted):
+        ids[i] = row.id
+    return {
+        "total": len(operations),
+        "succeeded": len(ok),
+        "failed": len(errors),
+        "ids": ids,
+        "results": [None if i in errors else value for i, value in enumerate(results.tolist())],
+        "errors": [{"index": i, "detail": detail} for i, detail in sorted(errors.items())]
+    }
+
+def _store_import_chunk(db: Session, user_id: int, chunk: List[Tuple[int, Dict]], summary: ImportSummary) -> None:
+    errors = CalculationService.import_records(db, user_id, [record for _, record in chunk])
+    db.commit()
+    summary.accepted += len(chunk) - len(errors)
+    for i, detail in sorted(errors.items()):
+        summary.reject(chunk[i][0], detail)
+
+@router.post(
+    "/import",
+    response_model=CalculationImportResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {
+        "text/csv": {"schema": {"type": "string"}},
+        "application/x-ndjson": {"schema": {"type": "string"}},
+    }}}
+)
+async def import_calculations(
+    request: Request,
+    format: Optional[Literal["csv", "ndjson"]] = None,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Import calculations from a CSV or NDJSON request body.
+    
+    The body is parsed as it streams in. Every IMPORT_CHUNK_ROWS rows are
+    evaluated together, checked against any ``result`` they carry, and
+    committed with one bulk insert. Rows that fail are reported by line
+    number and skipped. The format comes from ``format`` or the Content-Type.
+    """
+    format = format or import_format(request.headers.get("content-type"))
+    if format is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass format=csv|ndjson"
+        )
+    
+    summary = ImportSummary(max_errors=settings.IMPORT_MAX_ERRORS)
+    try:
+        async for chunk in read_records(request.stream(), format, settings.IMPORT_CHUNK_ROWS, summary):
+            # Evaluate and write off the event loop
+            await run_in_threadpool(_store_import_chunk, db, current_user.id, chunk, summary)
+    except ImportFormatError as e:
+        # Chunks committed so far stay imported
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"{e} ({summary.accepted} rows imported before the error)"
+        )
+    finally:
+        if summary.accepted:
+            publish_resync(current_user.id)
+    return summary.as_dict()
 
 @router.get("/", response_model=List[CalculationResponse])
 def get_calculations(
     skip: int = 0,
     limit: int = 100,
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get all calculations for current user"""
-    calculations = db.query(Calculation).filter(
-        Calculation.user_id == current_user.id
-    ).offset(skip).limit(limit).all()
-    return calculations
+    """Get all calculations for current user.
+    
+    Pass the ``X-Next-Cursor`` header of one page as ``after`` to fetch the
+    next; ``skip`` still works but gets slower on deep pages.
+    """
+    # Plain column tuples, encoded without per-row validation
+    query = db.query(*CALCULATION_ROW).filter(Calculation.user_id == current_user.id)
+    try:
+        rows = paginate(query, after, limit).offset(skip).all()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    return calculation_list_response(rows, next_cursor(rows, limit))
 
 @router.get("/{calculation_id}", response_model=CalculationResponse)
 def get_calculation(
@@ -69,6 +348,53 @@ def get_calculation(
     
     return calculation
 
+@router.get("/{calculation_id}/vector", response_model=CalculationVectorResponse)
+def get_vector_calculation(
+    calculation_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a vector calculation with its result vector (base64)"""
+    row = db.query(Calculation, CalculationVector.length, CalculationVector.result).join(
+        CalculationVector
+    ).filter(
+        Calculation.id == calculation_id,
+        Calculation.user_id == current_user.id
+    ).first()
+    
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector calculation not found")
+    
+    calculation, length, result = row
+    return _vector_response(calculation, length, None if result is None else np.frombuffer(result, vectors.DTYPE))
+
+@router.get(
+    "/{calculation_id}/vector/{part}",
+    response_class=Response,
+    responses={200: {"content": {vectors.OCTET_STREAM: {}}}}
+)
+def get_vector_part(
+    calculation_id: int,
+    part: Literal["operand1", "operand2", "result"],
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """One vector of a calculation as raw little-endian float64 bytes (one element for a dot product's result)"""
+    row = db.query(getattr(CalculationVector, part), Calculation.result).join(
+        Calculation
+    ).filter(
+        Calculation.id == calculation_id,
+        Calculation.user_id == current_user.id
+    ).first()
+    
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Vector calculation not found")
+    
+    data, result = row
+    if data is None:
+        data = vectors.to_bytes(np.array([result]))
+    return Response(data, media_type=vectors.OCTET_STREAM)
+
 @router.delete("/{calculation_id}", status_code=status.HTTP_204_NO_CONTENT)
 def delete_calculation(
     calculation_id: int,
@@ -84,6 +410,7 @@ def delete_calculation(
     if not calculation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Calculation not found")
     
-    db.delete(calculation)
+    CalculationService.delete_calculation(db, calculation)
     db.commit()
+    publish_deleted(current_user.id, [calculation_id])
     return None
@@ -1,47 +1,200 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-from typing import List
-from app.database import get_db
+from datetime import datetime
+from typing import List, Literal, Optional
+from app.config import settings
+from app.database import SessionLocal, get_db
 from app.models import User, Calculation
-from app.schemas import CalculationHistory, CalculationStatistics, CalculationResponse
-from app.auth import get_current_user
-from app.services import CalculationService
+from app.schemas import CalculationHistory, CalculationStatistics, CalculationResponse, CalculationTimeseries, StreamTicket
+from app.auth import create_stream_ticket, get_current_user, get_stream_user
+from app.services import CalculationService, UserStatsService, UsageService, USAGE_RESOLUTIONS, naive_utc
+from app.pagination import paginate, next_cursor
+from app.events import READY_FRAME, event_hub, publish_cleared
+from app.etags import etag_headers, etag_matches, not_modified, user_etag
+from app.serialization import (
+    CALCULATION_ROW, EXPORT_MEDIA_TYPES, accepts_gzip, calculation_history_response,
+    csv_chunks, gzip_chunks, ndjson_chunks
+)
+from app.metrics import TimedRoute
 
-router = APIRouter(prefix="/history", tags=["History & Statistics"])
+router = APIRouter(prefix="/history", tags=["History & Statistics"], route_class=TimedRoute)
 
 @router.get("/", response_model=CalculationHistory)
 def get_history(
+    request: Request,
     limit: int = 50,
+    after: Optional[str] = None,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get calculation history for current user"""
-    calculations = db.query(Calculation).filter(
-        Calculation.user_id == current_user.id
-    ).order_by(Calculation.created_at.desc()).limit(limit).all()
+    """Get calculation history for current user, newest first.
     
-    return {
-        "total_calculations": len(calculations),
-        "calculations": calculations
+    Carries an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    # Read before the data: a write in between can only make the tag stale, not too new
+    etag = user_etag(current_user.id, UserStatsService.get_version(db, current_user.id))
+    if etag and etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    
+    # Plain column tuples, encoded without per-row validation
+    query = db.query(*CALCULATION_ROW).filter(Calculation.user_id == current_user.id)
+    try:
+        rows = paginate(query, after, limit, descending=True).all()
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    
+    response = calculation_history_response(rows, next_cursor(rows, limit))
+    if etag:
+        response.headers.update(etag_headers(etag))
+    return response
+
+@router.get("/export", response_class=StreamingResponse)
+def export_history(
+    request: Request,
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Stream the current user's whole history, oldest first, as NDJSON or CSV.
+    
+    Rows come from a server-side cursor EXPORT_CHUNK_ROWS at a time and are
+    encoded chunk by chunk, so memory stays flat however long the history is.
+    The body is gzipped on the fly when the client accepts it.
+    """
+    query = (
+        select(*CALCULATION_ROW)
+        .where(Calculation.user_id == current_user.id)
+        .order_by(Calculation.created_at.asc(), Calculation.id.asc())
+        .execution_options(yield_per=settings.EXPORT_CHUNK_ROWS)
+    )
+    # The body streams after the request's dependencies may have been torn
+    # down, so it reads through a session of its own on the same database
+    bind = db.get_bind()
+    db.close()
+    
+    def partitions():
+        export_db = SessionLocal(bind=bind)
+        try:
+            yield from export_db.execute(query).partitions()
+        finally:
+            export_db.close()
+    
+    partitions = partitions()
+    chunks = csv_chunks(partitions) if format == "csv" else ndjson_chunks(partitions)
+    
+    headers = {
+        "Content-Disposition": f'attachment; filename="calculations.{format}"',
+        "Vary": "Accept-Encoding",
     }
+    if accepts_gzip(request.headers.get("accept-encoding")):
+        chunks = gzip_chunks(chunks)
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(chunks, media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
+
+@router.post("/stream/ticket", response_model=StreamTicket)
+def stream_ticket(current_user: User = Depends(get_current_user)):
+    """A short-lived ticket for ``GET /history/stream?ticket=``; nothing else accepts it"""
+    return StreamTicket(ticket=create_stream_ticket(current_user), expires_in=settings.STREAM_TICKET_TTL_SECONDS)
+
+@router.get("/stream", response_class=StreamingResponse)
+async def stream_history(
+    current_user: User = Depends(get_stream_user),
+    db: Session = Depends(get_db)
+):
+    """Server-Sent Events for the current user's calculations as they change.
+    
+    Events are ``created`` ({"calculations": [...]}), ``deleted`` ({"ids": [...]}),
+    ``cleared`` and ``resync`` (refetch: too many changes, or the stream fell
+    behind). Nothing is replayed: the first event, ``ready``, is sent once
+    the stream is subscribed, and clients refetch when they get it.
+    EventSource, which cannot send the token, passes a ticket as ``?ticket=``.
+    """
+    # Don't hold a pooled connection for the life of the stream
+    db.close()
+    user_id = current_user.id
+    
+    async def frames():
+        subscription = event_hub.subscribe(user_id)
+        try:
+            # Reconnect delay, then "ready": events from here on will arrive,
+            # so it is the moment for the client to (re)fetch
+            yield b"retry: 3000\n\n" + READY_FRAME
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscription.get(), settings.EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+        finally:
+            event_hub.unsubscribe(subscription)
+    
+    return StreamingResponse(
+        frames(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/statistics", response_model=CalculationStatistics)
 def get_statistics(
+    request: Request,
+    response: Response,
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get statistics for current user's calculations"""
-    stats = CalculationService.get_user_statistics(db, current_user.id)
+    """Get statistics for current user's calculations.
+    
+    Carries an ETag; a matching If-None-Match gets 304 Not Modified.
+    """
+    etag = user_etag(current_user.id, UserStatsService.get_version(db, current_user.id))
+    if etag:
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return not_modified(etag)
+        response.headers.update(etag_headers(etag))
+    stats = UserStatsService.get_statistics(db, current_user.id)
     return stats
 
+@router.get("/statistics/timeseries", response_model=CalculationTimeseries)
+def get_statistics_timeseries(
+    bucket: Literal["hour", "day"] = "day",
+    start: Optional[datetime] = Query(None, alias="from"),
+    end: Optional[datetime] = Query(None, alias="to"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Calculations made per UTC hour or day, by operation, with their average result.
+    
+    ``to`` defaults to now and ``from`` to 30 buckets before it; naive times
+    are UTC. Every bucket in the range is listed, empty ones included. Counts
+    record usage, so deleted calculations still count. Hourly buckets are
+    kept for USAGE_HOURLY_RETENTION_DAYS.
+    """
+    step = USAGE_RESOLUTIONS[bucket]
+    end = naive_utc(end) if end is not None else datetime.utcnow()
+    start = naive_utc(start) if start is not None else end - 30 * step
+    if start >= end:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="from must be before to")
+    if (end - start) / step > settings.TIMESERIES_MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Range spans more than {settings.TIMESERIES_MAX_BUCKETS} buckets; use a wider bucket or a shorter range"
+        )
+    
+    return {
+        "bucket": bucket,
+        "start": start,
+        "end": end,
+        "buckets": UsageService.timeseries(db, current_user.id, bucket, start, end),
+    }
+
 @router.delete("/", status_code=status.HTTP_204_NO_CONTENT)
 def clear_history(
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """Clear all calculation history for current user"""
-    db.query(Calculation).filter(
-        Calculation.user_id == current_user.id
-    ).delete()
+    CalculationService.clear_history(db, current_user.id)
     db.commit()
+    publish_cleared(current_user.id)
     return None
@@ -1,6 +1,10 @@
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, EmailStr, Field, validator, model_validator
 from datetime import datetime
-from typing import Optional, List
+from typing import Optional, List, Annotated, Dict
+from app.config import settings
+
+OPERATION_PATTERN = "^(add|subtract|multiply|divide)$"
+VECTOR_OPERATION_PATTERN = "^(add|subtract|multiply|divide|dot)$"
 
 # User Schemas
 class UserBase(BaseModel):
@@ -26,12 +30,16 @@ class Token(BaseModel):
     access_token: str
     token_type: str
 
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int
+
 class TokenData(BaseModel):
     username: Optional[str] = None
 
 # Calculation Schemas
 class CalculationBase(BaseModel):
-    operation: str = Field(..., pattern="^(add|subtract|multiply|divide)$")
+    operation: str = Field(..., pattern=OPERATION_PATTERN)
     operand1: float
     operand2: float
     
@@ -44,20 +52,117 @@ class CalculationBase(BaseModel):
 class CalculationCreate(CalculationBase):
     pass
 
+class CalculationExpressionCreate(BaseModel):
+    expression: str = Field(..., min_length=1, max_length=500)
+    variables: Dict[str, float] = Field(default_factory=dict)
+
 class CalculationResponse(CalculationBase):
+    # Also "expression", whose rows have no operands
+    operation: str
+    operand1: Optional[float]
+    operand2: Optional[float]
     id: int
     result: float
     created_at: datetime
     user_id: int
+    expression: Optional[str] = None
+    variables: Optional[Dict[str, float]] = None
     
     class Config:
         from_attributes = True
 
+class CalculationVectorCreate(BaseModel):
+    """Operands as base64 of little-endian float64 bytes"""
+    operation: str = Field(..., pattern=VECTOR_OPERATION_PATTERN)
+    operand1: str
+    operand2: str
+
+class CalculationVectorResponse(CalculationResponse):
+    length: int
+    # base64 little-endian float64; None for dot products
+    vector_result: Optional[str] = None
+
+# Batch Schemas
+class CalculationBatchItem(BaseModel):
+    operation: str = Field(..., pattern=OPERATION_PATTERN)
+    operand1: float
+    operand2: float
+
+class CalculationBatchCreate(BaseModel):
+    """A batch given either as ``items`` or as three equal-length columns"""
+    items: Optional[List[CalculationBatchItem]] = None
+    operations: Optional[List[Annotated[str, Field(pattern=OPERATION_PATTERN)]]] = None
+    operand1: Optional[List[float]] = None
+    operand2: Optional[List[float]] = None
+    
+    @model_validator(mode="after")
+    def check_shape(self):
+        columns = (self.operations, self.operand1, self.operand2)
+        if self.items is not None:
+            if any(column is not None for column in columns):
+                raise ValueError("Provide either items or columns, not both")
+            size = len(self.items)
+        else:
+            if any(column is None for column in columns):
+                raise ValueError("Provide items, or operations, operand1 and operand2")
+            size = len(self.operations)
+            if len(self.operand1) != size or len(self.operand2) != size:
+                raise ValueError("operations, operand1 and operand2 must have the same length")
+        if size > settings.BATCH_MAX_ITEMS:
+            raise ValueError(f"Batch exceeds {settings.BATCH_MAX_ITEMS} items")
+        return self
+    
+    def columns(self):
+        """The batch as (operations, operand1, operand2) lists"""
+        if self.items is None:
+            return self.operations, self.operand1, self.operand2
+        return (
+            [item.operation for item in self.items],
+            [item.operand1 for item in self.items],
+            [item.operand2 for item in self.items],
+        )
+
+class CalculationBatchError(BaseModel):
+    index: int
+    detail: str
+
+class CalculationBatchResponse(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    ids: List[Optional[int]]
+    results: List[Optional[float]]
+    errors: List[CalculationBatchError]
+
+class CalculationImportError(BaseModel):
+    line: int
+    detail: str
+
+class CalculationImportResponse(BaseModel):
+    total: int
+    accepted: int
+    rejected: int
+    errors: List[CalculationImportError]
+    errors_truncated: bool = False
+
 # History & Statistics Schemas
 class CalculationHistory(BaseModel):
     total_calculations: int
     calculations: List[CalculationResponse]
+    next_cursor: Optional[str] = None
     
+class CalculationTimeseriesBucket(BaseModel):
+    start: datetime
+    count: int
+    operations_count: Dict[str, int]
+    average_result: Optional[float]
+
+class CalculationTimeseries(BaseModel):
+    bucket: str
+    start: datetime
+    end: datetime
+    buckets: List[CalculationTimeseriesBucket]
+
 class CalculationStatistics(BaseModel):
     total_calculations: int
     operations_count: dict
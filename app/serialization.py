@@ -0,0 +1,104 @@
+"""Fast JSON responses for calculation lists.
+
+List endpoints select plain column tuples instead of ORM objects and encode
+them with orjson, skipping the per-row ``from_attributes`` validation that
+``response_model`` would run. Keys follow CalculationResponse's field order and
+orjson writes naive datetimes in the same ISO format as Pydantic's JSON mode,
+so clients get the same JSON values as before. Routes keep their
+``response_model`` for the OpenAPI schema.
+"""
+import csv
+import io
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence
+import orjson
+from fastapi.responses import ORJSONResponse
+from app.models import Calculation
+from app.schemas import CalculationResponse
+
+CALCULATION_FIELDS = tuple(CalculationResponse.model_fields)
+
+# Columns to select, in response field order: db.query(*CALCULATION_ROW) / select(*CALCULATION_ROW)
+CALCULATION_ROW = tuple(getattr(Calculation, field) for field in CALCULATION_FIELDS)
+
+
+def calculation_dicts(rows: Sequence[tuple]) -> List[Dict]:
+    """CALCULATION_ROW tuples as CalculationResponse-shaped dicts"""
+    return [dict(zip(CALCULATION_FIELDS, row)) for row in rows]
+
+
+def calculation_list_response(rows: Sequence[tuple], next_cursor: Optional[str] = None) -> ORJSONResponse:
+    """Body of GET /calculations/: a bare list, with the cursor in X-Next-Cursor"""
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(calculation_dicts(rows), headers=headers)
+
+
+def calculation_history_response(rows: Sequence[tuple], next_cursor: Optional[str] = None) -> ORJSONResponse:
+    """Body of GET /history/ (CalculationHistory)"""
+    return ORJSONResponse({
+        "total_calculations": len(rows),
+        "calculations": calculation_dicts(rows),
+        "next_cursor": next_cursor,
+    })
+
+
+# Streaming export: each partition is a list of CALCULATION_ROW tuples
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def ndjson_chunks(partitions: Iterable[Sequence[tuple]]) -> Iterator[bytes]:
+    """One JSON object per line, one chunk per partition"""
+    for rows in partitions:
+        yield b"".join(orjson.dumps(dict(zip(CALCULATION_FIELDS, row))) + b"\n" for row in rows)
+
+
+def csv_chunks(partitions: Iterable[Sequence[tuple]]) -> Iterator[bytes]:
+    """A header line, then one chunk per partition"""
+    created_at = CALCULATION_FIELDS.index("created_at")
+    variables = CALCULATION_FIELDS.index("variables")
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def drain() -> bytes:
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+        return data
+
+    writer.writerow(CALCULATION_FIELDS)
+    yield drain()
+    for rows in partitions:
+        for row in rows:
+            row = list(row)
+            # Same timestamp format as the JSON endpoints
+            row[created_at] = row[created_at].isoformat()
+            if row[variables] is not None:
+                row[variables] = orjson.dumps(row[variables]).decode("utf-8")
+            writer.writerow(row)
+        yield drain()
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Gzip a chunk stream on the fly, flushing per chunk so bytes go out straight away"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+def accepts_gzip(accept_encoding: Optional[str]) -> bool:
+    """Whether an Accept-Encoding header allows a gzip response"""
+    for coding in (accept_encoding or "").split(","):
+        name, _, params = coding.strip().partition(";")
+        if name.strip().lower() in ("gzip", "*"):
+            quality = params.strip()
+            if quality.startswith("q="):
+                try:
+                    return float(quality[2:]) > 0
+                except ValueError:
+                    return False
+            return True
+    return False
@@ -1,68 +1,812 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import func
-from app.models import Calculation
-from typing import List, Dict, Optional
+from sqlalchemy import func, case, or_, insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from app.models import Calculation, CalculationVector, User, UserStats, UserOperationStats, UsageBucket
+from app.expressions import evaluate_expression
+from typing import List, Dict, Optional, Sequence, Tuple
+from datetime import datetime, timedelta, timezone
+import math
+import numpy as np
+
+OPERATIONS = {
+    "add": lambda x, y: x + y,
+    "subtract": lambda x, y: x - y,
+    "multiply": lambda x, y: x * y,
+    "divide": lambda x, y: x / y if y != 0 else None
+}
+
+# Elementwise versions of the supported operations
+VECTOR_OPERATIONS = {
+    "add": np.add,
+    "subtract": np.subtract,
+    "multiply": np.multiply,
+    "divide": np.divide,
+}
+
+# Columns returned from bulk inserts; rows carry the same attributes as Calculation
+CALCULATION_COLUMNS = (
+    Calculation.id,
+    Calculation.user_id,
+    Calculation.operation,
+    Calculation.operand1,
+    Calculation.operand2,
+    Calculation.result,
+    Calculation.created_at,
+    Calculation.expression,
+    Calculation.variables,
+)
+
+
+# Operation stored for calculations made from a formula; they have no operands
+EXPRESSION_OPERATION = "expression"
+
+# Vector operation -> operation stored on the calculation. Vector calculations
+# keep their arrays in calculation_vectors and have no scalar operands
+VECTOR_OPERATION_NAMES = {
+    "add": "vector_add",
+    "subtract": "vector_subtract",
+    "multiply": "vector_multiply",
+    "divide": "vector_divide",
+    "dot": "dot",
+}
+
+# Left out of the operand averages
+OPERANDLESS_OPERATIONS = frozenset({EXPRESSION_OPERATION, *VECTOR_OPERATION_NAMES.values()})
+
+
+def _fsum(values) -> float:
+    """math.fsum skipping NULLs (expressions have no operands)"""
+    return math.fsum(value for value in values if value is not None)
+
+
+def _round(value: Optional[float]) -> Optional[float]:
+    return None if value is None else round(value, 2)
+
+
+def _calculate(operation: str, operand1: float, operand2: float) -> float:
+    result = OPERATIONS[operation](operand1, operand2)
+    if result is None:
+        raise ValueError("Cannot divide by zero")
+    return result
+
+
+def _result_key(operation: str, operand1, operand2) -> Optional[str]:
+    """Cache key for a calculation, or None if it should not be cached.
+    
+    float.hex() keeps -0.0 apart from 0.0 and gives NaN and inf stable keys,
+    which == and hash() do not. Non-float operands (e.g. large ints) are not
+    cached, since converting them could merge distinct values.
+    """
+    if type(operand1) is not float or type(operand2) is not float:
+        return None
+    return f"{operation}:{operand1.hex()}:{operand2.hex()}"
+
+
+def _empty_statistics() -> Dict:
+    return {
+        "total_calculations": 0,
+        "operations_count": {},
+        "average_operand1": None,
+        "average_operand2": None,
+        "average_result": None,
+        "most_used_operation": None,
+        "latest_calculation": None
+    }
+
+
+def _group_by_user(calculations: Sequence) -> Dict[int, List]:
+    groups = {}
+    for calc in calculations:
+        groups.setdefault(calc.user_id, []).append(calc)
+    return groups
+
+
+def _upsert_dialect(db: Session):
+    """sqlalchemy.dialects module with INSERT ... ON CONFLICT for the session's database, if any"""
+    return {"sqlite": sqlite, "postgresql": postgresql}.get(db.get_bind().dialect.name)
+
+
+def _insert_or_increment(db: Session, model, values: Dict, increments: Optional[Dict]) -> None:
+    """Insert a row, or if another transaction got there first apply ``increments`` to it (if any)"""
+    dialect = _upsert_dialect(db)
+    if dialect is None:
+        db.add(model(**values))
+        return
+    table = model.__table__
+    statement = dialect.insert(table).values(**values)
+    index_elements = [column.name for column in table.primary_key]
+    if increments:
+        statement = statement.on_conflict_do_update(index_elements=index_elements, set_=increments)
+    else:
+        statement = statement.on_conflict_do_nothing(index_elements=index_elements)
+    db.execute(statement)
+
+
+def _rollup_increments(calcs: Sequence) -> Tuple[Dict, Dict[str, Dict]]:
+    """SET values adding one user's new calculations to their user_stats row and,
+    by operation, to their user_operation_stats rows
+    """
+    stats = UserStats.__table__
+    op_stats = UserOperationStats.__table__
+    latest = max(calcs, key=lambda c: (c.created_at, -c.id))
+    newer = or_(
+        stats.c.latest_created_at.is_(None),
+        stats.c.latest_created_at < latest.created_at
+    )
+    increments = {
+        "total_calculations": stats.c.total_calculations + len(calcs),
+        "version": stats.c.version + 1,
+        "sum_operand1": stats.c.sum_operand1 + _fsum(c.operand1 for c in calcs),
+        "sum_operand2": stats.c.sum_operand2 + _fsum(c.operand2 for c in calcs),
+        "sum_result": stats.c.sum_result + math.fsum(c.result for c in calcs),
+        "latest_calculation_id": case((newer, latest.id), else_=stats.c.latest_calculation_id),
+        "latest_created_at": case((newer, latest.created_at), else_=stats.c.latest_created_at),
+    }
+    operations = {}
+    for calc in calcs:
+        count, first_id = operations.get(calc.operation, (0, calc.id))
+        operations[calc.operation] = (count + 1, min(first_id, calc.id))
+    operation_increments = {
+        operation: {
+            "count": op_stats.c.count + count,
+            "first_calculation_id": case(
+                (or_(
+                    op_stats.c.first_calculation_id.is_(None),
+                    op_stats.c.first_calculation_id > first_id
+                ), first_id),
+                else_=op_stats.c.first_calculation_id
+            ),
+        }
+        for operation, (count, first_id) in operations.items()
+    }
+    return increments, operation_increments
+
+
+def _latest_calculation(db: Session, user_id: int) -> Optional[Calculation]:
+    return db.query(Calculation).filter(
+        Calculation.user_id == user_id
+    ).order_by(Calculation.created_at.desc(), Calculation.id.asc()).first()
 
 class CalculationService:
+    # Set while write-behind mode hands out ids ahead of insert; every insert
+    # path must then take its ids from it so they cannot collide
+    id_allocator = None
+    # ResultCache memoizing perform_calculation (RESULT_CACHE_ENABLED)
+    result_cache = None
+    
     @staticmethod
     def perform_calculation(operation: str, operand1: float, operand2: float) -> float:
         """Perform the calculation based on operation"""
-        operations = {
-            "add": lambda x, y: x + y,
-            "subtract": lambda x, y: x - y,
-            "multiply": lambda x, y: x * y,
-            "divide": lambda x, y: x / y if y != 0 else None
-        }
-        
-        if operation not in operations:
+        if operation not in OPERATIONS:
             raise ValueError(f"Invalid operation: {operation}")
         
-        result = operations[operation](operand1, operand2)
-        if result is None:
-            raise ValueError("Cannot divide by zero")
+        cache = CalculationService.result_cache
+        key = _result_key(operation, operand1, operand2) if cache is not None else None
+        if key is None:
+            return _calculate(operation, operand1, operand2)
+        return cache.get_or_compute(key, lambda: _calculate(operation, operand1, operand2))
+    
+    @staticmethod
+    def perform_batch(
+        operations: Sequence[str],
+        operand1: Sequence[float],
+        operand2: Sequence[float]
+    ) -> Tuple[np.ndarray, Dict[int, str]]:
+        """Vectorized perform_calculation.
+        
+        Returns the float64 results and a mapping of failed index -> error message.
+        Failed slots in the result array are NaN.
+        """
+        ops = np.asarray(operations)
+        a = np.asarray(operand1, dtype=np.float64)
+        b = np.asarray(operand2, dtype=np.float64)
+        results = np.full(a.shape, np.nan)
+        errors = {}
         
-        return result
+        known = np.zeros(a.shape, dtype=bool)
+        with np.errstate(all="ignore"):
+            for name, ufunc in VECTOR_OPERATIONS.items():
+                mask = ops == name
+                known |= mask
+                results[mask] = ufunc(a[mask], b[mask])
+        
+        for index in np.flatnonzero(~known):
+            errors[int(index)] = f"Invalid operation: {ops[index]}"
+        for index in np.flatnonzero((ops == "divide") & (b == 0)):
+            errors[int(index)] = "Cannot divide by zero"
+        for index in np.flatnonzero(known & ~np.isfinite(results)):
+            errors.setdefault(int(index), "Result is not a finite number")
+        if errors:
+            results[list(errors)] = np.nan
+        return results, errors
+    
+    @staticmethod
+    def perform_expression(expression: str, variables: Dict[str, float]) -> float:
+        """Evaluate a formula such as "(a+b)*c/d"; compiled forms are cached by text"""
+        return evaluate_expression(expression, variables)
+    
+    @staticmethod
+    def perform_vector(
+        operation: str,
+        operand1: np.ndarray,
+        operand2: np.ndarray
+    ) -> Tuple[Optional[np.ndarray], float]:
+        """Elementwise operation or dot product of two equal-length float64 arrays.
+        
+        Returns the result array (None for "dot") and the scalar stored as the
+        calculation's result: the dot product, or the sum of the elements.
+        """
+        if operation not in VECTOR_OPERATION_NAMES:
+            raise ValueError(f"Invalid operation: {operation}")
+        if operand1.shape != operand2.shape:
+            raise ValueError("Vectors must have the same length")
+        with np.errstate(all="ignore"):
+            if operation == "dot":
+                values = None
+                result = float(np.dot(operand1, operand2))
+            else:
+                if operation == "divide" and not operand2.all():
+                    raise ValueError("Cannot divide by zero")
+                values = VECTOR_OPERATIONS[operation](operand1, operand2)
+                if not np.isfinite(values).all():
+                    raise ValueError("Result is not a finite number")
+                result = float(values.sum())
+        if not math.isfinite(result):
+            raise ValueError("Result is not a finite number")
+        return values, result
     
     @staticmethod
     def get_user_statistics(db: Session, user_id: int) -> Dict:
         """Calculate statistics for a user's calculations"""
-        calculations = db.query(Calculation).filter(
-            Calculation.user_id == user_id
-        ).all()
-        
-        if not calculations:
-            return {
-                "total_calculations": 0,
-                "operations_count": {},
-                "average_operand1": None,
-                "average_operand2": None,
-                "average_result": None,
-                "most_used_operation": None,
-                "latest_calculation": None
-            }
+        # Totals and averages in a single aggregate query
+        total, avg_operand1, avg_operand2, avg_result = db.query(
+            func.count(Calculation.id),
+            func.avg(Calculation.operand1),
+            func.avg(Calculation.operand2),
+            func.avg(Calculation.result)
+        ).filter(Calculation.user_id == user_id).one()
         
-        # Count operations
-        operations_count = {}
-        for calc in calculations:
-            operations_count[calc.operation] = operations_count.get(calc.operation, 0) + 1
+        if not total:
+            return _empty_statistics()
         
-        # Calculate averages
-        avg_operand1 = sum(c.operand1 for c in calculations) / len(calculations)
-        avg_operand2 = sum(c.operand2 for c in calculations) / len(calculations)
-        avg_result = sum(c.result for c in calculations) / len(calculations)
+        # Count operations; min(id) keeps ties resolved by first use
+        operation_rows = db.query(
+            Calculation.operation,
+            func.count(Calculation.id),
+            func.min(Calculation.id)
+        ).filter(
+            Calculation.user_id == user_id
+        ).group_by(Calculation.operation).all()
+        operations_count = {operation: count for operation, count, _ in operation_rows}
         
         # Most used operation
-        most_used = max(operations_count.items(), key=lambda x: x[1])[0] if operations_count else None
+        most_used = min(operation_rows, key=lambda row: (-row[1], row[2]))[0]
         
         # Latest calculation
-        latest = max(calculations, key=lambda x: x.created_at)
+        latest = _latest_calculation(db, user_id)
         
         return {
-            "total_calculations": len(calculations),
+            "total_calculations": total,
             "operations_count": operations_count,
-            "average_operand1": round(avg_operand1, 2),
-            "average_operand2": round(avg_operand2, 2),
-            "average_result": round(avg_result, 2),
+            "average_operand1": _round(avg_operand1),
+            "average_operand2": _round(avg_operand2),
+            "average_result": _round(avg_result),
             "most_used_operation": most_used,
             "latest_calculation": latest
         }
+    
+    @staticmethod
+    def save_calculations(db: Session, calculations: List[Calculation]) -> List[Calculation]:
+        """Stage new calculations and update the statistics rollup (caller commits)"""
+        allocator = CalculationService.id_allocator
+        if allocator is not None:
+            for calc in calculations:
+                if calc.id is None:
+                    calc.id = allocator.next_id()
+        db.add_all(calculations)
+        db.flush()
+        UserStatsService.record_created(db, calculations)
+        UsageService.record(db, calculations)
+        return calculations
+    
+    @staticmethod
+    def bulk_insert(db: Session, rows: List[Dict]) -> List:
+        """Insert calculation rows with one executemany and update the rollup (caller commits).
+        
+        Returns rows carrying the inserted columns, ids included, in input order.
+        """
+        if not rows:
+            return []
+        created_at = datetime.utcnow()
+        allocator = CalculationService.id_allocator
+        for row in rows:
+            row.setdefault("created_at", created_at)
+            if allocator is not None and row.get("id") is None:
+                row["id"] = allocator.next_id()
+        inserted = db.execute(
+            insert(Calculation).returning(*CALCULATION_COLUMNS, sort_by_parameter_order=True),
+            rows
+        ).all()
+        UserStatsService.record_created(db, inserted)
+        UsageService.record(db, inserted)
+        return inserted
+    
+    @staticmethod
+    def import_records(db: Session, user_id: int, records: Sequence[Dict]) -> Dict[int, str]:
+        """Evaluate imported records and stage the valid ones with bulk_insert (caller commits).
+        
+        Records have operation, operand1 and operand2; a given ``result`` must match
+        the recomputed one and a given ``created_at`` is kept. Returns a mapping of
+        rejected index -> error message.
+        """
+        results, errors = CalculationService.perform_batch(
+            [record["operation"] for record in records],
+            [record["operand1"] for record in records],
+            [record["operand2"] for record in records]
+        )
+        rows = []
+        for i, (record, value) in enumerate(zip(records, results.tolist())):
+            if i in errors:
+                continue
+            expected = record.get("result")
+            if expected is not None and not math.isclose(expected, value, rel_tol=1e-9, abs_tol=1e-12):
+                errors[i] = f"Result {expected} does not match computed {value}"
+                continue
+            row = {
+                "user_id": user_id,
+                "operation": record["operation"],
+                "operand1": record["operand1"],
+                "operand2": record["operand2"],
+                "result": value,
+            }
+            if record.get("created_at") is not None:
+                row["created_at"] = record["created_at"]
+            rows.append(row)
+        CalculationService.bulk_insert(db, rows)
+        return errors
+    
+    @staticmethod
+    def delete_calculation(db: Session, calculation: Calculation) -> None:
+        """Stage a calculation delete and update the statistics rollup (caller commits)"""
+        db.delete(calculation)
+        db.flush()
+        UserStatsService.record_deleted(db, [calculation])
+    
+    @staticmethod
+    def clear_history(db: Session, user_id: int) -> int:
+        """Stage deleting all of a user's calculations (caller commits)"""
+        # Bulk deletes skip ORM cascades, so the vector rows go first
+        db.query(CalculationVector).filter(
+            CalculationVector.calculation_id.in_(
+                db.query(Calculation.id).filter(Calculation.user_id == user_id)
+            )
+        ).delete(synchronize_session=False)
+        deleted = db.query(Calculation).filter(
+            Calculation.user_id == user_id
+        ).delete()
+        UserStatsService.reset(db, user_id)
+        return deleted
+
+
+class UserStatsService:
+    """Maintains the user_stats / user_operation_stats rollup.
+    
+    Every write path updates the rollup in the same transaction as the
+    calculations it touches, so reading statistics is a primary-key lookup
+    instead of a scan of the user's history.
+    """
+    
+    @staticmethod
+    def record_created(db: Session, calculations: Sequence) -> None:
+        """Add flushed calculations (or rows with the same attributes) to the running totals"""
+        for user_id, calcs in _group_by_user(calculations).items():
+            increments, operation_increments = _rollup_increments(calcs)
+            updated = db.query(UserStats).filter(UserStats.user_id == user_id).update(
+                increments, synchronize_session=False
+            )
+            if not updated:
+                UserStatsService._insert_counted(db, user_id, increments, operation_increments)
+                continue
+            for operation, values in operation_increments.items():
+                updated = db.query(UserOperationStats).filter(
+                    UserOperationStats.user_id == user_id,
+                    UserOperationStats.operation == operation
+                ).update(values, synchronize_session=False)
+                if not updated:
+                    # Counted from the table for the same reason as in _insert_counted
+                    count, first_id = db.query(func.count(Calculation.id), func.min(Calculation.id)).filter(
+                        Calculation.user_id == user_id,
+                        Calculation.operation == operation
+                    ).one()
+                    _insert_or_increment(db, UserOperationStats, {
+                        "user_id": user_id,
+                        "operation": operation,
+                        "count": count,
+                        "first_calculation_id": first_id,
+                    }, values)
+            db.flush()
+    
+    @staticmethod
+    def _insert_counted(db: Session, user_id: int, increments: Dict, operation_increments: Dict) -> None:
+        """Create a user's missing rollup rows from everything stored, the new calculations included.
+        
+        The user may have history from before the rollup. Should a concurrent
+        transaction create the rows first, only this one's increments are applied.
+        """
+        if _upsert_dialect(db) is None:
+            UserStatsService.rebuild(db, user_id)
+            return
+        expected = UserStatsService.compute_expected(db, user_id)[user_id]
+        operations = expected.pop("operations")
+        _insert_or_increment(db, UserStats, {"user_id": user_id, "version": 1, **expected}, increments)
+        for operation, (count, first_id) in operations.items():
+            _insert_or_increment(db, UserOperationStats, {
+                "user_id": user_id,
+                "operation": operation,
+                "count": count,
+                "first_calculation_id": first_id,
+            }, operation_increments.get(operation))
+        db.flush()
+    
+    @staticmethod
+    def record_deleted(db: Session, calculations: List[Calculation]) -> None:
+        """Remove deleted calculations from their users' running totals"""
+        for user_id, calcs in _group_by_user(calculations).items():
+            deleted_ids = {c.id for c in calcs}
+            # Sums are recounted rather than decremented: subtracting a large
+            # value from a float sum loses the small ones it absorbed
+            total, sum1, sum2, sum_result = db.query(
+                func.count(Calculation.id),
+                func.coalesce(func.sum(Calculation.operand1), 0.0),
+                func.coalesce(func.sum(Calculation.operand2), 0.0),
+                func.coalesce(func.sum(Calculation.result), 0.0)
+            ).filter(Calculation.user_id == user_id).one()
+            updated = db.query(UserStats).filter(UserStats.user_id == user_id).update({
+                UserStats.total_calculations: total,
+                UserStats.version: UserStats.version + 1,
+                UserStats.sum_operand1: sum1,
+                UserStats.sum_operand2: sum2,
+                UserStats.sum_result: sum_result,
+            }, synchronize_session=False)
+            if not updated:
+                # No rollup row: statistics come from the calculations table until
+                # the user's next calculation builds one
+                continue
+            if not total:
+                UserStatsService.reset(db, user_id)
+                continue
+            latest_id = db.query(UserStats.latest_calculation_id).filter(UserStats.user_id == user_id).scalar()
+            if latest_id in deleted_ids:
+                latest = _latest_calculation(db, user_id)
+                db.query(UserStats).filter(UserStats.user_id == user_id).update({
+                    UserStats.latest_calculation_id: latest.id,
+                    UserStats.latest_created_at: latest.created_at,
+                }, synchronize_session=False)
+            
+            operations = {}
+            for calc in calcs:
+                operations[calc.operation] = operations.get(calc.operation, 0) + 1
+            for operation, count in operations.items():
+                op_filter = (
+                    UserOperationStats.user_id == user_id,
+                    UserOperationStats.operation == operation
+                )
+                db.query(UserOperationStats).filter(*op_filter).update({
+                    UserOperationStats.count: UserOperationStats.count - count
+                }, synchronize_session=False)
+                first_id = db.query(UserOperationStats.first_calculation_id).filter(*op_filter).scalar()
+                if first_id in deleted_ids:
+                    first_id = db.query(func.min(Calculation.id)).filter(
+                        Calculation.user_id == user_id,
+                        Calculation.operation == operation
+                    ).scalar()
+                    db.query(UserOperationStats).filter(*op_filter).update({
+                        UserOperationStats.first_calculation_id: first_id
+                    }, synchronize_session=False)
+    
+    @staticmethod
+    def reset(db: Session, user_id: int) -> None:
+        """Zero a user's running totals"""
+        db.query(UserOperationStats).filter(
+            UserOperationStats.user_id == user_id
+        ).delete()
+        db.query(UserStats).filter(UserStats.user_id == user_id).update({
+            UserStats.total_calculations: 0,
+            UserStats.sum_operand1: 0.0,
+            UserStats.sum_operand2: 0.0,
+            UserStats.sum_result: 0.0,
+            UserStats.latest_calculation_id: None,
+            UserStats.latest_created_at: None,
+            UserStats.version: UserStats.version + 1,
+        }, synchronize_session=False)
+    
+    @staticmethod
+    def get_version(db: Session, user_id: int) -> Optional[int]:
+        """A user's data version, or None if the rollup has no row for them yet"""
+        return db.query(UserStats.version).filter(UserStats.user_id == user_id).scalar()
+    
+    @staticmethod
+    def get_statistics(db: Session, user_id: int) -> Dict:
+        """Read a user's statistics from the rollup"""
+        stats = db.get(UserStats, user_id, populate_existing=True)
+        if stats is None:
+            # No rollup row yet (e.g. data from before the rollup existed)
+            return CalculationService.get_user_statistics(db, user_id)
+        if not stats.total_calculations:
+            return _empty_statistics()
+        
+        operation_rows = db.query(UserOperationStats).filter(
+            UserOperationStats.user_id == user_id,
+            UserOperationStats.count > 0
+        ).order_by(UserOperationStats.first_calculation_id).all()
+        operations_count = {row.operation: row.count for row in operation_rows}
+        most_used = min(operation_rows, key=lambda row: (-row.count, row.first_calculation_id))
+        
+        total = stats.total_calculations
+        # Operand averages only cover calculations that have operands
+        with_operands = total - sum(operations_count.get(op, 0) for op in OPERANDLESS_OPERATIONS)
+        return {
+            "total_calculations": total,
+            "operations_count": operations_count,
+            "average_operand1": _round(stats.sum_operand1 / with_operands) if with_operands else None,
+            "average_operand2": _round(stats.sum_operand2 / with_operands) if with_operands else None,
+            "average_result": round(stats.sum_result / total, 2),
+            "most_used_operation": most_used.operation,
+            "latest_calculation": db.get(Calculation, stats.latest_calculation_id)
+        }
+    
+    @staticmethod
+    def compute_expected(db: Session, user_id: Optional[int] = None) -> Dict[int, Dict]:
+        """Recompute the rollup contents from the calculations table"""
+        user_query = db.query(User.id)
+        totals_query = db.query(
+            Calculation.user_id,
+            func.count(Calculation.id),
+            func.coalesce(func.sum(Calculation.operand1), 0.0),
+            func.coalesce(func.sum(Calculation.operand2), 0.0),
+            func.sum(Calculation.result)
+        )
+        operations_query = db.query(
+            Calculation.user_id,
+            Calculation.operation,
+            func.count(Calculation.id),
+            func.min(Calculation.id)
+        )
+        if user_id is not None:
+            user_query = user_query.filter(User.id == user_id)
+            totals_query = totals_query.filter(Calculation.user_id == user_id)
+            operations_query = operations_query.filter(Calculation.user_id == user_id)
+        
+        expected = {
+            uid: {
+                "total_calculations": 0,
+                "sum_operand1": 0.0,
+                "sum_operand2": 0.0,
+                "sum_result": 0.0,
+                "latest_calculation_id": None,
+                "latest_created_at": None,
+                "operations": {}
+            }
+            for (uid,) in user_query
+        }
+        for uid, total, sum1, sum2, sum_result in totals_query.group_by(Calculation.user_id):
+            latest = _latest_calculation(db, uid)
+            expected.setdefault(uid, {"operations": {}}).update({
+                "total_calculations": total,
+                "sum_operand1": sum1,
+                "sum_operand2": sum2,
+                "sum_result": sum_result,
+                "latest_calculation_id": latest.id,
+                "latest_created_at": latest.created_at
+            })
+        for uid, operation, count, first_id in operations_query.group_by(
+            Calculation.user_id, Calculation.operation
+        ):
+            expected[uid]["operations"][operation] = (count, first_id)
+        return expected
+    
+    @staticmethod
+    def verify(db: Session, user_id: Optional[int] = None) -> List[str]:
+        """Compare the rollup with the calculations table and describe any drift"""
+        drift = []
+        for uid, exp in UserStatsService.compute_expected(db, user_id).items():
+            stats = db.get(UserStats, uid, populate_existing=True)
+            if stats is None:
+                if exp["total_calculations"]:
+                    drift.append(f"user {uid}: missing user_stats row")
+                continue
+            if stats.total_calculations != exp["total_calculations"]:
+                drift.append(
+                    f"user {uid}: total_calculations {stats.total_calculations} != {exp['total_calculations']}"
+                )
+            for column in ("sum_operand1", "sum_operand2", "sum_result"):
+                actual, wanted = getattr(stats, column), exp[column]
+                if not math.isclose(actual, wanted, rel_tol=1e-9, abs_tol=1e-6):
+                    drift.append(f"user {uid}: {column} {actual} != {wanted}")
+            if stats.latest_calculation_id != exp["latest_calculation_id"]:
+                drift.append(
+                    f"user {uid}: latest_calculation_id {stats.latest_calculation_id} != {exp['latest_calculation_id']}"
+                )
+            
+            actual_ops = {
+                row.operation: (row.count, row.first_calculation_id)
+                for row in db.query(UserOperationStats).filter(
+                    UserOperationStats.user_id == uid,
+                    UserOperationStats.count > 0
+                )
+            }
+            if actual_ops != exp["operations"]:
+                drift.append(f"user {uid}: operations {actual_ops} != {exp['operations']}")
+        return drift
+    
+    @staticmethod
+    def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+        """Replace the rollup with values recomputed from the calculations table (caller commits)"""
+        expected = UserStatsService.compute_expected(db, user_id)
+        # Carried over and bumped, so ETags handed out before the rebuild go stale
+        versions_query = db.query(UserStats.user_id, UserStats.version)
+        if user_id is not None:
+            versions_query = versions_query.filter(UserStats.user_id == user_id)
+        versions = dict(versions_query.all())
+        for model in (UserOperationStats, UserStats):
+            query = db.query(model)
+            if user_id is not None:
+                query = query.filter(model.user_id == user_id)
+            query.delete()
+        
+        for uid, exp in expected.items():
+            operations = exp.pop("operations")
+            db.add(UserStats(user_id=uid, version=versions.get(uid, 0) + 1, **exp))
+            for operation, (count, first_id) in operations.items():
+                db.add(UserOperationStats(
+                    user_id=uid,
+                    operation=operation,
+                    count=count,
+                    first_calculation_id=first_id
+                ))
+        db.flush()
+        return len(expected)
+
+
+# Bucket width of each usage resolution
+USAGE_RESOLUTIONS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+
+
+def bucket_start(moment: datetime, resolution: str) -> datetime:
+    """Start of the UTC hour or day containing ``moment``"""
+    moment = moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0) if resolution == "day" else moment
+
+
+def naive_utc(moment: datetime) -> datetime:
+    """Aware datetimes in UTC without tzinfo, as timestamps are stored; naive ones are taken as UTC"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+class UsageService:
+    """Maintains usage_buckets, the per-hour and per-day usage time series.
+    
+    Every insert path adds its calculations to both resolutions in the same
+    transaction, so a range query reads one row per bucket and operation
+    however many calculations it covers.
+    """
+    
+    @staticmethod
+    def record(db: Session, calculations: Sequence) -> None:
+        """Add flushed calculations (or rows with the same attributes) to their buckets"""
+        # Batches share one timestamp, so bucket each distinct timestamp once
+        moments = {}
+        for calc in calculations:
+            key = (calc.user_id, calc.created_at, calc.operation)
+            count, sum_result = moments.get(key, (0, 0.0))
+            moments[key] = (count + 1, sum_result + calc.result)
+        totals = {}
+        for (user_id, created_at, operation), (count, sum_result) in moments.items():
+            for resolution in USAGE_RESOLUTIONS:
+                key = (user_id, resolution, bucket_start(created_at, resolution), operation)
+                bucket_count, bucket_sum = totals.get(key, (0, 0.0))
+                totals[key] = (bucket_count + count, bucket_sum + sum_result)
+        if not totals:
+            return
+        rows = [
+            {
+                "user_id": user_id,
+                "resolution": resolution,
+                "bucket_start": start,
+                "operation": operation,
+                "count": count,
+                "sum_result": sum_result,
+            }
+            for (user_id, resolution, start, operation), (count, sum_result) in totals.items()
+        ]
+        
+        dialect = _upsert_dialect(db)
+        if dialect is not None:
+            # One executemany upsert, however many buckets a batch or import touches
+            table = UsageBucket.__table__
+            statement = dialect.insert(table)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[column.name for column in table.primary_key],
+                set_={
+                    "count": table.c.count + statement.excluded.count,
+                    "sum_result": table.c.sum_result + statement.excluded.sum_result,
+                }
+            ), rows)
+            return
+        for row in rows:
+            updated = db.query(UsageBucket).filter(
+                UsageBucket.user_id == row["user_id"],
+                UsageBucket.resolution == row["resolution"],
+                UsageBucket.bucket_start == row["bucket_start"],
+                UsageBucket.operation == row["operation"]
+            ).update({
+                UsageBucket.count: UsageBucket.count + row["count"],
+                UsageBucket.sum_result: UsageBucket.sum_result + row["sum_result"],
+            }, synchronize_session=False)
+            if not updated:
+                db.add(UsageBucket(**row))
+        db.flush()
+    
+    @staticmethod
+    def timeseries(db: Session, user_id: int, resolution: str, start: datetime, end: datetime) -> List[Dict]:
+        """Every bucket from the one containing ``start`` up to ``end`` (exclusive), empty ones included"""
+        first = bucket_start(start, resolution)
+        rows = db.query(
+            UsageBucket.bucket_start,
+            UsageBucket.operation,
+            UsageBucket.count,
+            UsageBucket.sum_result
+        ).filter(
+            UsageBucket.user_id == user_id,
+            UsageBucket.resolution == resolution,
+            UsageBucket.bucket_start >= first,
+            UsageBucket.bucket_start < end
+        ).order_by(UsageBucket.bucket_start, UsageBucket.operation).all()
+        
+        stored = {}
+        for start_at, operation, count, sum_result in rows:
+            stored.setdefault(start_at, []).append((operation, count, sum_result))
+        
+        buckets = []
+        moment, step = first, USAGE_RESOLUTIONS[resolution]
+        while moment < end:
+            entries = stored.get(moment, [])
+            count = sum(entry[1] for entry in entries)
+            buckets.append({
+                "start": moment,
+                "count": count,
+                "operations_count": {operation: n for operation, n, _ in entries},
+                "average_result": round(math.fsum(entry[2] for entry in entries) / count, 2) if count else None,
+            })
+            moment += step
+        return buckets
+    
+    @staticmethod
+    def prune(db: Session, before: datetime) -> int:
+        """Drop hourly buckets that start before ``before``; daily ones keep the history (caller commits)"""
+        return db.query(UsageBucket).filter(
+            UsageBucket.resolution == "hour",
+            UsageBucket.bucket_start < before
+        ).delete(synchronize_session=False)
+    
+    @staticmethod
+    def rebuild(db: Session, user_id: Optional[int] = None) -> int:
+        """Recount usage from the calculations still stored (caller commits).
+        
+        For data written before usage was tracked; deleted calculations are
+        no longer counted afterwards. Returns the number of buckets written.
+        """
+        buckets = db.query(UsageBucket)
+        rows = select(
+            Calculation.user_id, Calculation.operation, Calculation.result, Calculation.created_at
+        ).execution_options(yield_per=10000)
+        if user_id is not None:
+            buckets = buckets.filter(UsageBucket.user_id == user_id)
+            rows = rows.where(Calculation.user_id == user_id)
+        buckets.delete(synchronize_session=False)
+        
+        for partition in db.execute(rows).partitions():
+            UsageService.record(db, partition)
+        return buckets.count()
@@ -0,0 +1,210 @@
+"""State shared between worker processes: expiring keys, counters and pub/sub.
+
+Each worker process (see gunicorn.conf.py) has its own memory, so whatever one
+worker caches, counts or publishes is invisible to the others. Components that
+must agree across workers go through a SharedState instead:
+
+- MemoryState keeps everything in this process. It is the default, and all a
+  single worker needs.
+- RedisState speaks the Redis protocol, so Redis or any compatible server
+  (Valkey, KeyDB, Dragonfly, a local stand-in) can back it.
+
+``shared_state`` is the process-wide instance, chosen by SHARED_STATE_URL.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+Callback = Callable[[bytes], None]
+
+
+class SharedState:
+    """Operations every backend provides. Values and messages are bytes."""
+
+    # Whether other processes see this state; False for MemoryState
+    distributed = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Add to a counter and return the new value; ``ttl`` applies from its creation"""
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: bytes) -> None:
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        """Call ``callback`` (on a background thread) for each message; returns an unsubscribe function"""
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class MemoryState(SharedState):
+    """SharedState for a single process; expired keys are dropped on access and every 1000 writes"""
+
+    def __init__(self):
+        self._data: Dict[str, Tuple[object, Optional[float]]] = {}
+        self._subscribers: Dict[str, List[Callback]] = {}
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _live(self, key: str, now: float):
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            return None
+        return entry
+
+    def _store(self, key: str, value, expires_at: Optional[float], now: float) -> None:
+        self._data[key] = (value, expires_at)
+        self._writes += 1
+        if self._writes % 1000 == 0:
+            for stale in [k for k, (_, expires) in self._data.items() if expires is not None and expires <= now]:
+                del self._data[stale]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._live(key, time.monotonic())
+        if entry is None:
+            return None
+        value = entry[0]
+        return str(value).encode("ascii") if isinstance(value, int) else value
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._store(key, value, None if ttl is None else now + ttl, now)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is None:
+                value, expires_at = amount, None if ttl is None else now + ttl
+            else:
+                value, expires_at = int(entry[0]) + amount, entry[1]
+            self._store(key, value, expires_at, now)
+            return value
+
+    def publish(self, channel: str, message: bytes) -> None:
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Subscriber to %s failed", channel)
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                callbacks = self._subscribers.get(channel, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+        return unsubscribe
+
+
+class RedisState(SharedState):
+    """SharedState on a Redis-protocol server (needs the ``redis`` package).
+
+    Commands time out after ``timeout`` seconds so a slow server fails fast;
+    callers treat failures as they would a miss. Subscriptions share one
+    connection, read by a background thread. ``client`` (and
+    ``pubsub_client``, for subscriptions) replace the connections made from
+    ``url`` with any object offering the redis-py methods used here.
+    """
+
+    distributed = True
+
+    def __init__(self, url: Optional[str] = None, timeout: float = 0.1, client=None, pubsub_client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("SHARED_STATE_URL needs the redis package (pip install redis)")
+            client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+            # Blocking reads: no socket timeout on the subscriber connection
+            pubsub_client = redis.Redis.from_url(url)
+        self._client = client
+        self._pubsub_client = pubsub_client if pubsub_client is not None else client
+        self._pubsub = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: Optional[float] = None) -> None:
+        self._client.set(key, value, px=None if ttl is None else max(1, int(ttl * 1000)))
+
+    def delete(self, key: str) -> None:
+        self._client.delete(key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        pipeline = self._client.pipeline()
+        pipeline.incrby(key, amount)
+        if ttl is not None:
+            # NX: only a new counter gets an expiry (Redis 7+)
+            pipeline.pexpire(key, max(1, int(ttl * 1000)), nx=True)
+        return pipeline.execute()[0]
+
+    def publish(self, channel: str, message: bytes) -> None:
+        self._client.publish(channel, message)
+
+    def subscribe(self, channel: str, callback: Callback) -> Callable[[], None]:
+        with self._lock:
+            if self._pubsub is None:
+                self._pubsub = self._pubsub_client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{channel: lambda message: callback(message["data"])})
+            if self._thread is None:
+                self._thread = self._pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+        def unsubscribe():
+            with self._lock:
+                if self._pubsub is not None:
+                    self._pubsub.unsubscribe(channel)
+        return unsubscribe
+
+    def close(self) -> None:
+        with self._lock:
+            if self._thread is not None:
+                self._thread.stop()
+                self._thread = None
+            if self._pubsub is not None:
+                self._pubsub.close()
+                self._pubsub = None
+        self._client.close()
+        if self._pubsub_client is not self._client:
+            self._pubsub_client.close()
+
+
+def create_state(url: Optional[str]) -> SharedState:
+    """MemoryState for no URL or memory://, RedisState for redis://, rediss:// and unix://"""
+    if not url or url.startswith("memory://"):
+        return MemoryState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisState(url, timeout=settings.SHARED_STATE_TIMEOUT_MS / 1000)
+    raise ValueError(f"Unsupported SHARED_STATE_URL: {url}")
+
+
+shared_state = create_state(settings.SHARED_STATE_URL)
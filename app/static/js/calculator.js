@@ -26,6 +26,7 @@ async function performCalculation(operation, operand1, operand2) {
         
         if (response.ok) {
             displayResult(data.result);
+            // Even with the stream open: its events can be lost while it reconnects
             loadRecentCalculations();
         } else {
             showMessage(data.detail || 'Calculation failed', 'error');
@@ -44,12 +45,16 @@ function displayResult(result) {
 }
 
 // Load recent calculations
+const RECENT_LIMIT = 10;
+let recentCalculations = [];
+
 async function loadRecentCalculations() {
     try {
-        const response = await fetchWithAuth('/calculations/?limit=10');
+        const response = await fetchWithAuth(`/calculations/?limit=${RECENT_LIMIT}`);
         const data = await response.json();
         
         if (response.ok) {
+            recentCalculations = data;
             displayRecentCalculations(data);
         }
     } catch (error) {
@@ -68,7 +73,7 @@ function displayRecentCalculations(calculations) {
     container.innerHTML = calculations.map(calc => `
         <div class="calculation-item">
             <div class="calculation-info">
-                <strong>${calc.operand1} ${getOperationSymbol(calc.operation)} ${calc.operand2} = ${calc.result}</strong>
+                <strong>${formatCalculation(calc)} = ${calc.result}</strong>
                 <div class="calculation-time">${formatDate(calc.created_at)}</div>
             </div>
             <button class="btn btn-danger" onclick="deleteCalculation(${calc.id})">Delete</button>
@@ -76,6 +81,21 @@ function displayRecentCalculations(calculations) {
     `).join('');
 }
 
+function formatCalculation(calc) {
+    if (calc.expression) {
+        const bindings = Object.entries(calc.variables || {}).map(([name, value]) => `${name}=${value}`);
+        return bindings.length ? `${calc.expression} (${bindings.join(', ')})` : calc.expression;
+    }
+    // Vector calculations: the result is the dot product or the sum of the result vector
+    if (calc.operation === 'dot') {
+        return 'a · b';
+    }
+    if (calc.operation.startsWith('vector_')) {
+        return `Σ(a ${getOperationSymbol(calc.operation.slice('vector_'.length))} b)`;
+    }
+    return `${calc.operand1} ${getOperationSymbol(calc.operation)} ${calc.operand2}`;
+}
+
 function getOperationSymbol(operation) {
     const symbols = {
         'add': '+',
@@ -112,10 +132,83 @@ async function deleteCalculation(id) {
     }
 }
 
+// Live updates from /history/stream: changes made in other tabs or by other
+// clients are applied to the list as they happen. The page still refetches
+// after its own writes, and on every (re)connect, so nothing missed while
+// the stream was down stays missing
+let historyStream = null;
+
+async function startHistoryStream() {
+    if (!window.EventSource || historyStream) {
+        return;
+    }
+    // EventSource cannot send the token; a short-lived ticket keeps it out of the URL
+    let ticket;
+    try {
+        const response = await fetchWithAuth('/history/stream/ticket', { method: 'POST' });
+        if (!response.ok) {
+            return;
+        }
+        ticket = (await response.json()).ticket;
+    } catch (error) {
+        return;
+    }
+    if (historyStream || !token) {
+        // Started meanwhile, or logged out
+        return;
+    }
+    historyStream = new EventSource(`/history/stream?ticket=${encodeURIComponent(ticket)}`);
+    // Sent on every (re)connect, including the browser's own retries, once no
+    // further change can be missed
+    historyStream.addEventListener('ready', loadRecentCalculations);
+    historyStream.addEventListener('resync', loadRecentCalculations);
+    historyStream.addEventListener('cleared', () => {
+        recentCalculations = [];
+        displayRecentCalculations(recentCalculations);
+    });
+    historyStream.addEventListener('created', (event) => {
+        // The list shows the first RECENT_LIMIT calculations
+        for (const calc of JSON.parse(event.data).calculations) {
+            if (recentCalculations.length < RECENT_LIMIT && !recentCalculations.some(c => c.id === calc.id)) {
+                recentCalculations.push(calc);
+            }
+        }
+        displayRecentCalculations(recentCalculations);
+    });
+    historyStream.addEventListener('deleted', (event) => {
+        const ids = JSON.parse(event.data).ids;
+        const wasFull = recentCalculations.length === RECENT_LIMIT;
+        recentCalculations = recentCalculations.filter(calc => !ids.includes(calc.id));
+        if (wasFull && recentCalculations.length < RECENT_LIMIT) {
+            // A calculation beyond the list moves up
+            loadRecentCalculations();
+        } else {
+            displayRecentCalculations(recentCalculations);
+        }
+    });
+    const stream = historyStream;
+    stream.onerror = () => {
+        if (stream.readyState === EventSource.CLOSED && historyStream === stream) {
+            // Refused, e.g. the ticket expired before a reconnect: start over
+            // with a new one, or fall back to refetching if that is refused too
+            historyStream = null;
+            setTimeout(startHistoryStream, 3000);
+        }
+    };
+}
+
+function stopHistoryStream() {
+    if (historyStream) {
+        historyStream.close();
+        historyStream = null;
+    }
+}
+
 // Load recent calculations when calculator is shown
 if (document.getElementById('calculator-section')) {
     const token = localStorage.getItem('token');
     if (token) {
         loadRecentCalculations();
+        startHistoryStream();
     }
 }
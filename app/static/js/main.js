@@ -32,6 +32,9 @@ if (logoutBtn) {
     logoutBtn.addEventListener('click', () => {
         localStorage.removeItem('token');
         token = null;
+        if (typeof stopHistoryStream === 'function') {
+            stopHistoryStream();
+        }
         showAuth();
         logoutBtn.style.display = 'none';
         showMessage('Logged out successfully', 'success');
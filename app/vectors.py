@@ -0,0 +1,44 @@
+"""Array operands as compact binary: little-endian float64, 8 bytes per element.
+
+Vectors travel either as raw ``application/octet-stream`` bytes or base64 in
+JSON, and are stored as the same bytes in BLOB columns, so a 10k-element
+vector costs 80KB and one memcpy instead of a JSON list to parse and format.
+"""
+import base64
+import binascii
+import numpy as np
+from app.config import settings
+
+DTYPE = np.dtype("<f8")
+
+OCTET_STREAM = "application/octet-stream"
+
+
+def from_bytes(data: bytes, name: str = "vector") -> np.ndarray:
+    """Read-only float64 array over ``data``; raises ValueError if it is not a valid vector"""
+    if not data:
+        raise ValueError(f"{name} is empty")
+    if len(data) % DTYPE.itemsize:
+        raise ValueError(f"{name} length must be a multiple of {DTYPE.itemsize} bytes")
+    if len(data) // DTYPE.itemsize > settings.VECTOR_MAX_LENGTH:
+        raise ValueError(f"{name} has more than {settings.VECTOR_MAX_LENGTH} elements")
+    values = np.frombuffer(data, dtype=DTYPE)
+    if not np.isfinite(values).all():
+        raise ValueError(f"{name} contains NaN or infinite values")
+    return values
+
+
+def to_bytes(values: np.ndarray) -> bytes:
+    return np.ascontiguousarray(values, dtype=DTYPE).tobytes()
+
+
+def from_base64(text: str, name: str = "vector") -> np.ndarray:
+    try:
+        data = base64.b64decode(text, validate=True)
+    except (binascii.Error, ValueError):
+        raise ValueError(f"{name} is not valid base64")
+    return from_bytes(data, name)
+
+
+def to_base64(values: np.ndarray) -> str:
+    return base64.b64encode(to_bytes(values)).decode("ascii")
@@ -0,0 +1,289 @@
+"""Background writers for calculation inserts."""
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Callable, Dict, List, Sequence
+from sqlalchemy import case, func, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import Calculation, IdAllocation
+from app.services import CALCULATION_COLUMNS, CalculationService
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class SingleWriter:
+    """Serialises calculation inserts through one thread that group-commits.
+
+    Request threads ``submit`` calculations and wait on the returned future.
+    The writer drains everything queued since its last commit into a single
+    transaction, so under load N concurrent inserts cost one commit instead of
+    N commits fighting over SQLite's write lock.
+    """
+
+    def __init__(self, session_factory: Callable[..., Session] = SessionLocal, max_batch: int = 500):
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.commits = 0
+        self.rows = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._thread = threading.Thread(target=self._run, name="calculation-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Commit whatever is queued and stop the writer thread"""
+        if not self.running:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, calculations: List[Calculation]) -> Future:
+        """Queue new calculations; the future resolves to them once committed"""
+        future = Future()
+        self._queue.put((calculations, future))
+        return future
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if _STOP in batch:
+                stopping = True
+                batch = [item for item in batch if item is not _STOP]
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch) -> None:
+        try:
+            self._commit([calc for calculations, _ in batch for calc in calculations])
+        except Exception:
+            # Retry one by one so a bad item only fails its own request
+            logger.exception("Group commit of %d requests failed; retrying individually", len(batch))
+            for calculations, future in batch:
+                try:
+                    self._commit(calculations)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(calculations)
+            return
+        for calculations, future in batch:
+            future.set_result(calculations)
+
+    def _commit(self, calculations: List[Calculation]) -> None:
+        db = self.session_factory(expire_on_commit=False)
+        try:
+            CalculationService.save_calculations(db, calculations)
+            db.commit()
+            # Leave the returned objects usable after the session closes
+            db.expunge_all()
+            self.commits += 1
+            self.rows += len(calculations)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+class IdAllocator:
+    """Hands out calculation ids from blocks reserved in the database.
+
+    On Postgres the blocks come from the table's own sequence. Elsewhere the
+    ``id_allocations`` row is bumped past both its previous value and the
+    highest stored id in a single UPDATE, so concurrent processes never
+    receive overlapping blocks.
+    """
+
+    name = "calculations"
+
+    def __init__(self, session_factory: Callable[..., Session] = SessionLocal, block_size: int = 1000):
+        self.session_factory = session_factory
+        self.block_size = block_size
+        self._ids = iter(())
+        self._lock = threading.Lock()
+
+    def next_id(self) -> int:
+        with self._lock:
+            for calculation_id in self._ids:
+                return calculation_id
+            self._ids = iter(self.reserve(self.block_size))
+            return next(self._ids)
+
+    def reserve(self, count: int) -> Sequence[int]:
+        db = self.session_factory()
+        try:
+            if db.get_bind().dialect.name == "postgresql":
+                ids = db.execute(
+                    text("SELECT nextval(pg_get_serial_sequence('calculations', 'id')) FROM generate_series(1, :n)"),
+                    {"n": count}
+                ).scalars().all()
+                db.commit()
+                return ids
+
+            floor = db.query(func.coalesce(func.max(Calculation.id), 0) + 1).scalar_subquery()
+            allocation = db.query(IdAllocation).filter(IdAllocation.name == self.name)
+            while True:
+                bumped = allocation.update({
+                    IdAllocation.next_id: case(
+                        (IdAllocation.next_id > floor, IdAllocation.next_id), else_=floor
+                    ) + count
+                }, synchronize_session=False)
+                if bumped:
+                    break
+                try:
+                    start = db.query(func.coalesce(func.max(Calculation.id), 0) + 1).scalar()
+                    db.add(IdAllocation(name=self.name, next_id=start + count))
+                    db.flush()
+                    break
+                except IntegrityError:
+                    # Another process created the row first; bump it instead
+                    db.rollback()
+            end = allocation.with_entities(IdAllocation.next_id).scalar()
+            db.commit()
+            return range(end - count, end)
+        finally:
+            db.close()
+
+
+class WriteBehindBuffer:
+    """Acknowledges calculations before they are stored.
+
+    ``add`` gives a calculation its id and timestamp and returns straight away;
+    buffered rows are written in one transaction once ``max_rows`` accumulate
+    or ``max_delay`` seconds pass, and on shutdown. Until then they are not
+    visible to reads, and a crash loses at most the buffered rows.
+    """
+
+    def __init__(
+        self,
+        session_factory: Callable[..., Session] = SessionLocal,
+        allocator: IdAllocator = None,
+        max_rows: int = 1000,
+        max_delay: float = 0.05
+    ):
+        self.session_factory = session_factory
+        self.allocator = allocator or IdAllocator(session_factory)
+        self.max_rows = max_rows
+        self.max_delay = max_delay
+        self.flushes = 0
+        self.rows = 0
+        self.dropped = 0
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        CalculationService.id_allocator = self.allocator
+        self._thread = threading.Thread(target=self._run, name="calculation-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Flush everything buffered and stop the flusher thread"""
+        if not self.running:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        CalculationService.id_allocator = None
+
+    def add(self, calculation: Calculation) -> Calculation:
+        calculation.id = self.allocator.next_id()
+        calculation.created_at = datetime.utcnow()
+        # Buffer a plain row; the caller keeps the object for its response
+        row = {column.key: getattr(calculation, column.key) for column in CALCULATION_COLUMNS}
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.max_rows
+        if full:
+            # Backpressure: the caller pays for the flush instead of the buffer growing
+            self.flush()
+        return calculation
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> int:
+        """Write all buffered rows; returns how many were stored"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            try:
+                stored = self._commit(batch)
+            except Exception:
+                logger.exception("Write-behind flush of %d rows failed; retrying individually", len(batch))
+                stored = 0
+                for row in batch:
+                    try:
+                        stored += self._commit([row])
+                    except Exception:
+                        logger.exception("Dropping buffered calculation %s", row["id"])
+                        self.dropped += 1
+            self.flushes += 1
+            self.rows += stored
+            return stored
+
+    def _commit(self, rows: List[Dict]) -> int:
+        db = self.session_factory()
+        try:
+            CalculationService.bulk_insert(db, rows)
+            db.commit()
+            return len(rows)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.max_delay)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+
+single_writer = SingleWriter()
+
+write_behind = WriteBehindBuffer(
+    allocator=IdAllocator(block_size=settings.WRITE_BEHIND_ID_BLOCK_SIZE),
+    max_rows=settings.WRITE_BEHIND_MAX_ROWS,
+    max_delay=settings.WRITE_BEHIND_MAX_DELAY_MS / 1000
+)
@@ -0,0 +1,84 @@
+"""Compare per-item throughput of POST /calculations/ and POST /calculations/batch.
+
+Usage:
+    python -m benchmarks.bench_batch [--single 500] [--batch 10000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.database import Base, get_db
+
+OPERATIONS = ["add", "subtract", "multiply", "divide"]
+
+
+def random_item():
+    return {
+        "operation": random.choice(OPERATIONS),
+        "operand1": random.uniform(-1000, 1000),
+        "operand2": random.uniform(1, 1000),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--single", type=int, default=500, help="number of single-item requests")
+    parser.add_argument("--batch", type=int, default=10000, help="items in the batch request")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        def override_get_db():
+            db = Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        client = TestClient(app)
+        client.post("/auth/register", json={"username": "bench", "email": "bench@example.com", "password": "benchpass123"})
+        token = client.post("/auth/login", data={"username": "bench", "password": "benchpass123"}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        start = time.perf_counter()
+        for _ in range(args.single):
+            client.post("/calculations/", json=random_item(), headers=headers)
+        single_rate = args.single / (time.perf_counter() - start)
+
+        items = [random_item() for _ in range(args.batch)]
+        columnar = {
+            "operations": [item["operation"] for item in items],
+            "operand1": [item["operand1"] for item in items],
+            "operand2": [item["operand2"] for item in items],
+        }
+        start = time.perf_counter()
+        response = client.post("/calculations/batch", json={"items": items}, headers=headers)
+        items_rate = args.batch / (time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+        start = time.perf_counter()
+        response = client.post("/calculations/batch", json=columnar, headers=headers)
+        columnar_rate = args.batch / (time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+
+        app.dependency_overrides.clear()
+
+    print(f"single endpoint:   {single_rate:10.0f} items/s")
+    print(f"batch (items):     {items_rate:10.0f} items/s  ({items_rate / single_rate:.0f}x)")
+    print(f"batch (columnar):  {columnar_rate:10.0f} items/s  ({columnar_rate / single_rate:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
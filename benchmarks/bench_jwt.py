@@ -0,0 +1,64 @@
+"""CPU cost of issuing and verifying access tokens with each JWT backend.
+
+Times ``encode`` (login) and ``decode`` (every authenticated request) for
+python-jose, PyJWT (if installed) and the hand-rolled HMAC codec, plus a
+decode served from the verified-claims cache in app.auth.
+
+Usage:
+    python -m benchmarks.bench_jwt [--repeat 20000]
+"""
+import argparse
+import os
+import time
+from datetime import datetime, timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from app.auth import decode_claims, token_cache
+from app.config import settings
+from app.tokens import BACKENDS
+
+
+def cpu_time(fn, repeat: int) -> float:
+    """Mean CPU seconds per call"""
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20000)
+    args = parser.parse_args()
+
+    claims = {"sub": "bench", "uid": 1, "exp": datetime.utcnow() + timedelta(minutes=30)}
+    timings = {}
+    for name, backend_class in BACKENDS.items():
+        try:
+            backend = backend_class(settings.SECRET_KEY, settings.ALGORITHM)
+        except RuntimeError as exc:
+            print(f"{name:>6}: skipped ({exc})")
+            continue
+        token = backend.encode(claims)
+        timings[name] = (
+            cpu_time(lambda: backend.encode(claims), args.repeat),
+            cpu_time(lambda: backend.decode(token), args.repeat),
+        )
+
+    jose_encode, jose_decode = timings["jose"]
+    for name, (encode, decode) in timings.items():
+        print(
+            f"{name:>6}: encode {encode * 1e6:7.1f} us ({jose_encode / encode:4.1f}x jose)  "
+            f"decode {decode * 1e6:7.1f} us ({jose_decode / decode:4.1f}x jose)"
+        )
+
+    token_cache.clear()
+    token = BACKENDS[settings.JWT_BACKEND](settings.SECRET_KEY, settings.ALGORITHM).encode(claims)
+    cached = cpu_time(lambda: decode_claims(token), args.repeat)
+    print(f"cached: decode {cached * 1e6:7.1f} us ({jose_decode / cached:4.1f}x jose)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Login throughput and collateral latency with bcrypt inline vs in the process pool.
+
+Fires a burst of concurrent /auth/login requests while probing GET
+/calculations/ and reports logins/s, rejected logins and probe latency.
+
+Usage:
+    python -m benchmarks.bench_login [--logins 200] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.main import app
+from app.database import Base, get_db
+from app.passwords import PasswordHasher
+from app.config import settings
+import app.routers.auth as auth_routes
+
+CREDENTIALS = {"username": "bench", "password": "benchpass123"}
+
+
+async def run_burst(client, headers, logins, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    probe_latencies = []
+    outcomes = {"ok": 0, "rejected": 0}
+    done = asyncio.Event()
+
+    async def login():
+        async with semaphore:
+            response = await client.post("/auth/login", data=CREDENTIALS)
+            outcomes["ok" if response.status_code == 200 else "rejected"] += 1
+
+    async def probe():
+        while not done.is_set():
+            start = time.perf_counter()
+            await client.get("/calculations/", headers=headers)
+            probe_latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(0.01)
+
+    prober = asyncio.create_task(probe())
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    return outcomes, elapsed, probe_latencies
+
+
+async def bench(mode, hasher, args):
+    auth_routes.hasher = hasher
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=120) as client:
+        token = (await client.post("/auth/login", data=CREDENTIALS)).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        outcomes, elapsed, probes = await run_burst(client, headers, args.logins, args.concurrency)
+    hasher.shutdown()
+
+    probes.sort()
+    p95 = probes[int(len(probes) * 0.95) - 1] if probes else float("nan")
+    print(
+        f"{mode:>8}: {outcomes['ok'] / elapsed:7.1f} logins/s  "
+        f"rejected={outcomes['rejected']:<4d} "
+        f"probe p50={statistics.median(probes) * 1000:7.1f}ms p95={p95 * 1000:7.1f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=settings.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db", connect_args={"check_same_thread": False})
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        def override_get_db():
+            db = Session()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = override_get_db
+        from fastapi.testclient import TestClient
+        TestClient(app).post("/auth/register", json={**CREDENTIALS, "email": "bench@example.com"})
+
+        # "inline" reproduces the old behaviour: bcrypt in request threads, unbounded
+        asyncio.run(bench("inline", PasswordHasher(workers=0, max_pending=10 ** 6), args))
+        asyncio.run(bench("pool", PasswordHasher(args.workers, settings.PASSWORD_HASH_MAX_PENDING), args))
+        app.dependency_overrides.clear()
+
+
+if __name__ == "__main__":
+    main()
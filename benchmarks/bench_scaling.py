@@ -0,0 +1,158 @@
+"""Throughput as the number of gunicorn workers grows.
+
+For each worker count, starts ``gunicorn -c gunicorn.conf.py app.main:app``
+against DATABASE_URL, drives the load-test scenarios from several client
+processes (one asyncio client saturates long before eight workers do) and
+reports req/s, speedup over the smallest worker count and scaling efficiency
+(speedup / worker ratio; 1.0 is linear). Users are seeded once and reused.
+
+Use Postgres: SQLite admits one writer at a time, so write scenarios cannot
+scale on it. Give the machine at least as many cores as the largest worker
+count plus the client processes, or the clients compete with the server.
+
+Usage:
+    DATABASE_URL=postgresql://localhost/calculator_bench \\
+    SHARED_STATE_URL=redis://localhost:6379/0 \\
+        python -m benchmarks.bench_scaling --workers 1 2 4 8
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+from benchmarks.loadtest import SCENARIOS, run_scenario, seed
+
+
+def scaling(rps_by_workers: Dict[int, float]) -> List[Dict]:
+    """Speedup and efficiency of each worker count relative to the smallest"""
+    base_workers = min(rps_by_workers)
+    base_rps = rps_by_workers[base_workers]
+    rows = []
+    for workers in sorted(rps_by_workers):
+        speedup = rps_by_workers[workers] / base_rps if base_rps else 0.0
+        rows.append({
+            "workers": workers,
+            "rps": round(rps_by_workers[workers], 1),
+            "speedup": round(speedup, 2),
+            "efficiency": round(speedup / (workers / base_workers), 2),
+        })
+    return rows
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    env = dict(os.environ, WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{port}", ACCESS_LOG="")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app.main:app"],
+        env=env
+    )
+
+
+def wait_ready(url: str, timeout: float = 60) -> None:
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+
+def stop_server(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def _client(url: str, scenario: str, users: List[Dict], requests: int, concurrency: int) -> Dict:
+    """One load-generating process: its own event loop and connection pool"""
+    import httpx
+
+    async def go():
+        async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+            await run_scenario(client, scenario, users, min(requests, 20), concurrency)
+            return await run_scenario(client, scenario, users, requests, concurrency)
+    return asyncio.run(go())
+
+
+def drive(pool: ProcessPoolExecutor, url: str, scenario: str, users: List[Dict], args) -> Dict:
+    """Run a scenario from every client process at once; req/s and errors are summed"""
+    futures = [
+        pool.submit(_client, url, scenario, users, args.requests // args.clients, args.concurrency)
+        for _ in range(args.clients)
+    ]
+    results = [future.result() for future in futures]
+    return {
+        "rps": sum(result["rps"] for result in results),
+        "errors": sum(result["errors"] for result in results),
+        "p95_ms": max(result["p95_ms"] for result in results),
+    }
+
+
+async def _seed(url: str, args) -> List[Dict]:
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        return await seed(client, args)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=4, help="load-generating processes")
+    parser.add_argument("--concurrency", type=int, default=16, help="in-flight requests per client process")
+    parser.add_argument("--requests", type=int, default=4000, help="requests per scenario and worker count")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--calculations", type=int, default=1000, help="calculations seeded per user")
+    parser.add_argument("--seed-batch", type=int, default=5000)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=["create", "list", "history", "statistics"])
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret-key")
+    if not os.environ.get("DATABASE_URL", "").startswith("postgresql"):
+        print("warning: DATABASE_URL is not Postgres; write scenarios will not scale", file=sys.stderr)
+    url = f"http://127.0.0.1:{args.port}"
+
+    users = None
+    rps: Dict[str, Dict[int, float]] = {scenario: {} for scenario in args.scenarios}
+    with ProcessPoolExecutor(args.clients) as pool:
+        for workers in sorted(args.workers):
+            server = start_server(workers, args.port)
+            try:
+                wait_ready(url)
+                if users is None:
+                    users = asyncio.run(_seed(url, args))
+                for scenario in args.scenarios:
+                    result = drive(pool, url, scenario, users, args)
+                    rps[scenario][workers] = result["rps"]
+                    print(
+                        f"workers={workers:<3} {scenario:>10}: {result['rps']:9.1f} req/s  "
+                        f"p95={result['p95_ms']:8.2f}ms  errors={result['errors']}"
+                    )
+            finally:
+                stop_server(server)
+
+    print()
+    for scenario in args.scenarios:
+        for row in scaling(rps[scenario]):
+            print(
+                f"{scenario:>10}  workers={row['workers']:<3} {row['rps']:9.1f} req/s  "
+                f"speedup={row['speedup']:5.2f}  efficiency={row['efficiency']:4.2f}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
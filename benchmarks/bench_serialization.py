@@ -0,0 +1,89 @@
+"""CPU cost of encoding a page of calculations: response_model validation vs the fast path.
+
+Both pipelines include the query. The "validated" one loads ORM objects and
+runs them through FastAPI's response_model serialization and JSONResponse, as
+GET /calculations/ did before; the "fast" one selects column tuples and
+encodes them with orjson.
+
+Usage:
+    python -m benchmarks.bench_serialization [--rows 1000] [--repeat 50]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from typing import List
+
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key")
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models import Calculation, User
+from app.schemas import CalculationResponse
+from app.serialization import CALCULATION_ROW, calculation_list_response
+
+OPERATIONS = ["add", "subtract", "multiply", "divide"]
+
+
+def validated_page(db, user_id: int, limit: int) -> bytes:
+    field = create_response_field(name="Response_get_calculations", type_=List[CalculationResponse])
+    calculations = db.query(Calculation).filter(Calculation.user_id == user_id).limit(limit).all()
+    content = asyncio.run(serialize_response(field=field, response_content=calculations, is_coroutine=False))
+    return JSONResponse(content).body
+
+
+def fast_page(db, user_id: int, limit: int) -> bytes:
+    rows = db.query(*CALCULATION_ROW).filter(Calculation.user_id == user_id).limit(limit).all()
+    return calculation_list_response(rows).body
+
+
+def cpu_time(fn, repeat: int) -> float:
+    """Mean CPU seconds per call"""
+    fn()
+    start = time.process_time()
+    for _ in range(repeat):
+        fn()
+    return (time.process_time() - start) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000, help="rows per page")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{tmp}/bench.db")
+        Base.metadata.create_all(bind=engine)
+        db = sessionmaker(bind=engine)()
+        user = User(username="bench", email="bench@example.com", hashed_password="-")
+        db.add(user)
+        db.flush()
+        db.add_all(
+            Calculation(
+                user_id=user.id,
+                operation=random.choice(OPERATIONS),
+                operand1=random.uniform(-1000, 1000),
+                operand2=random.uniform(1, 1000),
+                result=random.uniform(-1e6, 1e6)
+            )
+            for _ in range(args.rows)
+        )
+        db.commit()
+
+        validated = cpu_time(lambda: (validated_page(db, user.id, args.rows), db.expunge_all()), args.repeat)
+        fast = cpu_time(lambda: fast_page(db, user.id, args.rows), args.repeat)
+        db.close()
+
+    print(f"response_model: {validated * 1000:8.2f} ms CPU per {args.rows}-row page")
+    print(f"fast path:      {fast * 1000:8.2f} ms CPU per {args.rows}-row page  ({validated / fast:.1f}x less)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Load test for the API endpoints.
+
+Seeds users and calculations, then drives each scenario at a fixed
+concurrency and reports requests/s and p50/p95/p99 latency. Results can be
+saved as a JSON baseline and later runs compared against it; the process
+exits non-zero when a scenario regresses beyond the tolerance.
+
+Usage:
+    # in-process app on a temporary SQLite database
+    python -m benchmarks.loadtest --save-baseline benchmarks/baseline.json
+
+    # in-process app on a local Postgres database
+    python -m benchmarks.loadtest --database-url postgresql://localhost/calculator_bench
+
+    # a running server (e.g. uvicorn app.main:app)
+    python -m benchmarks.loadtest --url http://localhost:8000 --compare benchmarks/baseline.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+SCENARIOS = ["login", "create", "list", "history", "statistics"]
+OPERATIONS = ["add", "subtract", "multiply", "divide"]
+PASSWORD = "loadtest-password"
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of already sorted values"""
+    if not sorted_values:
+        return float("nan")
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def compare(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Describe every scenario slower than the baseline by more than ``tolerance``"""
+    regressions = []
+    for scenario, base in baseline["results"].items():
+        current = results["results"].get(scenario)
+        if current is None:
+            continue
+        if current["rps"] < base["rps"] * (1 - tolerance):
+            regressions.append(f"{scenario}: rps {current['rps']} < baseline {base['rps']}")
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{scenario}: p95 {current['p95_ms']}ms > baseline {base['p95_ms']}ms")
+        if current["errors"] > base["errors"]:
+            regressions.append(f"{scenario}: {current['errors']} errors > baseline {base['errors']}")
+    return regressions
+
+
+def random_calculation() -> Dict:
+    return {
+        "operation": random.choice(OPERATIONS),
+        "operand1": round(random.uniform(-1000, 1000), 3),
+        "operand2": round(random.uniform(1, 1000), 3),
+    }
+
+
+@asynccontextmanager
+async def open_client(args):
+    import httpx
+
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=60) as client:
+            yield client
+        return
+
+    from app.main import app
+    from app.database import init_db
+
+    init_db()
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(app=app, base_url="http://loadtest", timeout=60) as client:
+            yield client
+
+
+async def seed(client, args) -> List[Dict]:
+    """Register the users, log them in and give each its calculations"""
+    run_id = f"{int(time.time())}{random.randint(0, 9999)}"
+    users = []
+    for i in range(args.users):
+        username = f"load{run_id}_{i}"
+        response = await client.post(
+            "/auth/register",
+            json={"username": username, "email": f"{username}@example.com", "password": PASSWORD}
+        )
+        response.raise_for_status()
+        token = (await client.post("/auth/login", data={"username": username, "password": PASSWORD})).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+
+        remaining = args.calculations
+        while remaining > 0:
+            size = min(remaining, args.seed_batch)
+            items = [random_calculation() for _ in range(size)]
+            response = await client.post(
+                "/calculations/batch",
+                json={
+                    "operations": [item["operation"] for item in items],
+                    "operand1": [item["operand1"] for item in items],
+                    "operand2": [item["operand2"] for item in items],
+                },
+                headers=headers
+            )
+            response.raise_for_status()
+            remaining -= size
+        users.append({"username": username, "headers": headers})
+    return users
+
+
+def scenario_request(scenario: str, user: Dict):
+    """(method, path, request kwargs) for one request of a scenario"""
+    if scenario == "login":
+        return "POST", "/auth/login", {"data": {"username": user["username"], "password": PASSWORD}}
+    if scenario == "create":
+        return "POST", "/calculations/", {"json": random_calculation(), "headers": user["headers"]}
+    if scenario == "list":
+        return "GET", "/calculations/", {"params": {"limit": 100}, "headers": user["headers"]}
+    if scenario == "history":
+        return "GET", "/history/", {"headers": user["headers"]}
+    if scenario == "statistics":
+        return "GET", "/history/statistics", {"headers": user["headers"]}
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+async def run_scenario(client, scenario: str, users: List[Dict], requests: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            method, path, kwargs = scenario_request(scenario, users[i % len(users)])
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                ok = response.status_code < 400
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+async def run(args) -> Dict:
+    async with open_client(args) as client:
+        users = await seed(client, args)
+        results = {}
+        for scenario in args.scenarios:
+            # A short warm-up keeps connection setup and first-call costs out of the numbers
+            await run_scenario(client, scenario, users, min(args.requests, 20), args.concurrency)
+            results[scenario] = await run_scenario(client, scenario, users, args.requests, args.concurrency)
+            print(
+                f"{scenario:>10}: {results[scenario]['rps']:9.1f} req/s  "
+                f"p50={results[scenario]['p50_ms']:8.2f}ms  "
+                f"p95={results[scenario]['p95_ms']:8.2f}ms  "
+                f"p99={results[scenario]['p99_ms']:8.2f}ms  "
+                f"errors={results[scenario]['errors']}"
+            )
+    return {
+        "meta": {
+            "target": args.url or "in-process",
+            "database_url": None if args.url else os.environ.get("DATABASE_URL"),
+            "users": args.users,
+            "calculations_per_user": args.calculations,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        },
+        "results": results,
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server; default drives the app in-process")
+    parser.add_argument("--database-url", help="database for the in-process app; default is a temporary SQLite file")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--calculations", type=int, default=1000, help="calculations seeded per user")
+    parser.add_argument("--seed-batch", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--save-baseline", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    os.environ.setdefault("SECRET_KEY", "loadtest-secret-key")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if not args.url:
+            # Must be set before the app (and its engine) is imported
+            os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tmp}/loadtest.db"
+        results = asyncio.run(run(args))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
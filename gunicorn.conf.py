@@ -0,0 +1,56 @@
+"""Gunicorn settings: Uvicorn workers, one per CPU core once they can share state.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Each worker is a separate process with its own caches, event streams and
+counters. With more than one worker, set SHARED_STATE_URL to a Redis-protocol
+server so they share results, deliver each other's /history/stream events and
+drop deleted users everywhere (see app/shared_state.py). Without it there is a
+single worker unless WEB_CONCURRENCY asks for more. Use Postgres rather
+than SQLite: SQLite lets one writer in at a time, whatever the worker count.
+
+Environment: WEB_CONCURRENCY (workers), BIND (default 0.0.0.0:8000), ACCESS_LOG.
+"""
+import multiprocessing
+import os
+
+cores = multiprocessing.cpu_count()
+
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+shared_state_url = os.environ.get("SHARED_STATE_URL", "")
+shared = bool(shared_state_url) and not shared_state_url.startswith("memory://")
+# Workers that can't share state would miss each other's stream events
+workers = int(os.environ.get("WEB_CONCURRENCY", cores if shared else 1))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Connections the listening socket queues while every worker is busy
+backlog = 2048
+keepalive = 5
+graceful_timeout = 30
+# Empty ACCESS_LOG turns the access log off (e.g. for benchmarks)
+accesslog = os.environ.get("ACCESS_LOG", "-") or None
+
+# Every worker gets its own bcrypt process pool; split the cores between them
+os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, cores // workers)))
+
+
+def on_starting(server):
+    # Migrate once in the master, before workers race to do it
+    from app.database import get_engine, init_db
+    init_db()
+    # Close the master's connections so no worker inherits one
+    get_engine().dispose()
+
+
+def post_fork(server, worker):
+    # Leave anything still pooled (e.g. with preload_app) to the master and
+    # have this worker open its own connections
+    from app import database
+    if database._engine is not None:
+        database._engine.dispose(close=False)
+
+
+def when_ready(server):
+    if workers > 1 and not shared:
+        server.log.warning(
+            "%d workers without SHARED_STATE_URL: caches and event streams are per worker", workers
+        )
@@ -0,0 +1,64 @@
+"""Alembic environment; see app/migrate.py for how revisions are written and run"""
+from logging.config import fileConfig
+from alembic import context
+from sqlalchemy import create_engine
+from app.config import settings
+from app.database import Base, apply_sqlite_profile
+# Registers every table on Base.metadata
+import app.models
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = Base.metadata
+
+
+def database_url() -> str:
+    return config.get_main_option("sqlalchemy.url") or settings.DATABASE_URL
+
+
+def run_migrations_offline():
+    """Print the SQL for review instead of running it (``--sql``)"""
+    context.configure(
+        url=database_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+        transaction_per_migration=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    engine = config.attributes.get("engine")
+    owned = engine is None
+    if owned:
+        engine = create_engine(database_url())
+        apply_sqlite_profile(engine)
+    try:
+        run_on(engine)
+    finally:
+        if owned:
+            engine.dispose()
+
+
+def run_on(engine):
+    with engine.connect() as connection:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite can't ALTER most things; batch mode copies the table instead
+            render_as_batch=connection.dialect.name == "sqlite",
+            # Each revision commits on its own, so a failure keeps the ones before it
+            transaction_per_migration=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,55 @@
+"""Baseline: users and calculations as first released
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import has_index, has_table
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Databases created by create_all already have these
+    if not has_table("users"):
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("username", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if not has_index("users", "ix_users_id"):
+        op.create_index("ix_users_id", "users", ["id"])
+    if not has_index("users", "ix_users_username"):
+        op.create_index("ix_users_username", "users", ["username"], unique=True)
+    if not has_index("users", "ix_users_email"):
+        op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    if not has_table("calculations"):
+        op.create_table(
+            "calculations",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("operation", sa.String(), nullable=False),
+            sa.Column("operand1", sa.Float(), nullable=False),
+            sa.Column("operand2", sa.Float(), nullable=False),
+            sa.Column("result", sa.Float(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if not has_index("calculations", "ix_calculations_id"):
+        op.create_index("ix_calculations_id", "calculations", ["id"])
+
+
+def downgrade():
+    op.drop_table("calculations")
+    op.drop_table("users")
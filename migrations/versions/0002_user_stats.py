@@ -0,0 +1,71 @@
+"""Per-user statistics rollup, filled from existing calculations
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import has_table
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+# Built the way UserStatsService.rebuild would; 0007 gives the rows version 0
+BACKFILL_USER_STATS = """
+INSERT INTO user_stats (
+    user_id, total_calculations, sum_operand1, sum_operand2, sum_result,
+    latest_calculation_id, latest_created_at
+)
+SELECT c.user_id, COUNT(c.id), COALESCE(SUM(c.operand1), 0), COALESCE(SUM(c.operand2), 0), SUM(c.result),
+    (SELECT l.id FROM calculations l WHERE l.user_id = c.user_id
+        ORDER BY l.created_at DESC, l.id ASC LIMIT 1),
+    (SELECT l.created_at FROM calculations l WHERE l.user_id = c.user_id
+        ORDER BY l.created_at DESC, l.id ASC LIMIT 1)
+FROM calculations c
+GROUP BY c.user_id
+"""
+
+BACKFILL_USER_OPERATION_STATS = """
+INSERT INTO user_operation_stats (user_id, operation, count, first_calculation_id)
+SELECT user_id, operation, COUNT(id), MIN(id)
+FROM calculations
+GROUP BY user_id, operation
+"""
+
+
+def upgrade():
+    # Tables that already exist were kept up to date by the app
+    if not has_table("user_stats"):
+        op.create_table(
+            "user_stats",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("total_calculations", sa.Integer(), nullable=False),
+            sa.Column("sum_operand1", sa.Float(), nullable=False),
+            sa.Column("sum_operand2", sa.Float(), nullable=False),
+            sa.Column("sum_result", sa.Float(), nullable=False),
+            sa.Column("latest_calculation_id", sa.Integer(), nullable=True),
+            sa.Column("latest_created_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("user_id"),
+        )
+        op.execute(BACKFILL_USER_STATS)
+    if not has_table("user_operation_stats"):
+        op.create_table(
+            "user_operation_stats",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("operation", sa.String(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("first_calculation_id", sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("user_id", "operation"),
+        )
+        op.execute(BACKFILL_USER_OPERATION_STATS)
+
+
+def downgrade():
+    op.drop_table("user_operation_stats")
+    op.drop_table("user_stats")
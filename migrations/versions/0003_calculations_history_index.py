@@ -0,0 +1,22 @@
+"""Index for per-user history ordering and keyset pagination
+
+Built online: CONCURRENTLY on Postgres, its own short transaction on SQLite.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from app.migrate import create_index_online, drop_index_online
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    create_index_online("ix_calculations_user_created_id", "calculations", ["user_id", "created_at", "id"])
+
+
+def downgrade():
+    drop_index_online("ix_calculations_user_created_id", "calculations")
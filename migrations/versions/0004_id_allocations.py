@@ -0,0 +1,28 @@
+"""Id high-water marks for write-behind mode
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import has_table
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table("id_allocations"):
+        op.create_table(
+            "id_allocations",
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("next_id", sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint("name"),
+        )
+
+
+def downgrade():
+    op.drop_table("id_allocations")
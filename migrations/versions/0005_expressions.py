@@ -0,0 +1,39 @@
+"""Formula calculations: expression and variables, operands nullable
+
+SQLite can't drop NOT NULL in place, so there batch mode copies calculations
+into the new shape (one write transaction; readers carry on under WAL). On
+Postgres these are catalog-only ALTERs.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import columns
+
+revision = "0005"
+down_revision = "0004"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    existing = columns("calculations")
+    with op.batch_alter_table("calculations") as batch:
+        if "expression" not in existing:
+            batch.add_column(sa.Column("expression", sa.String(), nullable=True))
+        if "variables" not in existing:
+            batch.add_column(sa.Column("variables", sa.JSON(none_as_null=True), nullable=True))
+        for name in ("operand1", "operand2"):
+            if not existing.get(name, {}).get("nullable"):
+                batch.alter_column(name, existing_type=sa.Float(), nullable=True)
+
+
+def downgrade():
+    # Fails while expression or vector calculations (NULL operands) remain
+    with op.batch_alter_table("calculations") as batch:
+        batch.alter_column("operand1", existing_type=sa.Float(), nullable=False)
+        batch.alter_column("operand2", existing_type=sa.Float(), nullable=False)
+        batch.drop_column("variables")
+        batch.drop_column("expression")
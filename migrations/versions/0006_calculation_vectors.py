@@ -0,0 +1,32 @@
+"""Vector calculation operands and results
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import has_table
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table("calculation_vectors"):
+        op.create_table(
+            "calculation_vectors",
+            sa.Column("calculation_id", sa.Integer(), nullable=False),
+            sa.Column("length", sa.Integer(), nullable=False),
+            sa.Column("operand1", sa.LargeBinary(), nullable=False),
+            sa.Column("operand2", sa.LargeBinary(), nullable=False),
+            sa.Column("result", sa.LargeBinary(), nullable=True),
+            sa.ForeignKeyConstraint(["calculation_id"], ["calculations.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("calculation_id"),
+        )
+
+
+def downgrade():
+    op.drop_table("calculation_vectors")
@@ -0,0 +1,27 @@
+"""user_stats.version, the ETag of history and statistics
+
+The server default fills existing rows without rewriting the table (SQLite
+ADD COLUMN, Postgres 11+).
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import columns
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if "version" not in columns("user_stats"):
+        op.add_column("user_stats", sa.Column("version", sa.Integer(), nullable=False, server_default="0"))
+
+
+def downgrade():
+    with op.batch_alter_table("user_stats") as batch:
+        batch.drop_column("version")
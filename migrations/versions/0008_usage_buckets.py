@@ -0,0 +1,33 @@
+"""Per-hour/per-day usage time series
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+from app.migrate import has_table
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if not has_table("usage_buckets"):
+        op.create_table(
+            "usage_buckets",
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("resolution", sa.String(), nullable=False),
+            sa.Column("bucket_start", sa.DateTime(), nullable=False),
+            sa.Column("operation", sa.String(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("sum_result", sa.Float(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("user_id", "resolution", "bucket_start", "operation"),
+        )
+
+
+def downgrade():
+    op.drop_table("usage_buckets")
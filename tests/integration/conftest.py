@@ -0,0 +1,11 @@
+import pytest
+from app.models import User
+
+@pytest.fixture
+def user_id(request, test_user):
+    """Id of the registered test user, read through the test module's TestingSessionLocal"""
+    db = request.module.TestingSessionLocal()
+    try:
+        return db.query(User.id).filter(User.username == test_user["username"]).scalar()
+    finally:
+        db.close()
@@ -1,10 +1,29 @@
+import asyncio
+import base64
+import csv
+import io
+import json
+import numpy as np
+from datetime import datetime
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from fastapi import FastAPI
 from app.main import app
-from app.database import Base, get_db
-from app.models import User
+from app.database import Base, get_db, get_async_db
+from app.routers import async_auth, async_calculations, async_history
+from app.models import User, UserStats, UserOperationStats, Calculation, CalculationVector, UsageBucket
+from app.writer import SingleWriter, WriteBehindBuffer, IdAllocator
+from app.services import CalculationService, UserStatsService, UsageService, _rollup_increments
+from app import auth
+from app.auth import create_stream_ticket, user_cache, revoked_users, token_cache
+from app.config import settings
+from app.schemas import CalculationResponse
+from app import metrics
+from app.events import event_hub
+from app.ratelimit import RateLimitMiddleware, TokenBuckets
 
 # Setup test database
 TEST_DATABASE_URL = "sqlite:///./test.db"
@@ -28,6 +47,8 @@ def setup_database():
     Base.metadata.create_all(bind=engine)
     yield
     Base.metadata.drop_all(bind=engine)
+    user_cache.clear()
+    revoked_users.clear()
 
 @pytest.fixture
 def test_user():
@@ -112,6 +133,20 @@ class TestAuthEndpoints:
         )
         assert response.status_code == 401
 
+    def test_login_rehashes_on_cost_change(self, test_user, monkeypatch):
+        """Test a login upgrades a hash stored with a different cost factor"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        response = client.post("/auth/login", data=test_user)
+        assert response.status_code == 200
+        
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.username == "testuser").first()
+            assert user.hashed_password.startswith("$2b$04$")
+        finally:
+            db.close()
+        assert client.post("/auth/login", data=test_user).status_code == 200
+
 class TestCalculationEndpoints:
     
     def test_create_calculation(self, auth_token):
@@ -174,6 +209,342 @@ class TestCalculationEndpoints:
         assert len(data) > 0
         assert data[0]["result"] == 8
 
+    def test_get_calculations_keyset_pagination(self, auth_token):
+        """Test paging through calculations with the next cursor"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for i in range(5):
+            client.post(
+                "/calculations/",
+                json={"operation": "add", "operand1": i, "operand2": 0},
+                headers=headers
+            )
+        
+        seen = []
+        cursor = None
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["after"] = cursor
+            response = client.get("/calculations/", params=params, headers=headers)
+            assert response.status_code == 200
+            seen.extend(calc["operand1"] for calc in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        assert seen == [0, 1, 2, 3, 4]
+        
+        # Offset paging keeps working
+        response = client.get("/calculations/", params={"skip": 3}, headers=headers)
+        assert [calc["operand1"] for calc in response.json()] == [3, 4]
+    
+    def test_get_calculations_matches_response_model(self, auth_token):
+        """Test the fast list encoding matches CalculationResponse validation"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post(
+            "/calculations/",
+            json={"operation": "divide", "operand1": 1, "operand2": 3},
+            headers=headers
+        )
+        data = client.get("/calculations/", headers=headers).json()
+        
+        db = TestingSessionLocal()
+        expected = [
+            CalculationResponse.model_validate(calc).model_dump(mode="json")
+            for calc in db.query(Calculation).order_by(Calculation.id).all()
+        ]
+        db.close()
+        assert data == expected
+        assert list(data[0]) == list(CalculationResponse.model_fields)
+    
+    def test_get_calculations_invalid_cursor(self, auth_token):
+        """Test a malformed cursor is rejected"""
+        response = client.get(
+            "/calculations/",
+            params={"after": "not-a-cursor"},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 400
+
+class TestExpressionEndpoint:
+    
+    def test_create_expression(self, auth_token):
+        """Test evaluating and storing a formula"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post(
+            "/calculations/expression",
+            json={"expression": "(a+b)*c/d", "variables": {"a": 1, "b": 2, "c": 3, "d": 4}},
+            headers=headers
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["result"] == 2.25
+        assert data["operation"] == "expression"
+        assert data["operand1"] is None
+        
+        stored = client.get(f"/calculations/{data['id']}", headers=headers).json()
+        assert stored["expression"] == "(a+b)*c/d"
+        assert stored["variables"] == {"a": 1, "b": 2, "c": 3, "d": 4}
+    
+    def test_invalid_expression(self, auth_token):
+        """Test unsafe or failing formulas are rejected"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for expression in ("__import__('os').system('true')", "1/x"):
+            response = client.post(
+                "/calculations/expression",
+                json={"expression": expression, "variables": {"x": 0}},
+                headers=headers
+            )
+            assert response.status_code == 400
+    
+    def test_statistics_with_expressions(self, auth_token):
+        """Test operand averages only cover calculations with operands"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post(
+            "/calculations/",
+            json={"operation": "add", "operand1": 4, "operand2": 2},
+            headers=headers
+        )
+        client.post("/calculations/expression", json={"expression": "2^10"}, headers=headers)
+        
+        stats = client.get("/history/statistics", headers=headers).json()
+        assert stats["total_calculations"] == 2
+        assert stats["operations_count"] == {"add": 1, "expression": 1}
+        assert stats["average_operand1"] == 4
+        assert stats["average_operand2"] == 2
+        assert stats["average_result"] == 515
+        
+        db = TestingSessionLocal()
+        assert UserStatsService.verify(db) == []
+        assert CalculationService.get_user_statistics(db, 1)["average_operand1"] == 4
+        db.close()
+
+def vector_base64(values):
+    return base64.b64encode(np.asarray(values, dtype="<f8").tobytes()).decode("ascii")
+
+class TestVectorEndpoint:
+    
+    def test_elementwise_json(self, auth_token):
+        """Test base64 operands in, base64 result vector out"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post(
+            "/calculations/vector",
+            json={"operation": "multiply", "operand1": vector_base64([1, 2, 3]), "operand2": vector_base64([4, 5, 6])},
+            headers=headers
+        )
+        assert response.status_code == 201
+        data = response.json()
+        assert data["operation"] == "vector_multiply"
+        assert data["length"] == 3
+        assert data["result"] == 32
+        assert np.frombuffer(base64.b64decode(data["vector_result"]), "<f8").tolist() == [4, 10, 18]
+        
+        stored = client.get(f"/calculations/{data['id']}/vector", headers=headers).json()
+        assert stored["vector_result"] == data["vector_result"]
+        raw = client.get(f"/calculations/{data['id']}/vector/operand2", headers=headers)
+        assert raw.headers["content-type"] == "application/octet-stream"
+        assert np.frombuffer(raw.content, "<f8").tolist() == [4, 5, 6]
+    
+    def test_dot_product_octet_stream(self, auth_token):
+        """Test raw bytes in and out for a 10k-element dot product"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        a = np.arange(10000, dtype="<f8")
+        b = np.full(10000, 0.5, dtype="<f8")
+        response = client.post(
+            "/calculations/vector?operation=dot",
+            content=a.tobytes() + b.tobytes(),
+            headers={**headers, "Content-Type": "application/octet-stream", "Accept": "application/octet-stream"}
+        )
+        assert response.status_code == 201
+        assert np.frombuffer(response.content, "<f8").tolist() == [float(a @ b)]
+        assert float(response.headers["X-Result"]) == float(a @ b)
+        
+        calc_id = response.headers["X-Calculation-Id"]
+        stored = client.get(f"/calculations/{calc_id}/vector", headers=headers).json()
+        assert stored["length"] == 10000
+        assert stored["vector_result"] is None
+        operand1 = client.get(f"/calculations/{calc_id}/vector/operand1", headers=headers)
+        assert operand1.content == a.tobytes()
+    
+    def test_invalid_vectors(self, auth_token):
+        """Test mismatched, malformed and failing operands are rejected"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for operand1, operand2, operation in (
+            (vector_base64([1, 2]), vector_base64([1]), "add"),
+            ("not base64!", vector_base64([1]), "add"),
+            (base64.b64encode(b"abc").decode(), vector_base64([1]), "add"),
+            (vector_base64([1, 2]), vector_base64([1, 0]), "divide"),
+            (vector_base64([float("nan")]), vector_base64([1]), "add"),
+        ):
+            response = client.post(
+                "/calculations/vector",
+                json={"operation": operation, "operand1": operand1, "operand2": operand2},
+                headers=headers
+            )
+            assert response.status_code == 400
+        
+        response = client.post(
+            "/calculations/vector",
+            content=b"\0" * 24,
+            headers={**headers, "Content-Type": "application/octet-stream"}
+        )
+        assert response.status_code == 400
+        response = client.post("/calculations/vector", content="1,2", headers={**headers, "Content-Type": "text/csv"})
+        assert response.status_code == 415
+    
+    def test_statistics_and_delete(self, auth_token):
+        """Test vectors stay out of operand averages and go with their calculation"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/calculations/", json={"operation": "add", "operand1": 4, "operand2": 2}, headers=headers)
+        first = client.post(
+            "/calculations/vector",
+            json={"operation": "add", "operand1": vector_base64([1, 2]), "operand2": vector_base64([3, 4])},
+            headers=headers
+        ).json()
+        client.post(
+            "/calculations/vector",
+            json={"operation": "dot", "operand1": vector_base64([1, 2]), "operand2": vector_base64([3, 4])},
+            headers=headers
+        )
+        
+        stats = client.get("/history/statistics", headers=headers).json()
+        assert stats["operations_count"] == {"add": 1, "vector_add": 1, "dot": 1}
+        assert stats["average_operand1"] == 4
+        assert stats["average_result"] == 9
+        
+        assert client.delete(f"/calculations/{first['id']}", headers=headers).status_code == 204
+        assert client.get(f"/calculations/{first['id']}/vector", headers=headers).status_code == 404
+        client.delete("/history/", headers=headers)
+        db = TestingSessionLocal()
+        assert db.query(CalculationVector).count() == 0
+        assert UserStatsService.verify(db) == []
+        db.close()
+
+class TestBatchEndpoint:
+    
+    def test_batch_items(self, auth_token):
+        """Test a batch of items with a per-item error"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        response = client.post(
+            "/calculations/batch",
+            json={"items": [
+                {"operation": "add", "operand1": 1, "operand2": 2},
+                {"operation": "divide", "operand1": 1, "operand2": 0},
+                {"operation": "multiply", "operand1": 3, "operand2": 4},
+            ]},
+            headers=headers
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["succeeded"] == 2
+        assert data["failed"] == 1
+        assert data["results"] == [3, None, 12]
+        assert data["ids"][1] is None
+        assert data["errors"] == [{"index": 1, "detail": "Cannot divide by zero"}]
+        
+        stored = client.get(f"/calculations/{data['ids'][2]}", headers=headers).json()
+        assert stored["result"] == 12
+        stats = client.get("/history/statistics", headers=headers).json()
+        assert stats["operations_count"] == {"add": 1, "multiply": 1}
+    
+    def test_batch_columnar(self, auth_token):
+        """Test the columnar batch form"""
+        response = client.post(
+            "/calculations/batch",
+            json={
+                "operations": ["add", "subtract"],
+                "operand1": [1, 5],
+                "operand2": [1, 2]
+            },
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 200
+        assert response.json()["results"] == [2, 3]
+    
+    def test_batch_rejects_mismatched_columns(self, auth_token):
+        """Test columns of different lengths fail validation"""
+        response = client.post(
+            "/calculations/batch",
+            json={"operations": ["add"], "operand1": [1, 2], "operand2": [1]},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 422
+
+class TestCalculationImport:
+    
+    @pytest.fixture
+    def headers(self, auth_token):
+        return {"Authorization": f"Bearer {auth_token}"}
+    
+    def test_import_csv(self, headers, monkeypatch):
+        """Test a CSV upload, split across chunks, is imported with bad rows reported"""
+        monkeypatch.setattr(settings, "IMPORT_CHUNK_ROWS", 2)
+        body = [
+            b"operation,operand1,operand2,result\nadd,1,2,3\nmul",
+            b"tiply,2,3,\ndivide,1,0,\nadd,x,1,\nsubtract,5,3,99\n",
+            b"add,10,5,15",
+        ]
+        response = client.post(
+            "/calculations/import",
+            content=iter(body),
+            headers={**headers, "Content-Type": "text/csv"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 6
+        assert data["accepted"] == 3
+        assert data["rejected"] == 3
+        assert [(error["line"], error["detail"]) for error in data["errors"]] == [
+            (4, "Cannot divide by zero"),
+            (5, "operand1 must be a number"),
+            (6, "Result 99.0 does not match computed 2.0"),
+        ]
+        
+        calculations = client.get("/calculations/", headers=headers).json()
+        assert sorted(calc["result"] for calc in calculations) == [3, 6, 15]
+        stats = client.get("/history/statistics", headers=headers).json()
+        assert stats["total_calculations"] == 3
+    
+    def test_import_export_round_trip(self, headers):
+        """Test an NDJSON export imports back with its timestamps"""
+        client.post(
+            "/calculations/batch",
+            json={"operations": ["add", "divide"], "operand1": [1, 1], "operand2": [2, 3]},
+            headers=headers
+        )
+        exported = client.get("/history/export", headers=headers)
+        client.delete("/history/", headers=headers)
+        
+        response = client.post(
+            "/calculations/import",
+            params={"format": "ndjson"},
+            content=exported.content,
+            headers=headers
+        )
+        assert response.json()["accepted"] == 2
+        imported = client.get("/history/export", headers=headers).text.splitlines()
+        before = exported.text.splitlines()
+        strip = lambda line: {k: v for k, v in json.loads(line).items() if k != "id"}
+        assert [strip(line) for line in imported] == [strip(line) for line in before]
+    
+    def test_import_unsupported_media_type(self, headers):
+        """Test uploads of unknown formats are refused"""
+        response = client.post(
+            "/calculations/import",
+            content=b"{}",
+            headers={**headers, "Content-Type": "application/json"}
+        )
+        assert response.status_code == 415
+    
+    def test_import_csv_missing_columns(self, headers):
+        """Test a CSV header without the required columns is rejected"""
+        response = client.post(
+            "/calculations/import",
+            content=b"operation,operand1\nadd,1\n",
+            headers={**headers, "Content-Type": "text/csv"}
+        )
+        assert response.status_code == 400
+        assert "operand2" in response.json()["detail"]
+
 class TestHistoryEndpoints:
     
     def test_get_history(self, auth_token):
@@ -195,6 +566,28 @@ class TestHistoryEndpoints:
         assert data["total_calculations"] == 3
         assert len(data["calculations"]) == 3
     
+    def test_get_history_keyset_pagination(self, auth_token):
+        """Test history pages run newest first and chain via next_cursor"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for i in range(3):
+            client.post(
+                "/calculations/",
+                json={"operation": "add", "operand1": i, "operand2": 0},
+                headers=headers
+            )
+        
+        first = client.get("/history/", params={"limit": 2}, headers=headers).json()
+        assert [calc["operand1"] for calc in first["calculations"]] == [2, 1]
+        assert first["next_cursor"]
+        
+        second = client.get(
+            "/history/",
+            params={"limit": 2, "after": first["next_cursor"]},
+            headers=headers
+        ).json()
+        assert [calc["operand1"] for calc in second["calculations"]] == [0]
+        assert second["next_cursor"] is None
+    
     def test_get_statistics(self, auth_token):
         """Test getting calculation statistics"""
         # Create calculations
@@ -220,6 +613,42 @@ class TestHistoryEndpoints:
         assert data["operations_count"]["add"] == 1
         assert data["operations_count"]["multiply"] == 1
     
+    def test_get_statistics_aggregates(self, auth_token):
+        """Test statistics averages, most used operation and latest calculation"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for payload in [
+            {"operation": "multiply", "operand1": 2, "operand2": 3},
+            {"operation": "add", "operand1": 4, "operand2": 1},
+            {"operation": "add", "operand1": 6, "operand2": 2},
+            {"operation": "multiply", "operand1": 1, "operand2": 1},
+        ]:
+            client.post("/calculations/", json=payload, headers=headers)
+        
+        response = client.get("/history/statistics", headers=headers)
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_calculations"] == 4
+        assert data["operations_count"] == {"multiply": 2, "add": 2}
+        assert data["average_operand1"] == 3.25
+        assert data["average_operand2"] == 1.75
+        assert data["average_result"] == 5.0
+        # Ties go to the operation that was used first
+        assert data["most_used_operation"] == "multiply"
+        assert data["latest_calculation"]["operation"] == "multiply"
+        assert data["latest_calculation"]["result"] == 1
+    
+    def test_get_statistics_empty(self, auth_token):
+        """Test statistics for a user without calculations"""
+        response = client.get(
+            "/history/statistics",
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total_calculations"] == 0
+        assert data["operations_count"] == {}
+        assert data["latest_calculation"] is None
+    
     def test_clear_history(self, auth_token):
         """Test clearing calculation history"""
         # Create calculations
@@ -243,3 +672,782 @@ class TestHistoryEndpoints:
         )
         data = response.json()
         assert data["total_calculations"] == 0
+
+class TestHistoryExport:
+    
+    @pytest.fixture
+    def headers(self, auth_token, monkeypatch):
+        # Small chunks so the export spans several cursor fetches
+        monkeypatch.setattr(settings, "EXPORT_CHUNK_ROWS", 2)
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post(
+            "/calculations/batch",
+            json={"operations": ["add"] * 5, "operand1": [0, 1, 2, 3, 4], "operand2": [1] * 5},
+            headers=headers
+        )
+        return headers
+    
+    def test_export_ndjson(self, headers):
+        """Test exporting history as newline-delimited JSON, oldest first"""
+        response = client.get("/history/export", headers={**headers, "Accept-Encoding": "identity"})
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        assert "content-encoding" not in response.headers
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert [row["operand1"] for row in rows] == [0, 1, 2, 3, 4]
+        assert list(rows[0]) == list(CalculationResponse.model_fields)
+    
+    def test_export_csv(self, headers):
+        """Test exporting history as CSV with a header row"""
+        response = client.get("/history/export", params={"format": "csv"}, headers=headers)
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert 'filename="calculations.csv"' in response.headers["content-disposition"]
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert len(rows) == 5
+        assert [float(row["result"]) for row in rows] == [1, 2, 3, 4, 5]
+    
+    def test_export_gzip(self, headers):
+        """Test the export is gzipped when the client accepts it"""
+        response = client.get(
+            "/history/export",
+            headers={**headers, "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        # httpx decompresses transparently
+        assert len(response.text.splitlines()) == 5
+    
+    def test_export_invalid_format(self, headers):
+        """Test unknown export formats are rejected"""
+        response = client.get("/history/export", params={"format": "xml"}, headers=headers)
+        assert response.status_code == 422
+
+class TestStatisticsRollup:
+    
+    def _create(self, auth_token, operation, operand1, operand2):
+        response = client.post(
+            "/calculations/",
+            json={"operation": operation, "operand1": operand1, "operand2": operand2},
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        return response.json()["id"]
+    
+    def test_rollup_matches_aggregation(self, auth_token):
+        """Test the rollup tracks creates and deletes"""
+        ids = [
+            self._create(auth_token, "add", 1, 2),
+            self._create(auth_token, "divide", 9, 3),
+            self._create(auth_token, "divide", 8, 2),
+            self._create(auth_token, "subtract", 5, 7),
+        ]
+        client.delete(f"/calculations/{ids[1]}", headers={"Authorization": f"Bearer {auth_token}"})
+        client.delete(f"/calculations/{ids[3]}", headers={"Authorization": f"Bearer {auth_token}"})
+        
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.username == "testuser").first()
+            rollup = UserStatsService.get_statistics(db, user.id)
+            aggregated = CalculationService.get_user_statistics(db, user.id)
+            assert rollup["latest_calculation"].id == ids[2]
+            rollup["latest_calculation"] = rollup["latest_calculation"].id
+            aggregated["latest_calculation"] = aggregated["latest_calculation"].id
+            assert rollup == aggregated
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+    
+    def test_rollup_cleared_with_history(self, auth_token):
+        """Test clearing history zeroes the rollup"""
+        self._create(auth_token, "add", 1, 2)
+        client.delete("/history/", headers={"Authorization": f"Bearer {auth_token}"})
+        
+        response = client.get(
+            "/history/statistics",
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        assert response.json()["total_calculations"] == 0
+        
+        db = TestingSessionLocal()
+        try:
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+    
+    def test_verify_and_rebuild(self, auth_token):
+        """Test drift is reported and repaired by a rebuild"""
+        self._create(auth_token, "multiply", 3, 4)
+        
+        db = TestingSessionLocal()
+        try:
+            db.query(UserStats).update({UserStats.total_calculations: 5})
+            db.commit()
+            drift = UserStatsService.verify(db)
+            assert len(drift) == 1
+            assert "total_calculations 5 != 1" in drift[0]
+            
+            UserStatsService.rebuild(db)
+            db.commit()
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+
+    def test_rollup_row_built_from_existing_history(self, auth_token):
+        """Test a user with history but no rollup row gets one counting all of it"""
+        self._create(auth_token, "add", 1, 2)
+        self._create(auth_token, "multiply", 3, 4)
+        db = TestingSessionLocal()
+        try:
+            # As after upgrading from before the rollup existed
+            db.query(UserOperationStats).delete()
+            db.query(UserStats).delete()
+            db.commit()
+        finally:
+            db.close()
+        
+        self._create(auth_token, "add", 5, 6)
+        response = client.get(
+            "/history/statistics",
+            headers={"Authorization": f"Bearer {auth_token}"}
+        )
+        data = response.json()
+        assert data["total_calculations"] == 3
+        assert data["operations_count"] == {"add": 2, "multiply": 1}
+        assert data["average_operand1"] == 3
+        
+        db = TestingSessionLocal()
+        try:
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+
+    def test_sums_exact_after_deleting_large_value(self, auth_token):
+        """Test deleting a calculation that swamped the float sums leaves exact totals"""
+        self._create(auth_token, "add", 1, 1)
+        large = self._create(auth_token, "add", 1e20, 0)
+        client.delete(f"/calculations/{large}", headers={"Authorization": f"Bearer {auth_token}"})
+        
+        data = client.get("/history/statistics", headers={"Authorization": f"Bearer {auth_token}"}).json()
+        assert data["average_operand1"] == 1.0
+        assert data["average_result"] == 2.0
+        db = TestingSessionLocal()
+        try:
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+    
+    def test_delete_and_clear_without_rollup_row(self, auth_token):
+        """Test deletes work for a user with no rollup row, and statistics stay right"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        first = self._create(auth_token, "add", 1, 2)
+        self._create(auth_token, "multiply", 3, 4)
+        db = TestingSessionLocal()
+        try:
+            db.query(UserOperationStats).delete()
+            db.query(UserStats).delete()
+            db.commit()
+        finally:
+            db.close()
+        
+        assert client.delete(f"/calculations/{first}", headers=headers).status_code == 204
+        data = client.get("/history/statistics", headers=headers).json()
+        assert data["total_calculations"] == 1
+        assert data["operations_count"] == {"multiply": 1}
+        
+        assert client.delete("/history/", headers=headers).status_code == 204
+        assert client.get("/history/statistics", headers=headers).json()["total_calculations"] == 0
+    
+    def test_missing_row_created_concurrently(self, auth_token):
+        """Test a rollup row another transaction created first only gets this one's increments"""
+        self._create(auth_token, "add", 1, 2)
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.username == "testuser").first()
+            calc = Calculation(user_id=user.id, operation="add", operand1=3, operand2=4, result=7)
+            db.add(calc)
+            db.flush()
+            # As if this transaction found no row and another then inserted one
+            UserStatsService._insert_counted(db, user.id, *_rollup_increments([calc]))
+            db.commit()
+            assert db.get(UserStats, user.id, populate_existing=True).total_calculations == 2
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+
+class TestUserCache:
+    
+    def test_repeat_requests_hit_cache(self, auth_token):
+        """Test the authenticated user is looked up once per token subject"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.get("/calculations/", headers=headers)
+        client.get("/calculations/", headers=headers)
+        assert user_cache.stats()["hits"] >= 1
+        assert "testuser" in user_cache._data
+    
+    def test_user_change_invalidates_cache(self, auth_token):
+        """Test updating a user drops the cached entry"""
+        client.get("/calculations/", headers={"Authorization": f"Bearer {auth_token}"})
+        
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.username == "testuser").first()
+            user.email = "changed@example.com"
+            db.commit()
+        finally:
+            db.close()
+        assert "testuser" not in user_cache._data
+    
+    def test_embedded_user_id_skips_lookup(self, test_user, monkeypatch):
+        """Test tokens carrying the user id authenticate without a lookup, until the user is deleted"""
+        monkeypatch.setattr(settings, "AUTH_EMBED_USER_ID", True)
+        token = client.post("/auth/login", data=test_user).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        
+        response = client.post(
+            "/calculations/",
+            json={"operation": "add", "operand1": 1, "operand2": 1},
+            headers=headers
+        )
+        assert response.status_code == 201
+        assert user_cache.stats()["misses"] == 0
+        
+        db = TestingSessionLocal()
+        try:
+            db.delete(db.query(User).filter(User.username == "testuser").first())
+            db.commit()
+        finally:
+            db.close()
+        assert client.get("/calculations/", headers=headers).status_code == 401
+    
+    def test_reregistered_username_stays_revoked(self, test_user, monkeypatch):
+        """Test a deleted user's tokens stay revoked when the username is registered again"""
+        monkeypatch.setattr(settings, "AUTH_EMBED_USER_ID", True)
+        old_token = client.post("/auth/login", data=test_user).json()["access_token"]
+        db = TestingSessionLocal()
+        try:
+            user = db.query(User).filter(User.username == "testuser").first()
+            old_id = user.id
+            # What ON DELETE CASCADE does where foreign keys are enforced
+            db.query(UserOperationStats).filter(UserOperationStats.user_id == old_id).delete()
+            db.query(UserStats).filter(UserStats.user_id == old_id).delete()
+            db.delete(user)
+            db.commit()
+        finally:
+            db.close()
+        
+        response = client.post(
+            "/auth/register",
+            json={"username": "testuser", "email": "test@example.com", "password": "testpass123"}
+        )
+        assert response.status_code == 201
+        new_token = client.post("/auth/login", data=test_user).json()["access_token"]
+        assert client.get("/calculations/", headers={"Authorization": f"Bearer {old_token}"}).status_code == 401
+        assert client.get("/calculations/", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+        
+        # Other workers apply the same revocation from the broadcast message
+        revoked_users.clear()
+        auth._apply_user_change(b"revoke\n" + json.dumps(["testuser", old_id, auth.decode_claims(old_token)["iat"]]).encode())
+        assert client.get("/calculations/", headers={"Authorization": f"Bearer {old_token}"}).status_code == 401
+        assert client.get("/calculations/", headers={"Authorization": f"Bearer {new_token}"}).status_code == 200
+    
+    def test_token_claims_cached(self, auth_token, monkeypatch):
+        """Test a token's signature is verified once, and bad tokens are never cached"""
+        token_cache.clear()
+        decoded = []
+        decode = auth.jwt_backend.decode
+        monkeypatch.setattr(auth.jwt_backend, "decode", lambda token: decoded.append(token) or decode(token))
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        assert client.get("/history/", headers=headers).status_code == 200
+        assert client.get("/history/", headers=headers).status_code == 200
+        assert decoded == [auth_token]
+        
+        forged = auth_token[:-2] + ("AA" if not auth_token.endswith("AA") else "BB")
+        for _ in range(2):
+            assert client.get("/history/", headers={"Authorization": f"Bearer {forged}"}).status_code == 401
+        assert decoded == [auth_token, forged, forged]
+
+async def read_stream(path, until, actions):
+    """Drive a streaming GET on the app directly (TestClient waits for the body to end).
+    
+    Runs ``actions`` in a thread once the first chunk arrives, and returns the
+    body received by the time every string in ``until`` has appeared.
+    """
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http", "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(),
+        "headers": [], "client": ("testclient", 50000), "server": ("testserver", 80),
+        "root_path": "",
+    }
+    disconnect = asyncio.Event()
+    chunks = asyncio.Queue()
+    request_sent = False
+    status = []
+    
+    async def receive():
+        nonlocal request_sent
+        if request_sent:
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+        request_sent = True
+        return {"type": "http.request", "body": b"", "more_body": False}
+    
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+        elif message["type"] == "http.response.body":
+            await chunks.put(message.get("body", b""))
+    
+    task = asyncio.create_task(app(scope, receive, send))
+    body = await asyncio.wait_for(chunks.get(), 5)
+    await asyncio.to_thread(actions)
+    while not all(text.encode() in body for text in until):
+        body += await asyncio.wait_for(chunks.get(), 5)
+    disconnect.set()
+    await asyncio.wait_for(task, 5)
+    return status[0], body.decode()
+
+class TestStatisticsTimeseries:
+    
+    @pytest.fixture
+    def headers(self, auth_token):
+        """Five calculations over two days, imported with their timestamps"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        body = "\n".join([
+            "operation,operand1,operand2,created_at",
+            "add,1,1,2026-03-01T10:15:00",
+            "add,2,2,2026-03-01T10:45:00",
+            "multiply,3,3,2026-03-01T12:00:00",
+            "subtract,5,1,2026-03-02T00:30:00",
+            # 23:00 UTC on 1 March
+            "divide,8,2,2026-03-02T01:00:00+02:00",
+        ])
+        response = client.post("/calculations/import", content=body, headers={**headers, "Content-Type": "text/csv"})
+        assert response.json()["accepted"] == 5
+        return headers
+    
+    def test_daily_buckets(self, headers):
+        """Test per-day counts, operations and average result, empty days included"""
+        response = client.get(
+            "/history/statistics/timeseries?bucket=day&from=2026-02-28T00:00:00&to=2026-03-03T00:00:00",
+            headers=headers
+        )
+        assert response.status_code == 200
+        buckets = response.json()["buckets"]
+        assert [bucket["start"] for bucket in buckets] == [
+            "2026-02-28T00:00:00", "2026-03-01T00:00:00", "2026-03-02T00:00:00"
+        ]
+        assert buckets[0] == {"start": "2026-02-28T00:00:00", "count": 0, "operations_count": {}, "average_result": None}
+        assert buckets[1]["count"] == 4
+        assert buckets[1]["operations_count"] == {"add": 2, "divide": 1, "multiply": 1}
+        assert buckets[1]["average_result"] == 4.75
+        assert buckets[2]["operations_count"] == {"subtract": 1}
+    
+    def test_hourly_buckets_and_deletes(self, headers):
+        """Test hourly buckets, and that deleting calculations leaves usage alone"""
+        path = "/history/statistics/timeseries?bucket=hour&from=2026-03-01T10:30:00%2B00:00&to=2026-03-01T13:00:00Z"
+        buckets = client.get(path, headers=headers).json()["buckets"]
+        assert [(bucket["start"], bucket["count"]) for bucket in buckets] == [
+            ("2026-03-01T10:00:00", 2), ("2026-03-01T11:00:00", 0), ("2026-03-01T12:00:00", 1)
+        ]
+        client.delete("/history/", headers=headers)
+        assert client.get(path, headers=headers).json()["buckets"] == buckets
+    
+    def test_invalid_ranges(self, headers):
+        """Test reversed and oversized ranges are rejected"""
+        base = "/history/statistics/timeseries"
+        assert client.get(f"{base}?from=2026-03-02T00:00:00&to=2026-03-01T00:00:00", headers=headers).status_code == 400
+        assert client.get(f"{base}?bucket=hour&from=2020-01-01T00:00:00&to=2026-01-01T00:00:00", headers=headers).status_code == 400
+        assert client.get(f"{base}?bucket=week", headers=headers).status_code == 422
+        assert len(client.get(base, headers=headers).json()["buckets"]) in (30, 31)
+    
+    def test_prune_and_rebuild(self, headers):
+        """Test pruning drops old hourly rows only, and rebuild recounts stored calculations"""
+        db = TestingSessionLocal()
+        try:
+            before = db.query(UsageBucket).count()
+            pruned = UsageService.prune(db, datetime(2026, 3, 2))
+            db.commit()
+            assert pruned == 3
+            assert db.query(UsageBucket).filter(UsageBucket.resolution == "day").count() == 4
+            
+            assert UsageService.rebuild(db) == before
+            db.commit()
+        finally:
+            db.close()
+
+class TestHistoryStream:
+    
+    def test_stream_pushes_changes(self, auth_token):
+        """Test created, deleted and cleared events reach the user's stream"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        
+        def actions():
+            created = client.post(
+                "/calculations/", json={"operation": "add", "operand1": 1, "operand2": 2}, headers=headers
+            ).json()
+            client.delete(f"/calculations/{created['id']}", headers=headers)
+            client.delete("/history/", headers=headers)
+        
+        ticket = client.post("/history/stream/ticket", headers=headers).json()["ticket"]
+        status, body = asyncio.run(read_stream(
+            f"/history/stream?ticket={ticket}", ["event: cleared"], actions
+        ))
+        assert status == 200
+        frames = body.split("\n\n")
+        assert frames[0] == "retry: 3000"
+        assert frames[1] == "event: ready\ndata: {}"
+        created = json.loads(frames[2].split("data: ")[1])["calculations"][0]
+        assert created["result"] == 3
+        assert frames[3] == f'event: deleted\ndata: {{"ids":[{created["id"]}]}}'
+        assert frames[4] == "event: cleared\ndata: {}"
+        assert event_hub.subscriber_count() == 0
+    
+    def test_stream_requires_token(self, auth_token):
+        """Test the stream rejects missing or bad tickets, and access tokens in the URL"""
+        assert client.get("/history/stream").status_code == 401
+        assert client.get("/history/stream?ticket=bad").status_code == 401
+        assert client.get(f"/history/stream?ticket={auth_token}").status_code == 401
+        assert client.get(f"/history/stream?token={auth_token}").status_code == 401
+        assert client.post("/history/stream/ticket").status_code == 401
+    
+    def test_ticket_opens_only_the_stream(self, auth_token, monkeypatch):
+        """Test a stream ticket is short-lived and no good as an access token"""
+        response = client.post("/history/stream/ticket", headers={"Authorization": f"Bearer {auth_token}"})
+        assert response.status_code == 200
+        assert response.json()["expires_in"] == settings.STREAM_TICKET_TTL_SECONDS
+        ticket = response.json()["ticket"]
+        assert client.get("/history/", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+        assert client.post("/history/stream/ticket", headers={"Authorization": f"Bearer {ticket}"}).status_code == 401
+        
+        monkeypatch.setattr(settings, "STREAM_TICKET_TTL_SECONDS", -1)
+        expired = create_stream_ticket(User(username="testuser"))
+        assert client.get(f"/history/stream?ticket={expired}").status_code == 401
+
+class TestConditionalGet:
+    
+    def test_history_not_modified_until_write(self, auth_token):
+        """Test If-None-Match gets 304 until a create, delete or clear"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        created = client.post(
+            "/calculations/", json={"operation": "add", "operand1": 1, "operand2": 2}, headers=headers
+        ).json()
+        
+        etags = []
+        for write in (
+            lambda: client.post("/calculations/", json={"operation": "add", "operand1": 3, "operand2": 4}, headers=headers),
+            lambda: client.delete(f"/calculations/{created['id']}", headers=headers),
+            lambda: client.delete("/history/", headers=headers),
+        ):
+            for path in ("/history/", "/history/statistics"):
+                response = client.get(path, headers=headers)
+                assert response.status_code == 200
+                etag = response.headers["ETag"]
+                assert response.headers["Cache-Control"] == "private, no-cache"
+                
+                cached = client.get(path, headers={**headers, "If-None-Match": f'W/"x", {etag}'})
+                assert cached.status_code == 304
+                assert cached.content == b""
+                assert cached.headers["ETag"] == etag
+            etags.append(etag)
+            write()
+            assert client.get("/history/", headers={**headers, "If-None-Match": etag}).status_code == 200
+        assert len(set(etags)) == 3
+    
+    def test_not_modified_skips_calculation_queries(self, auth_token):
+        """Test a 304 is answered without touching the calculations table"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        client.post("/calculations/", json={"operation": "add", "operand1": 1, "operand2": 2}, headers=headers)
+        etag = client.get("/history/statistics", headers=headers).headers["ETag"]
+        
+        statements = []
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            for path in ("/history/", "/history/statistics"):
+                assert client.get(path, headers={**headers, "If-None-Match": etag}).status_code == 304
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+        assert statements
+        assert not any("FROM calculations" in statement for statement in statements)
+    
+    def test_no_etag_without_rollup_row(self, auth_token):
+        """Test users without a rollup row (data from before it existed) get plain responses"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        db = TestingSessionLocal()
+        db.query(UserStats).delete()
+        db.commit()
+        db.close()
+        response = client.get("/history/", headers=headers)
+        assert response.status_code == 200
+        assert "ETag" not in response.headers
+        assert client.get("/history/", headers={**headers, "If-None-Match": "*"}).status_code == 200
+
+# Async routes against the same test database through aiosqlite
+async_engine = create_async_engine("sqlite+aiosqlite:///./test.db")
+AsyncTestingSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+async def override_get_async_db():
+    async with AsyncTestingSessionLocal() as db:
+        yield db
+
+async_app = FastAPI()
+for async_router in (async_auth.router, async_calculations.router, async_history.router):
+    async_app.include_router(async_router)
+async_app.dependency_overrides[get_async_db] = override_get_async_db
+
+class TestAsyncEndpoints:
+    
+    def test_async_flow(self):
+        """Test register, login, calculations and history on the async stack"""
+        with TestClient(async_app) as async_client:
+            response = async_client.post(
+                "/auth/register",
+                json={"username": "asyncuser", "email": "async@example.com", "password": "asyncpass123"}
+            )
+            assert response.status_code == 201
+            token = async_client.post(
+                "/auth/login",
+                data={"username": "asyncuser", "password": "asyncpass123"}
+            ).json()["access_token"]
+            headers = {"Authorization": f"Bearer {token}"}
+            
+            created = async_client.post(
+                "/calculations/",
+                json={"operation": "multiply", "operand1": 6, "operand2": 7},
+                headers=headers
+            )
+            assert created.status_code == 201
+            assert created.json()["result"] == 42
+            calc_id = created.json()["id"]
+            
+            assert async_client.get(f"/calculations/{calc_id}", headers=headers).json()["result"] == 42
+            assert len(async_client.get("/calculations/", headers=headers).json()) == 1
+            history = async_client.get("/history/", headers=headers)
+            assert history.json()["total_calculations"] == 1
+            etag = history.headers["ETag"]
+            assert async_client.get(
+                "/history/", headers={**headers, "If-None-Match": etag}
+            ).status_code == 304
+            stats = async_client.get("/history/statistics", headers=headers).json()
+            assert stats["operations_count"] == {"multiply": 1}
+            assert stats["latest_calculation"]["id"] == calc_id
+            
+            assert async_client.delete(f"/calculations/{calc_id}", headers=headers).status_code == 204
+            assert async_client.get(f"/calculations/{calc_id}", headers=headers).status_code == 404
+            assert async_client.delete("/history/", headers=headers).status_code == 204
+
+class TestSingleWriter:
+    
+    def test_group_commit(self, user_id):
+        """Test queued inserts are committed together"""
+        writer = SingleWriter(TestingSessionLocal)
+        futures = [
+            writer.submit([Calculation(user_id=user_id, operation="add", operand1=i, operand2=1, result=i + 1)])
+            for i in range(20)
+        ]
+        writer.start()
+        try:
+            saved = [future.result(timeout=10)[0] for future in futures]
+        finally:
+            writer.stop()
+        
+        assert len({calc.id for calc in saved}) == 20
+        assert writer.commits == 1
+        db = TestingSessionLocal()
+        try:
+            assert UserStatsService.get_statistics(db, user_id)["total_calculations"] == 20
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+    
+    def test_failed_item_does_not_fail_batch(self, user_id):
+        """Test a bad insert only fails its own request"""
+        writer = SingleWriter(TestingSessionLocal)
+        good = writer.submit([Calculation(user_id=user_id, operation="add", operand1=1, operand2=1, result=2)])
+        bad = writer.submit([Calculation(user_id=user_id, operation="add", operand1=1, operand2=1, result=None)])
+        writer.start()
+        try:
+            assert good.result(timeout=10)[0].id is not None
+            with pytest.raises(Exception):
+                bad.result(timeout=10)
+        finally:
+            writer.stop()
+
+class TestWriteBehind:
+    
+    def _stored_ids(self):
+        db = TestingSessionLocal()
+        try:
+            return {calc_id for (calc_id,) in db.query(Calculation.id)}
+        finally:
+            db.close()
+    
+    def _calc(self, user_id, operand1):
+        return Calculation(user_id=user_id, operation="add", operand1=operand1, operand2=1, result=operand1 + 1)
+    
+    def test_rows_stored_on_flush(self, user_id):
+        """Test acknowledged rows get ids immediately and are stored on flush"""
+        buffer = WriteBehindBuffer(TestingSessionLocal, IdAllocator(TestingSessionLocal, block_size=10))
+        acknowledged = [buffer.add(self._calc(user_id, i)) for i in range(3)]
+        ids = [calc.id for calc in acknowledged]
+        assert len(set(ids)) == 3
+        assert self._stored_ids() == set()
+        
+        assert buffer.flush() == 3
+        assert self._stored_ids() == set(ids)
+        db = TestingSessionLocal()
+        try:
+            assert UserStatsService.verify(db) == []
+        finally:
+            db.close()
+    
+    def test_max_rows_triggers_flush(self, user_id):
+        """Test reaching max_rows flushes in the caller"""
+        buffer = WriteBehindBuffer(TestingSessionLocal, IdAllocator(TestingSessionLocal), max_rows=2)
+        buffer.add(self._calc(user_id, 1))
+        assert buffer.pending() == 1
+        buffer.add(self._calc(user_id, 2))
+        assert buffer.pending() == 0
+        assert len(self._stored_ids()) == 2
+    
+    def test_other_inserts_use_reserved_ids(self, user_id):
+        """Test inserts outside the buffer cannot take a buffered row's id"""
+        buffer = WriteBehindBuffer(TestingSessionLocal, IdAllocator(TestingSessionLocal), max_delay=60)
+        buffer.start()
+        try:
+            buffered = buffer.add(self._calc(user_id, 1))
+            db = TestingSessionLocal()
+            try:
+                direct = CalculationService.save_calculations(db, [self._calc(user_id, 2)])[0]
+                db.commit()
+                assert direct.id != buffered.id
+            finally:
+                db.close()
+        finally:
+            buffer.stop()
+        assert CalculationService.id_allocator is None
+        assert len(self._stored_ids()) == 2
+
+class TestMetrics:
+    
+    @pytest.fixture
+    def metrics_client(self):
+        metrics.registry.reset()
+        metrics.instrument_engine(engine)
+        return TestClient(metrics.MetricsMiddleware(app))
+    
+    def test_request_phases_recorded(self, metrics_client, auth_token):
+        """Test a request records its route, status and phase timings"""
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        metrics_client.post(
+            "/calculations/",
+            json={"operation": "add", "operand1": 1, "operand2": 2},
+            headers=headers
+        )
+        metrics_client.get("/calculations/999999", headers=headers)
+        
+        request = metrics.registry.histogram(
+            "http_request_duration_seconds",
+            (("method", "POST"), ("route", "/calculations/"), ("status", "201"))
+        )
+        assert request.count == 1
+        for phase in ("auth", "db", "service", "serialize"):
+            timing = metrics.registry.histogram(
+                "http_request_phase_seconds",
+                (("method", "POST"), ("route", "/calculations/"), ("phase", phase))
+            )
+            assert timing.count == 1
+            assert 0 <= timing.sum <= request.sum
+        # Routes are labelled by template, not by the concrete path
+        assert metrics.registry.histogram(
+            "http_request_duration_seconds",
+            (("method", "GET"), ("route", "/calculations/{calculation_id}"), ("status", "404"))
+        ).count == 1
+    
+    def test_auth_cache_samples(self, metrics_client, auth_token):
+        """Test the user and token caches' hits and misses are exported"""
+        user_cache.clear()
+        token_cache.clear()
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        for _ in range(3):
+            metrics_client.get("/history/", headers=headers)
+        
+        text = metrics.registry.render()
+        assert "# TYPE auth_cache_lookups_total counter" in text
+        for name in ("user", "token"):
+            assert f'auth_cache_lookups_total{{cache="{name}",result="hit"}} 2' in text
+            assert f'auth_cache_lookups_total{{cache="{name}",result="miss"}} 1' in text
+            assert f'auth_cache_entries{{cache="{name}"}} 1' in text
+    
+    def test_slow_query_log(self, metrics_client, monkeypatch, caplog):
+        """Test statements over the threshold are logged and counted"""
+        monkeypatch.setattr(settings, "METRICS_SLOW_QUERY_MS", 0)
+        with caplog.at_level("WARNING", logger="app.metrics.slow_query"):
+            metrics_client.post(
+                "/auth/register",
+                json={"username": "slowuser", "email": "slow@example.com", "password": "testpass123"}
+            )
+        assert metrics.registry.counter("db_slow_queries_total") > 0
+        assert any("route /auth/register" in record.getMessage() for record in caplog.records)
+    
+    def test_profile_on_request(self, metrics_client, monkeypatch, tmp_path, auth_token):
+        """Test "X-Profile: 1" writes a folded-stack profile for that request"""
+        monkeypatch.setattr(settings, "PROFILING_ENABLED", True)
+        monkeypatch.setattr(settings, "PROFILE_INTERVAL_MS", 1)
+        monkeypatch.setattr(settings, "PROFILE_DIR", str(tmp_path))
+        response = metrics_client.get(
+            "/history/",
+            headers={"Authorization": f"Bearer {auth_token}", "X-Profile": "1"}
+        )
+        assert response.status_code == 200
+        profile = tmp_path / f"{response.headers['X-Profile-Id']}.folded"
+        assert profile.exists()
+        for line in profile.read_text().splitlines():
+            stack, count = line.rsplit(" ", 1)
+            assert stack and int(count) > 0
+        assert "X-Profile-Id" not in metrics_client.get("/health").headers
+
+class TestRateLimit:
+    
+    @pytest.fixture
+    def limited_client(self):
+        metrics.registry.reset()
+        return TestClient(RateLimitMiddleware(
+            app,
+            ip=TokenBuckets(rate=1000, burst=1000),
+            auth=TokenBuckets(rate=0.01, burst=2),
+            user=TokenBuckets(rate=0.01, burst=3),
+            concurrency={"auth": 4, "write": 4, "read": 4},
+        ))
+    
+    def test_login_rejected_before_db_work(self, limited_client, test_user):
+        """Test logins beyond the per-IP bucket get 429 without touching the database"""
+        form = {"username": test_user["username"], "password": test_user["password"]}
+        assert limited_client.post("/auth/login", data=form).status_code == 200
+        assert limited_client.post("/auth/login", data=form).status_code == 200
+        
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = limited_client.post("/auth/login", data=form)
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) >= 1
+        assert statements == []
+        assert metrics.registry.counter("rate_limit_rejections_total", (("reason", "auth"),)) == 1
+        assert limited_client.get("/health").status_code == 200
+    
+    def test_users_limited_separately(self, limited_client, auth_token):
+        """Test one user's exhausted bucket doesn't affect another user"""
+        client.post("/auth/register", json={"username": "other", "email": "other@example.com", "password": "testpass123"})
+        other_token = client.post("/auth/login", data={"username": "other", "password": "testpass123"}).json()["access_token"]
+        
+        headers = {"Authorization": f"Bearer {auth_token}"}
+        assert [limited_client.get("/history/", headers=headers).status_code for _ in range(4)] == [200, 200, 200, 429]
+        assert limited_client.get("/history/", headers={"Authorization": f"Bearer {other_token}"}).status_code == 200
+        # Bad tokens fall back to the IP bucket and fail authentication as usual
+        assert limited_client.get("/history/", headers={"Authorization": "Bearer nope"}).status_code == 401
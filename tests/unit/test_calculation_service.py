@@ -1,4 +1,7 @@
+import math
+import numpy as np
 import pytest
+from app.cache import ResultCache, TTLCache
 from app.services import CalculationService
 
 class TestCalculationService:
@@ -42,3 +45,117 @@ class TestCalculationService:
         """Test calculation with negative numbers"""
         result = CalculationService.perform_calculation("multiply", -5, 3)
         assert result == -15
+
+
+class TestBatchCalculation:
+    
+    def test_batch_matches_single_calculation(self):
+        """Test vectorized results match perform_calculation"""
+        operations = ["add", "subtract", "multiply", "divide", "divide"]
+        operand1 = [5, 10, -5, 20, 1.5]
+        operand2 = [3, 4, 3, 4, 0.5]
+        results, errors = CalculationService.perform_batch(operations, operand1, operand2)
+        assert errors == {}
+        for i, operation in enumerate(operations):
+            assert results[i] == CalculationService.perform_calculation(operation, operand1[i], operand2[i])
+    
+    def test_batch_reports_errors_by_index(self):
+        """Test divide by zero and invalid operations are reported per item"""
+        results, errors = CalculationService.perform_batch(
+            ["add", "divide", "power", "multiply"],
+            [1, 10, 2, 1e308],
+            [2, 0, 3, 10]
+        )
+        assert errors == {
+            1: "Cannot divide by zero",
+            2: "Invalid operation: power",
+            3: "Result is not a finite number",
+        }
+        assert results[0] == 3
+
+class DictBackend:
+    """Stand-in for a Redis-compatible shared store"""
+    
+    def __init__(self, fail=False):
+        self.data = {}
+        self.fail = fail
+    
+    def get(self, key):
+        if self.fail:
+            raise ConnectionError("down")
+        return self.data.get(key)
+    
+    def set(self, key, value):
+        if self.fail:
+            raise ConnectionError("down")
+        self.data[key] = value
+
+class TestResultCache:
+    
+    @pytest.fixture
+    def cache(self):
+        cache = ResultCache(TTLCache(maxsize=100, ttl=60), DictBackend())
+        CalculationService.result_cache = cache
+        yield cache
+        CalculationService.result_cache = None
+    
+    def test_repeated_calculations_hit(self, cache):
+        """Test identical triples are served from the local cache"""
+        assert CalculationService.perform_calculation("multiply", 1.5, 4.0) == 6.0
+        assert CalculationService.perform_calculation("multiply", 1.5, 4.0) == 6.0
+        stats = cache.stats()
+        assert stats["local_hits"] == 1
+        assert stats["misses"] == 1
+        assert stats["hit_rate"] == 0.5
+    
+    def test_float_edge_cases_keyed_apart(self, cache):
+        """Test -0.0/0.0 stay distinct and NaN/inf are cacheable"""
+        assert math.copysign(1, CalculationService.perform_calculation("multiply", 0.0, 1.0)) == 1
+        assert math.copysign(1, CalculationService.perform_calculation("multiply", -0.0, 1.0)) == -1
+        assert math.isnan(CalculationService.perform_calculation("add", float("nan"), 1.0))
+        assert math.isnan(CalculationService.perform_calculation("add", float("nan"), 1.0))
+        assert CalculationService.perform_calculation("add", float("inf"), 1.0) == float("inf")
+        assert CalculationService.perform_calculation("add", float("inf"), 1.0) == float("inf")
+        assert cache.stats()["local_hits"] == 2
+    
+    def test_shared_tier(self, cache):
+        """Test another process's result is read from the shared store"""
+        CalculationService.perform_calculation("divide", 1.0, 3.0)
+        cache.local.clear()
+        assert CalculationService.perform_calculation("divide", 1.0, 3.0) == 1.0 / 3.0
+        assert cache.stats()["shared_hits"] == 1
+    
+    def test_shared_tier_failure_recomputes(self, cache):
+        """Test an unavailable shared store never fails a calculation"""
+        cache.shared.fail = True
+        assert CalculationService.perform_calculation("add", 1.0, 2.0) == 3.0
+        assert cache.stats()["shared_errors"] == 2
+    
+    def test_errors_and_ints_not_cached(self, cache):
+        """Test failures and non-float operands bypass the cache"""
+        with pytest.raises(ValueError, match="Cannot divide by zero"):
+            CalculationService.perform_calculation("divide", 1.0, 0.0)
+        assert CalculationService.perform_calculation("add", 2**60, 1) == 2**60 + 1
+        assert cache.stats()["size"] == 0
+
+class TestPerformVector:
+    
+    def test_elementwise_and_dot(self):
+        """Test elementwise results sum into the scalar result; dot has no vector"""
+        a = np.array([1.0, 2.0, 3.0])
+        b = np.array([4.0, 5.0, 6.0])
+        values, result = CalculationService.perform_vector("subtract", a, b)
+        assert values.tolist() == [-3.0, -3.0, -3.0]
+        assert result == -9.0
+        assert CalculationService.perform_vector("dot", a, b) == (None, 32.0)
+    
+    def test_vector_errors(self):
+        """Test mismatched lengths, zero divisors and overflow"""
+        with pytest.raises(ValueError, match="same length"):
+            CalculationService.perform_vector("add", np.ones(2), np.ones(3))
+        with pytest.raises(ValueError, match="Cannot divide by zero"):
+            CalculationService.perform_vector("divide", np.ones(2), np.array([1.0, 0.0]))
+        with pytest.raises(ValueError, match="not a finite number"):
+            CalculationService.perform_vector("multiply", np.array([1e200]), np.array([1e200]))
+        with pytest.raises(ValueError, match="Invalid operation"):
+            CalculationService.perform_vector("power", np.ones(1), np.ones(1))
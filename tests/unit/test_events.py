@@ -0,0 +1,83 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+import orjson
+from app import events
+from app.events import EventHub, RESYNC_FRAME, sse_frame
+from app.shared_state import MemoryState
+
+class TestEventHub:
+    
+    def test_no_subscribers_skips_encoding(self):
+        """Test publishing with nobody listening never builds the event"""
+        def fail():
+            raise AssertionError("built an unwanted event")
+        EventHub().publish(1, "created", fail)
+    
+    def test_publish_from_another_thread(self):
+        """Test events published from a worker thread reach the user's streams only"""
+        hub = EventHub()
+        
+        async def run():
+            mine = hub.subscribe(1)
+            other = hub.subscribe(2)
+            thread = threading.Thread(target=hub.publish, args=(1, "deleted", lambda: {"ids": [7]}))
+            thread.start()
+            thread.join()
+            frame = await asyncio.wait_for(mine.get(), 1)
+            assert other.queue.empty()
+            hub.unsubscribe(mine)
+            hub.unsubscribe(other)
+            return frame
+        
+        assert asyncio.run(run()) == b'event: deleted\ndata: {"ids":[7]}\n\n'
+        assert hub.subscriber_count() == 0
+    
+    def test_slow_stream_gets_resync(self):
+        """Test a stream that falls behind loses its backlog for a resync"""
+        hub = EventHub(queue_size=2)
+        
+        async def run():
+            subscription = hub.subscribe(1)
+            for i in range(3):
+                hub.publish(1, "deleted", lambda: {"ids": [i]})
+            await asyncio.sleep(0)
+            return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+        
+        assert asyncio.run(run()) == [RESYNC_FRAME]
+    
+    def test_shared_state_fans_out_across_hubs(self):
+        """Test an event published in one process reaches streams in another"""
+        state = MemoryState()
+        publisher, listener = EventHub(), EventHub()
+        publisher.start(state)
+        listener.start(state)
+        
+        async def run():
+            subscription = listener.subscribe(3)
+            publisher.publish(3, "cleared", dict)
+            return await asyncio.wait_for(subscription.get(), 1)
+        
+        assert asyncio.run(run()) == sse_frame("cleared", {})
+        listener.stop()
+        publisher.stop()
+        assert state._subscribers[EventHub.CHANNEL] == []
+    
+    def test_large_batches_become_resync(self, monkeypatch):
+        """Test created events carry calculations, and big batches ask for a refetch"""
+        hub = EventHub()
+        monkeypatch.setattr(events, "event_hub", hub)
+        calc = SimpleNamespace(
+            id=1, user_id=1, operation="add", operand1=1.0, operand2=2.0, result=3.0,
+            created_at=None, expression=None, variables=None
+        )
+        
+        async def run():
+            subscription = hub.subscribe(1)
+            events.publish_created(1, [calc])
+            events.publish_created(1, [calc] * (events.MAX_EVENT_CALCULATIONS + 1))
+            return await subscription.get(), await subscription.get()
+        
+        created, resync = asyncio.run(run())
+        assert orjson.loads(created.split(b"data: ")[1])["calculations"][0]["result"] == 3.0
+        assert resync == RESYNC_FRAME
@@ -0,0 +1,58 @@
+import math
+import pytest
+from app.expressions import compile_expression, evaluate_expression
+
+class TestExpressions:
+    
+    def test_arithmetic_with_variables(self):
+        """Test a multi-step formula with variable bindings"""
+        assert evaluate_expression("(a+b)*c/d", {"a": 1, "b": 2, "c": 3, "d": 4}) == 2.25
+    
+    def test_extended_operators(self):
+        """Test power (** and ^), modulo and functions"""
+        assert evaluate_expression("2^3 + 2**3", {}) == 16
+        assert evaluate_expression("7 % 3 + mod(7, 3)", {}) == 2
+        assert evaluate_expression("sqrt(x^2 + y^2)", {"x": 3, "y": 4}) == 5
+        assert evaluate_expression("pow(2, 10) + abs(-1) + max(1, 5, 3)", {}) == 1030
+        assert evaluate_expression("-pi", {}) == -math.pi
+    
+    def test_compiled_once_per_text(self):
+        """Test repeated formulas reuse the cached compiled form"""
+        text = "x * 2 + y"
+        compiled = compile_expression(text)
+        hits = compile_expression.cache_info().hits
+        assert evaluate_expression(text, {"x": 1, "y": 1}) == 3
+        assert evaluate_expression(text, {"x": 5, "y": 0}) == 10
+        assert compile_expression(text) is compiled
+        assert compile_expression.cache_info().hits == hits + 3
+        assert compiled.variables == {"x", "y"}
+    
+    @pytest.mark.parametrize("expression", [
+        "__import__('os')",
+        "a.b",
+        "(1, 2)",
+        "x if y else z",
+        "open('f')",
+        "a # comment",
+        "lambda: 1",
+        "sqrt",
+        "sqrt(1, 2)",
+        "a < b",
+        "",
+    ])
+    def test_rejects_non_arithmetic(self, expression):
+        """Test anything but arithmetic is refused before evaluation"""
+        with pytest.raises(ValueError):
+            compile_expression(expression)
+    
+    @pytest.mark.parametrize("expression,message", [
+        ("1 / x", "Cannot divide by zero"),
+        ("sqrt(-1)", "Math domain error"),
+        ("(-8) ** 0.5", "Math domain error"),
+        ("9 ** 9 ** 9", "Result is not a finite number"),
+        ("x + y", "Missing value for variable\\(s\\): y"),
+    ])
+    def test_evaluation_errors(self, expression, message):
+        """Test evaluation failures surface as ValueError"""
+        with pytest.raises(ValueError, match=message):
+            evaluate_expression(expression, {"x": 0})
@@ -0,0 +1,41 @@
+from benchmarks.loadtest import percentile, summarize, compare
+from benchmarks.bench_scaling import scaling
+
+class TestLoadTestReport:
+    
+    def test_percentile_nearest_rank(self):
+        """Test nearest-rank percentiles"""
+        values = [float(v) for v in range(1, 101)]
+        assert percentile(values, 50) == 50
+        assert percentile(values, 95) == 95
+        assert percentile(values, 99) == 99
+        assert percentile([7.0], 99) == 7
+    
+    def test_summarize(self):
+        """Test latency summary in milliseconds"""
+        summary = summarize([0.001, 0.002, 0.003, 0.004], errors=1, elapsed=2.0)
+        assert summary["requests"] == 4
+        assert summary["errors"] == 1
+        assert summary["rps"] == 2.0
+        assert summary["p50_ms"] == 2.0
+    
+    def test_compare_flags_regressions(self):
+        """Test slower throughput or latency beyond tolerance is reported"""
+        baseline = {"results": {
+            "list": {"rps": 100.0, "p95_ms": 10.0, "errors": 0},
+            "history": {"rps": 100.0, "p95_ms": 10.0, "errors": 0},
+        }}
+        results = {"results": {
+            "list": {"rps": 95.0, "p95_ms": 10.5, "errors": 0},
+            "history": {"rps": 70.0, "p95_ms": 20.0, "errors": 0},
+        }}
+        regressions = compare(results, baseline, tolerance=0.1)
+        assert len(regressions) == 2
+        assert all(line.startswith("history") for line in regressions)
+    
+    def test_scaling_relative_to_fewest_workers(self):
+        """Test speedup and efficiency are measured against the smallest worker count"""
+        rows = scaling({4: 360.0, 1: 100.0, 2: 200.0})
+        assert [row["workers"] for row in rows] == [1, 2, 4]
+        assert rows[1]["speedup"] == 2.0 and rows[1]["efficiency"] == 1.0
+        assert rows[2]["speedup"] == 3.6 and rows[2]["efficiency"] == 0.9
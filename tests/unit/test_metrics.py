@@ -0,0 +1,60 @@
+import sys
+from app.metrics import Histogram, MetricsRegistry, _fold
+
+class TestHistogram:
+    
+    def test_buckets_are_cumulative(self):
+        """Test observations land in the first bucket that holds them"""
+        histogram = Histogram(buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 5.0):
+            histogram.observe(value)
+        assert list(histogram.cumulative()) == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+        assert histogram.count == 4
+        assert histogram.sum == 5.65
+
+class TestMetricsRegistry:
+    
+    def test_render_prometheus_text(self):
+        """Test histograms and counters render in the exposition format"""
+        registry = MetricsRegistry()
+        registry.describe("request_seconds", "Request time.")
+        registry.observe("request_seconds", (("route", "/a"),), 0.002)
+        registry.inc("slow_total")
+        registry.inc("slow_total")
+        text = registry.render()
+        assert "# HELP request_seconds Request time." in text
+        assert "# TYPE request_seconds histogram" in text
+        assert 'request_seconds_bucket{route="/a",le="0.0025"} 1' in text
+        assert 'request_seconds_bucket{route="/a",le="+Inf"} 1' in text
+        assert 'request_seconds_count{route="/a"} 1' in text
+        assert "# TYPE slow_total counter" in text
+        assert "slow_total 2" in text
+    
+    def test_label_values_are_escaped(self):
+        """Test quotes and backslashes in label values are escaped"""
+        registry = MetricsRegistry()
+        registry.inc("errors_total", (("detail", 'say "hi"\\'),))
+        assert 'errors_total{detail="say \\"hi\\"\\\\"} 1' in registry.render()
+    
+    def test_collectors_render_current_values(self):
+        """Test collector samples are read each time metrics are rendered"""
+        registry = MetricsRegistry()
+        entries = [3]
+        registry.describe("cache_entries", "Cached results.")
+        registry.register_collector(lambda: [("cache_entries", "gauge", (), entries[0])])
+        assert "# TYPE cache_entries gauge" in registry.render()
+        assert "cache_entries 3" in registry.render()
+        entries[0] = 5
+        assert "cache_entries 5" in registry.render()
+
+class TestFoldedStacks:
+    
+    def test_fold_outermost_first(self):
+        """Test stacks fold root-first with ';' between frames"""
+        def inner():
+            return _fold(sys._getframe())
+        def outer():
+            return inner()
+        frames = outer().split(";")
+        assert frames[-1].startswith("inner (test_metrics.py:")
+        assert frames[-2].startswith("outer (test_metrics.py:")
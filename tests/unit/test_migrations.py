@@ -0,0 +1,134 @@
+import io
+import threading
+from contextlib import redirect_stdout
+from datetime import datetime
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+from app import migrate
+from app.database import Base
+from app.models import Calculation, UserStats
+from app.services import CalculationService, UserStatsService
+
+# Schema of the first release, as create_all made it
+LEGACY_SCHEMA = [
+    """CREATE TABLE users (
+        id INTEGER NOT NULL, username VARCHAR NOT NULL, email VARCHAR NOT NULL,
+        hashed_password VARCHAR NOT NULL, created_at DATETIME, PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX ix_users_id ON users (id)",
+    "CREATE UNIQUE INDEX ix_users_username ON users (username)",
+    "CREATE UNIQUE INDEX ix_users_email ON users (email)",
+    """CREATE TABLE calculations (
+        id INTEGER NOT NULL, user_id INTEGER NOT NULL, operation VARCHAR NOT NULL,
+        operand1 FLOAT NOT NULL, operand2 FLOAT NOT NULL, result FLOAT NOT NULL,
+        created_at DATETIME, PRIMARY KEY (id), FOREIGN KEY(user_id) REFERENCES users (id)
+    )""",
+    "CREATE INDEX ix_calculations_id ON calculations (id)",
+]
+
+def schema_diff(engine):
+    with engine.connect() as connection:
+        return compare_metadata(MigrationContext.configure(connection), Base.metadata)
+
+class TestMigrations:
+    
+    def test_head_revision_matches_scripts(self):
+        """Test HEAD_REVISION names the newest revision script"""
+        script = ScriptDirectory.from_config(migrate.alembic_config())
+        assert script.get_heads() == [migrate.HEAD_REVISION]
+    
+    def test_new_database_matches_models(self, tmp_path):
+        """Test upgrading an empty database produces exactly the models' schema"""
+        engine = create_engine(f"sqlite:///{tmp_path}/new.db")
+        assert migrate.current_revision(engine) is None
+        migrate.upgrade(engine)
+        assert migrate.current_revision(engine) == migrate.HEAD_REVISION
+        assert schema_diff(engine) == []
+    
+    def test_legacy_database_keeps_its_data(self, tmp_path):
+        """Test a first-release database gains the new columns, tables and indexes in place"""
+        engine = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+        with engine.begin() as connection:
+            for statement in LEGACY_SCHEMA:
+                connection.execute(text(statement))
+            connection.execute(text("INSERT INTO users VALUES (1, 'alice', 'a@example.com', 'x', NULL)"))
+            connection.execute(text("INSERT INTO calculations VALUES (7, 1, 'add', 2, 3, 5, '2024-01-01 00:00:00')"))
+            connection.execute(text("INSERT INTO calculations VALUES (8, 1, 'divide', 8, 2, 4, '2024-01-02 00:00:00')"))
+        
+        migrate.upgrade(engine)
+        assert schema_diff(engine) == []
+        inspector = inspect(engine)
+        columns = {column["name"]: column for column in inspector.get_columns("calculations")}
+        assert columns["operand1"]["nullable"] and columns["operand2"]["nullable"]
+        assert "ix_calculations_user_created_id" in {index["name"] for index in inspector.get_indexes("calculations")}
+        with engine.connect() as connection:
+            rows = connection.execute(text("SELECT id, user_id, operation, result, expression FROM calculations"))
+            assert rows.all() == [(7, 1, "add", 5.0, None), (8, 1, "divide", 4.0, None)]
+        
+        # The rollup starts out counting the existing history and keeps counting from there
+        db = Session(engine)
+        try:
+            assert UserStatsService.verify(db) == []
+            CalculationService.save_calculations(db, [Calculation(
+                user_id=1, operation="add", operand1=5, operand2=6, result=11, created_at=datetime(2024, 1, 3)
+            )])
+            db.commit()
+            assert UserStatsService.verify(db) == []
+            stats = UserStatsService.get_statistics(db, 1)
+            assert stats["total_calculations"] == 3
+            assert stats["operations_count"] == {"add": 2, "divide": 1}
+            assert stats["average_result"] == 6.67
+            assert db.get(UserStats, 1).version == 1
+        finally:
+            db.close()
+    
+    def test_create_all_database_is_adopted(self, tmp_path):
+        """Test a database made by create_all is only stamped, its tables left alone"""
+        engine = create_engine(f"sqlite:///{tmp_path}/current.db")
+        Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            connection.execute(text("INSERT INTO id_allocations VALUES ('calculations', 42)"))
+        
+        migrate.upgrade(engine)
+        assert migrate.current_revision(engine) == migrate.HEAD_REVISION
+        with engine.connect() as connection:
+            assert connection.execute(text("SELECT next_id FROM id_allocations")).scalar() == 42
+    
+    def test_upgrades_take_turns(self, tmp_path):
+        """Test an upgrade waits while another process holds the migration lock"""
+        engine = create_engine(f"sqlite:///{tmp_path}/locked.db")
+        upgrader = threading.Thread(target=migrate.upgrade, args=(engine,))
+        with migrate.migration_lock(engine):
+            upgrader.start()
+            upgrader.join(0.5)
+            assert upgrader.is_alive()
+            assert migrate.current_revision(engine) is None
+        upgrader.join(10)
+        assert migrate.current_revision(engine) == migrate.HEAD_REVISION
+    
+    def test_downgrade_round_trip(self, tmp_path):
+        """Test every revision downgrades cleanly and upgrades again"""
+        engine = create_engine(f"sqlite:///{tmp_path}/round.db")
+        migrate.upgrade(engine)
+        config = migrate.alembic_config(str(engine.url))
+        config.attributes["engine"] = engine
+        command.downgrade(config, "base")
+        assert set(inspect(engine).get_table_names()) == {"alembic_version"}
+        migrate.upgrade(engine)
+        assert schema_diff(engine) == []
+    
+    def test_postgres_indexes_build_concurrently(self):
+        """Test the Postgres script builds the history index concurrently, outside a transaction"""
+        output = io.StringIO()
+        with redirect_stdout(output):
+            migrate.upgrade_sql("postgresql://localhost/calculator")
+        sql = output.getvalue()
+        index = "CREATE INDEX CONCURRENTLY ix_calculations_user_created_id"
+        assert index in sql
+        before = sql[:sql.index(index)]
+        assert before.rstrip().endswith("COMMIT;")
+
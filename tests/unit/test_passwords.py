@@ -0,0 +1,44 @@
+import pytest
+from app.passwords import PasswordHasher, PasswordHasherBusy, _hashpw, hash_rounds, needs_rehash
+from app.config import settings
+
+class TestPasswordHasher:
+    
+    def test_inline_hash_and_verify(self, monkeypatch):
+        """Test hashing without a process pool"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        hasher = PasswordHasher(workers=0, max_pending=4)
+        hashed = hasher.hash("secret123")
+        assert hash_rounds(hashed) == 4
+        assert hasher.verify("secret123", hashed)
+        assert not hasher.verify("wrong", hashed)
+    
+    def test_process_pool_hash_and_verify(self, monkeypatch):
+        """Test hashing in worker processes"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        hasher = PasswordHasher(workers=1, max_pending=4)
+        try:
+            hashed = hasher.hash("secret123")
+            assert hasher.verify("secret123", hashed)
+        finally:
+            hasher.shutdown()
+    
+    def test_rejects_when_saturated(self):
+        """Test requests beyond max_pending are rejected immediately"""
+        hasher = PasswordHasher(workers=0, max_pending=1)
+        hasher._slots.acquire()
+        with pytest.raises(PasswordHasherBusy):
+            hasher.hash("secret123")
+    
+    def test_max_pending_zero_is_unbounded(self, monkeypatch):
+        """Test max_pending=0 turns admission control off"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 4)
+        hasher = PasswordHasher(workers=0, max_pending=0)
+        futures = [hasher.submit(_hashpw, "secret123", 4) for _ in range(3)]
+        assert all(hasher.verify("secret123", future.result()) for future in futures)
+    
+    def test_needs_rehash(self, monkeypatch):
+        """Test the stored cost factor is compared with the configured one"""
+        monkeypatch.setattr(settings, "BCRYPT_ROUNDS", 5)
+        assert needs_rehash(_hashpw("secret123", 4))
+        assert not needs_rehash(_hashpw("secret123", 5))
@@ -0,0 +1,69 @@
+import pytest
+from app.ratelimit import ConcurrencyLimits, SharedBuckets, TokenBuckets, client_ip, route_class
+from app.shared_state import MemoryState
+
+class TestTokenBuckets:
+    
+    def test_burst_then_refill(self):
+        """Test a full bucket admits its burst, then one request per interval"""
+        buckets = TokenBuckets(rate=2, burst=3)
+        assert [buckets.take("a", now=10.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert buckets.take("a", now=10.0) == pytest.approx(0.5)
+        assert buckets.take("b", now=10.0) == 0.0
+        assert buckets.take("a", now=10.5) == 0.0
+        assert buckets.take("a", now=10.5) > 0
+    
+    def test_rejections_cost_nothing(self):
+        """Test rejected requests don't push the retry time further out"""
+        buckets = TokenBuckets(rate=1, burst=1)
+        buckets.take("a", now=0.0)
+        assert buckets.take("a", now=0.5) == pytest.approx(0.5)
+        assert buckets.take("a", now=0.5) == pytest.approx(0.5)
+        assert buckets.take("a", now=1.0) == 0.0
+    
+    def test_table_is_bounded(self):
+        """Test the least recently used keys are dropped beyond max_keys"""
+        buckets = TokenBuckets(rate=1, burst=1, max_keys=2)
+        for key in "abc":
+            buckets.take(key, now=0.0)
+        assert len(buckets) == 2
+        # "a" was evicted, so it starts with a full bucket again
+        assert buckets.take("a", now=0.0) == 0.0
+        assert buckets.take("c", now=0.0) > 0
+
+class TestSharedBuckets:
+    
+    def test_fixed_window(self):
+        """Test shared counters admit a burst per window and report the window's end"""
+        buckets = SharedBuckets(MemoryState(), "ip", rate=2, burst=4)
+        assert [buckets.take("a", now=100.5) for _ in range(4)] == [0.0] * 4
+        assert buckets.take("a", now=101.0) == pytest.approx(1.0)
+        assert buckets.take("a", now=102.0) == 0.0
+
+class TestAdmission:
+    
+    def test_route_classes(self):
+        """Test bcrypt routes, writes, reads and streams are told apart"""
+        assert route_class("POST", "/auth/login") == "auth"
+        assert route_class("POST", "/calculations/batch") == "write"
+        assert route_class("DELETE", "/history/") == "write"
+        assert route_class("GET", "/history/statistics") == "read"
+        assert route_class("GET", "/history/stream") == "stream"
+        assert route_class("GET", "/health") is None
+        assert route_class("GET", "/static/js/main.js") is None
+    
+    def test_client_ip(self):
+        """Test X-Forwarded-For is only used when the proxy is trusted"""
+        scope = {"client": ("10.0.0.1", 1234), "headers": [(b"x-forwarded-for", b"1.2.3.4, 5.6.7.8")]}
+        assert client_ip(scope) == "10.0.0.1"
+        assert client_ip(scope, trust_proxy=True) == "5.6.7.8"
+    
+    def test_concurrency_limits(self):
+        """Test a class admits up to its limit and 0 means unlimited"""
+        limits = ConcurrencyLimits({"auth": 1, "read": 0})
+        assert limits.try_enter("auth")
+        assert not limits.try_enter("auth")
+        limits.leave("auth")
+        assert limits.try_enter("auth")
+        assert all(limits.try_enter("read") for _ in range(100))
+        assert limits.try_enter("stream")
@@ -0,0 +1,220 @@
+import time
+import pytest
+from app.cache import ResultCache, SharedStateBackend, TTLCache
+from app.ratelimit import SharedBuckets
+from app.shared_state import MemoryState, RedisState, create_state
+
+class FakeRedis:
+    """The redis-py calls RedisState makes, in memory; ``down`` makes every command fail"""
+    
+    def __init__(self):
+        self.data = {}
+        self.expiry_ms = {}
+        self.handlers = {}
+        self.down = False
+        self.closed = False
+    
+    def _check(self):
+        if self.down:
+            raise ConnectionError("Connection refused")
+    
+    def get(self, key):
+        self._check()
+        value = self.data.get(key)
+        return str(value).encode("ascii") if isinstance(value, int) else value
+    
+    def set(self, key, value, px=None):
+        self._check()
+        self.data[key] = value
+        if px is not None:
+            self.expiry_ms[key] = px
+    
+    def delete(self, key):
+        self._check()
+        self.data.pop(key, None)
+        self.expiry_ms.pop(key, None)
+    
+    def incrby(self, key, amount):
+        self._check()
+        self.data[key] = int(self.data.get(key, 0)) + amount
+        return self.data[key]
+    
+    def pexpire(self, key, ms, nx=False):
+        self._check()
+        if nx and key in self.expiry_ms:
+            return False
+        self.expiry_ms[key] = ms
+        return True
+    
+    def pipeline(self):
+        return FakePipeline(self)
+    
+    def publish(self, channel, message):
+        self._check()
+        for handler in list(self.handlers.get(channel, ())):
+            handler({"type": "message", "channel": channel, "data": message})
+    
+    def pubsub(self, ignore_subscribe_messages=False):
+        return FakePubSub(self)
+    
+    def close(self):
+        self.closed = True
+
+class FakePipeline:
+    
+    def __init__(self, client):
+        self.client = client
+        self.calls = []
+    
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.calls.append((name, args, kwargs))
+    
+    def execute(self):
+        return [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.calls]
+
+class FakePubSub:
+    
+    def __init__(self, client):
+        self.client = client
+        self.threads = []
+    
+    def subscribe(self, **handlers):
+        for channel, handler in handlers.items():
+            self.client.handlers.setdefault(channel, []).append(handler)
+    
+    def unsubscribe(self, channel):
+        self.client.handlers.pop(channel, None)
+    
+    def run_in_thread(self, sleep_time, daemon):
+        thread = FakeThread()
+        self.threads.append(thread)
+        return thread
+    
+    def close(self):
+        pass
+
+class FakeThread:
+    
+    stopped = False
+    
+    def stop(self):
+        self.stopped = True
+
+class TestMemoryState:
+    
+    def test_set_get_delete(self):
+        """Test values round-trip as bytes and can be deleted"""
+        state = MemoryState()
+        assert state.get("k") is None
+        state.set("k", b"v")
+        assert state.get("k") == b"v"
+        state.delete("k")
+        assert state.get("k") is None
+    
+    def test_ttl_expires(self):
+        """Test keys disappear once their ttl passes"""
+        state = MemoryState()
+        state.set("k", b"v", ttl=0.01)
+        state.set("kept", b"v")
+        time.sleep(0.02)
+        assert state.get("k") is None
+        assert state.get("kept") == b"v"
+    
+    def test_incr_keeps_first_expiry(self):
+        """Test counters start at the amount and keep the ttl from their creation"""
+        state = MemoryState()
+        assert state.incr("n", ttl=0.05) == 1
+        assert state.incr("n", 4, ttl=10) == 5
+        assert state.get("n") == b"5"
+        time.sleep(0.06)
+        assert state.incr("n") == 1
+    
+    def test_publish_subscribe(self):
+        """Test messages reach the channel's subscribers until they unsubscribe"""
+        state = MemoryState()
+        received = []
+        unsubscribe = state.subscribe("c", received.append)
+        state.subscribe("other", lambda message: pytest.fail("wrong channel"))
+        state.publish("c", b"one")
+        unsubscribe()
+        state.publish("c", b"two")
+        assert received == [b"one"]
+
+class TestRedisState:
+    
+    @pytest.fixture
+    def client(self):
+        return FakeRedis()
+    
+    @pytest.fixture
+    def state(self, client):
+        return RedisState(client=client)
+    
+    def test_set_get_delete(self, state, client):
+        """Test values round-trip and a ttl becomes a millisecond expiry"""
+        assert state.distributed
+        state.set("k", b"v", ttl=1.5)
+        assert state.get("k") == b"v"
+        assert client.expiry_ms["k"] == 1500
+        state.set("forever", b"v")
+        assert "forever" not in client.expiry_ms
+        state.delete("k")
+        assert state.get("k") is None
+    
+    def test_incr_sets_expiry_once(self, state, client):
+        """Test counters add up and only get an expiry when created"""
+        assert state.incr("n", ttl=10) == 1
+        assert state.incr("n", 4, ttl=60) == 5
+        assert state.get("n") == b"5"
+        assert client.expiry_ms["n"] == 10000
+        assert state.incr("m") == 1
+        assert "m" not in client.expiry_ms
+    
+    def test_publish_subscribe(self, state):
+        """Test messages reach subscribers as bytes until they unsubscribe"""
+        received = []
+        unsubscribe = state.subscribe("c", received.append)
+        state.publish("c", b"one")
+        unsubscribe()
+        state.publish("c", b"two")
+        assert received == [b"one"]
+    
+    def test_close_stops_listener(self, client):
+        """Test close stops the subscriber thread and closes both connections"""
+        pubsub_client = FakeRedis()
+        state = RedisState(client=client, pubsub_client=pubsub_client)
+        state.subscribe("c", lambda message: None)
+        thread = state._thread
+        state.close()
+        assert thread.stopped
+        assert client.closed and pubsub_client.closed
+    
+    def test_failures_raise(self, state, client):
+        """Test an unreachable server surfaces as an exception, not a silent miss"""
+        client.down = True
+        with pytest.raises(ConnectionError):
+            state.get("k")
+        with pytest.raises(ConnectionError):
+            state.incr("n", ttl=1)
+        with pytest.raises(ConnectionError):
+            state.publish("c", b"m")
+    
+    def test_callers_survive_failures(self, state, client):
+        """Test the result cache recomputes and shared rate limits admit while the server is down"""
+        client.down = True
+        cache = ResultCache(TTLCache(maxsize=10, ttl=60), SharedStateBackend(state, ttl=60))
+        assert cache.get_or_compute("k", lambda: 3.0) == 3.0
+        assert cache.stats()["shared_errors"] == 2
+        assert SharedBuckets(state, "ip", rate=1, burst=1).take("client", now=0.0) == 0.0
+
+class TestCreateState:
+    
+    def test_memory_by_default(self):
+        """Test no URL or memory:// gives an in-process state"""
+        assert isinstance(create_state(None), MemoryState)
+        assert not create_state("memory://").distributed
+    
+    def test_unknown_scheme(self):
+        """Test an unsupported URL is rejected"""
+        with pytest.raises(ValueError):
+            create_state("http://localhost")
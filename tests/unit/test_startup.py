@@ -0,0 +1,68 @@
+import subprocess
+import sys
+from sqlalchemy import create_engine, event
+from app import database
+
+# Loaded on first use, never at startup
+DEFERRED_MODULES = ("jinja2", "jose", "redis", "app.routers.async_auth", "app.routers.async_history")
+
+# Importing FastAPI, SQLAlchemy and numpy alone takes ~1.3s on a slow machine;
+# the budget for everything is generous, the one for the app's own work is not
+STARTUP_BUDGET_MS = 4000
+APP_BUDGET_MS = 600
+
+STARTUP = """
+import time
+start = time.perf_counter()
+from app.main import create_app
+create_app()
+elapsed = time.perf_counter() - start
+from app import database
+print(elapsed, database._engine is None)
+"""
+
+def run_startup():
+    """Seconds to import and create the app, whether the engine is still uncreated,
+    and {module: (self us, cumulative us)} from ``python -X importtime``
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", STARTUP],
+        capture_output=True, text=True, check=True
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        parts = line.removeprefix("import time:").split("|")
+        if len(parts) == 3 and parts[0].strip().isdigit():
+            modules[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    elapsed, engine_deferred = result.stdout.split()
+    return float(elapsed), engine_deferred == "True", modules
+
+class TestStartup:
+    
+    def test_startup_within_budget(self):
+        """Test app creation defers optional modules and stays within its time budget"""
+        elapsed, engine_deferred, modules = run_startup()
+        assert not [name for name in DEFERRED_MODULES if name in modules]
+        assert engine_deferred
+        
+        assert elapsed * 1000 < STARTUP_BUDGET_MS
+        # The app's own modules, plus create_app() (everything after the imports)
+        own_us = sum(self_us for name, (self_us, _) in modules.items() if name.split(".")[0] == "app")
+        create_ms = elapsed * 1000 - modules["app.main"][1] / 1000
+        assert own_us / 1000 + max(create_ms, 0) < APP_BUDGET_MS
+
+class TestInitDb:
+    
+    def test_skips_migrations_when_at_head(self, tmp_path, monkeypatch):
+        """Test init_db migrates a new database, then only checks its revision"""
+        engine = create_engine(f"sqlite:///{tmp_path}/init.db")
+        monkeypatch.setattr(database, "_engine", engine)
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        
+        database.init_db()
+        assert any(statement.lstrip().startswith("CREATE TABLE") for statement in statements)
+        statements.clear()
+        database.init_db()
+        assert len(statements) == 1
+        assert "alembic_version" in statements[0]
@@ -0,0 +1,72 @@
+import base64
+import time
+from datetime import datetime, timedelta
+import orjson
+import pytest
+from app.tokens import HMACBackend, InvalidToken, JoseBackend, create_backend
+
+KEY = "unit-test-secret-key"
+
+def forge(header, claims, key=KEY):
+    """A token signed by the hand-rolled codec with any header and claims"""
+    backend = HMACBackend(key, "HS256")
+    segment = lambda data: base64.urlsafe_b64encode(orjson.dumps(data)).rstrip(b"=")
+    signing_input = segment(header) + b"." + segment(claims)
+    signature = base64.urlsafe_b64encode(backend._sign(signing_input)).rstrip(b"=")
+    return (signing_input + b"." + signature).decode()
+
+class TestHMACBackend:
+    
+    @pytest.mark.parametrize("algorithm", ["HS256", "HS384", "HS512"])
+    def test_interoperates_with_jose(self, algorithm):
+        """Test tokens round-trip between the hand-rolled codec and python-jose"""
+        hmac_backend, jose_backend = HMACBackend(KEY, algorithm), JoseBackend(KEY, algorithm)
+        claims = {"sub": "alice", "uid": 7, "exp": datetime.utcnow() + timedelta(minutes=5)}
+        expected = {**claims, "exp": jose_backend.decode(jose_backend.encode(claims))["exp"]}
+        assert jose_backend.decode(hmac_backend.encode(claims)) == expected
+        assert hmac_backend.decode(jose_backend.encode(claims)) == expected
+    
+    def test_rejects_tampering(self):
+        """Test a changed payload, wrong key or extra characters fail verification"""
+        backend = HMACBackend(KEY, "HS256")
+        token = backend.encode({"sub": "alice"})
+        header, payload, signature = token.split(".")
+        other = HMACBackend(KEY, "HS256").encode({"sub": "mallory"}).split(".")[1]
+        for bad in (
+            f"{header}.{other}.{signature}",
+            HMACBackend("other-key", "HS256").encode({"sub": "alice"}),
+            f"{header}.{payload}.{signature}!",
+            f"{header}.{payload}",
+            f"{token}.extra",
+            "not a token",
+            "é.é.é",
+        ):
+            with pytest.raises(InvalidToken):
+                backend.decode(bad)
+    
+    def test_rejects_other_algorithms(self):
+        """Test the header's alg must be the configured one, so "none" never passes"""
+        backend = HMACBackend(KEY, "HS256")
+        with pytest.raises(InvalidToken):
+            backend.decode(forge({"alg": "none"}, {"sub": "alice"}))
+        with pytest.raises(InvalidToken):
+            HMACBackend(KEY, "HS512").decode(backend.encode({"sub": "alice"}))
+        with pytest.raises(ValueError):
+            HMACBackend(KEY, "RS256")
+    
+    def test_time_claims(self):
+        """Test expired, not-yet-valid and non-numeric time claims are rejected"""
+        backend = HMACBackend(KEY, "HS256")
+        now = int(time.time())
+        assert backend.decode(backend.encode({"sub": "a", "exp": now + 60}))["exp"] == now + 60
+        for claims in ({"exp": now - 10}, {"nbf": now + 60}, {"exp": "soon"}, {"sub": 5}):
+            with pytest.raises(InvalidToken):
+                backend.decode(forge({"alg": "HS256", "typ": "JWT"}, claims))
+
+class TestCreateBackend:
+    
+    def test_unknown_backend(self):
+        """Test a typo in JWT_BACKEND fails at startup"""
+        with pytest.raises(ValueError):
+            create_backend("hs256", KEY, "HS256")
+        assert isinstance(create_backend("jose", KEY, "HS256"), JoseBackend)